@@ -1,15 +1,20 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate, MigrateCommand
+
+from app.database import SQLAlchemy
 
 
 # Instantiate Flask extensions
 db = SQLAlchemy()
-migrate = Migrate()
 
 # Initialize Flask Application
-def create_app(extra_config_settings={}):
+def create_app(extra_config_settings={}, profile='web'):
     """Create a Flask application.
+
+    The 'web' profile sets up everything serving requests needs. The 'cli' profile,
+    used by manage.py commands and workers, leaves out the blueprints, the content
+    negotiation and the request instrumentation, and does not import them.
+    Flask-Migrate is only imported and set up by "python manage.py db", see
+    app.commands.lazy.
     """
     # Instantiate Flask
     app = Flask(__name__)
@@ -24,11 +29,49 @@ def create_app(extra_config_settings={}):
     # Setup Flask-SQLAlchemy
     db.init_app(app)
 
-    # Setup Flask-Migrate
-    migrate.init_app(app, db)
+    # Setup reference data and response caches
+    from .cache import reference_cache, product_responses, product_generation, analytics_responses
+    reference_cache.init_app(app)
+    product_responses.init_app(app)
+    product_generation.init_app(app)
+    analytics_responses.init_app(app)
+
+    # Setup the JSON serializers
+    from .serializers import product_serializer
+    product_serializer.init_app(app)
+
+    # Setup the product read model
+    from .read_model import product_documents
+    product_documents.init_app(app)
+
+    # Setup the product change feed
+    from .changes import product_changes
+    product_changes.init_app(app)
+
+    # Setup the background jobs
+    from .jobs import jobs
+    jobs.init_app(app)
+
+    if profile == 'cli':
+        return app
+
+    # Setup the content negotiation of product responses
+    from .endpoints.encoding import response_encoder
+    response_encoder.init_app(app)
+
+    # Setup request instrumentation
+    from .instrumentation import instrumentation
+    instrumentation.init_app(app)
+    instrumentation.register_cache('reference', reference_cache)
+    instrumentation.register_cache('product_responses', product_responses)
+    instrumentation.register_cache('analytics_responses', analytics_responses)
 
     # Register blueprints
     from .endpoints import register_blueprints
     register_blueprints(app)
 
+    # Run a jobs worker thread in the web server process; manage.py commands never start one
+    if app.config.get('JOBS_WORKER_IN_PROCESS'):
+        jobs.start(app)
+
     return app
@@ -0,0 +1,321 @@
+"""ASGI serving mode.
+
+GET /products/ and GET /products/<id> are served by async handlers that read
+the database through an async driver (aiosqlite for SQLite databases); every
+other route runs the Flask app in a thread pool, long-polls of the change feed
+in a pool of their own. Run it with any ASGI server:
+
+    uvicorn --factory app.asgi:create_asgi_app --workers 4
+"""
+import asyncio
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import unquote
+
+from flask import jsonify
+from sqlalchemy.engine import make_url
+from werkzeug.urls import url_decode
+
+from app import create_app, services
+from app.cache import product_responses
+from app.database import listen_sqlite_pragmas, sqlite_pragmas
+from app.endpoints.encoding import response_encoder
+from app.endpoints.products import encode_cursor, parse_page_args, parse_product_filters, parse_sort
+from app.serializers import product_serializer
+
+PRODUCT_PATH = re.compile(r'^/products/(\d+)$')
+# Routes that hold their thread while they wait, run by the long-poll thread pool
+LONG_POLL_PATHS = ('/products/changes',)
+# Chunks of a WSGI response read ahead of the client
+WSGI_CHUNKS_BUFFERED = 8
+
+
+def create_asgi_app(extra_config_settings={}):
+	"""Create the ASGI application of a Flask application built by create_app."""
+	return AsyncProductsApp(create_app(extra_config_settings))
+
+
+def async_database_uri(config):
+	"""Returns ASGI_DATABASE_URI, or SQLALCHEMY_DATABASE_URI with the aiosqlite driver."""
+	if config.get('ASGI_DATABASE_URI'):
+		return config['ASGI_DATABASE_URI']
+	url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+	if url.get_backend_name() != 'sqlite':
+		raise ValueError('ASGI_DATABASE_URI must be set for %s databases' % url.get_backend_name())
+	if url.database in (None, '', ':memory:'):
+		raise ValueError('In-memory SQLite databases can not be shared with the async engine')
+	return str(url.set(drivername='sqlite+aiosqlite'))
+
+
+class AsyncProductsApp:
+	"""ASGI application serving the product reads without blocking the event loop.
+
+	At most ASGI_MAX_CONCURRENCY async requests run at once and ASGI_MAX_PENDING
+	more wait for their turn; requests beyond that are answered with a 503 so a
+	burst can not pile up unbounded work. Likewise long-polls beyond
+	ASGI_LONG_POLL_THREADS get a 503 instead of taking the threads of the other
+	Flask routes.
+	"""
+
+	def __init__(self, app):
+		self.app = app
+		self.database_uri = async_database_uri(app.config)
+		self.pool_size = app.config.get('ASGI_POOL_SIZE', 20)
+		self.max_concurrency = app.config.get('ASGI_MAX_CONCURRENCY', 100)
+		self.max_pending = app.config.get('ASGI_MAX_PENDING', 1000)
+		self.executor = ThreadPoolExecutor(app.config.get('ASGI_WSGI_THREADS', 16))
+		self.long_poll_threads = app.config.get('ASGI_LONG_POLL_THREADS', 4)
+		self.long_poll_executor = ThreadPoolExecutor(self.long_poll_threads)
+		self.long_polls = 0
+		self.engine = None
+		self.semaphore = None
+		self.pending = 0
+
+	async def __call__(self, scope, receive, send):
+		if scope['type'] == 'lifespan':
+			return await self.lifespan(receive, send)
+		if scope['type'] != 'http':
+			raise ValueError('Unsupported scope type %s' % scope['type'])
+
+		handler, arguments = self.route(scope)
+		if handler is None and scope['path'] in LONG_POLL_PATHS:
+			if self.long_polls >= self.long_poll_threads:
+				return await self.send_response(send, self.error_response({'error': 'Server is busy'}, 503))
+			self.long_polls += 1
+			try:
+				return await self.call_wsgi(scope, receive, send, self.long_poll_executor)
+			finally:
+				self.long_polls -= 1
+		if handler is None:
+			return await self.call_wsgi(scope, receive, send)
+
+		if self.pending >= self.max_concurrency + self.max_pending:
+			return await self.send_response(send, self.error_response({'error': 'Server is busy'}, 503))
+		self.pending += 1
+		try:
+			async with self.get_semaphore():
+				response = await handler(scope, *arguments)
+			response = response_encoder.encode(response, self.header_environ(scope))
+		finally:
+			self.pending -= 1
+		await self.send_response(send, response, scope['method'])
+
+	def route(self, scope):
+		if scope['method'] not in ('GET', 'HEAD'):
+			return None, ()
+		path = scope['path']
+		if path == '/products/':
+			args = url_decode(scope.get('query_string', b''))
+			# Batches by ids, field projections and normalized pages are served by the Flask app
+			if 'ids' in args or 'fields' in args or 'shape' in args:
+				return None, ()
+			return self.get_products, ()
+		match = PRODUCT_PATH.match(path)
+		if match is not None:
+			return self.get_product, (int(match.group(1)),)
+		return None, ()
+
+	async def lifespan(self, receive, send):
+		while True:
+			message = await receive()
+			if message['type'] == 'lifespan.startup':
+				self.get_engine()
+				await send({'type': 'lifespan.startup.complete'})
+			elif message['type'] == 'lifespan.shutdown':
+				await self.close()
+				await send({'type': 'lifespan.shutdown.complete'})
+				return
+
+	async def close(self):
+		"""Closes the connections of the async engine, which belong to the running event loop."""
+		if self.engine is not None:
+			await self.engine.dispose()
+			self.engine = None
+		self.semaphore = None
+
+	def get_engine(self):
+		if self.engine is None:
+			try:
+				from sqlalchemy.ext.asyncio import create_async_engine
+				from sqlalchemy.pool import AsyncAdaptedQueuePool
+			except ImportError:
+				raise RuntimeError('The ASGI serving mode requires SQLAlchemy 1.4 or later')
+			self.engine = create_async_engine(
+				self.database_uri, poolclass=AsyncAdaptedQueuePool, pool_size=self.pool_size, max_overflow=0
+			)
+			if self.engine.dialect.name == 'sqlite':
+				# The async handlers only read
+				listen_sqlite_pragmas(self.engine.sync_engine, sqlite_pragmas(self.app.config, read_only=True))
+		return self.engine
+
+	def get_semaphore(self):
+		# Created on first use so it belongs to the event loop of the server
+		if self.semaphore is None:
+			self.semaphore = asyncio.Semaphore(self.max_concurrency)
+		return self.semaphore
+
+	async def get_products(self, scope):
+		args = url_decode(scope.get('query_string', b''))
+		with self.app.app_context():
+			try:
+				sort = parse_sort(args)
+				after, limit = parse_page_args(args, sort)
+				filters = parse_product_filters(args)
+			except ValueError as error:
+				return self.error_response(error.args[0], 400)
+
+		async with self.get_engine().connect() as connection:
+			result = await connection.execute(services.product.documents_statement(after, limit, filters, sort))
+			rows, next_after = services.product.page(result.all(), limit, sort)
+
+		with self.app.app_context():
+			return product_serializer.documents_response(
+				[row.document for row in rows], next=encode_cursor(next_after)
+			)
+
+	async def get_product(self, scope, id):
+		entry = product_responses.get(id)
+		if entry is not None and not product_responses.shared:
+			async with self.get_engine().connect() as connection:
+				version = (await connection.execute(services.product.version_statement(id))).scalar()
+			entry = product_responses.validate(id, entry, version)
+		if entry is None:
+			async with self.get_engine().connect() as connection:
+				document = (await connection.execute(services.product.document_statement(id))).first()
+			if document is None:
+				return self.error_response({'error': 'Product not found', 'field': 'id'}, 404)
+			entry = product_responses.set(id, document.document + '\n', document.version)
+
+		response = self.app.response_class(entry['body'], mimetype='application/json')
+		response.set_etag(entry['etag'])
+		response.last_modified = entry['last_modified']
+		return response.make_conditional(self.header_environ(scope))
+
+	def error_response(self, body, status):
+		with self.app.app_context():
+			response = jsonify(body)
+		response.status_code = status
+		return response
+
+	def header_environ(self, scope):
+		"""Returns a WSGI environ of the conditional request and content negotiation headers of scope."""
+		environ = {'REQUEST_METHOD': scope['method']}
+		for name, value in scope['headers']:
+			if name in (b'if-none-match', b'if-modified-since', b'accept', b'accept-encoding'):
+				environ['HTTP_' + name.decode('latin-1').upper().replace('-', '_')] = value.decode('latin-1')
+		return environ
+
+	async def send_response(self, send, response, method='GET'):
+		headers = response.headers
+		if response.status_code == 304:
+			# Not Modified responses carry the validators but no body
+			headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+		await send({
+			'type': 'http.response.start',
+			'status': response.status_code,
+			'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+		})
+		empty = method == 'HEAD' or response.status_code == 304
+		await send({'type': 'http.response.body', 'body': b'' if empty else response.get_data()})
+
+	async def call_wsgi(self, scope, receive, send, executor=None):
+		"""Runs the Flask app for the request in the thread pool, sending its response chunks as they come."""
+		body = BytesIO()
+		while True:
+			message = await receive()
+			body.write(message.get('body', b''))
+			if not message.get('more_body'):
+				break
+		body.seek(0)
+
+		environ = self.wsgi_environ(scope, body)
+		loop = asyncio.get_running_loop()
+		chunks = asyncio.Queue(WSGI_CHUNKS_BUFFERED)
+		closed = False
+		status_headers = []
+
+		def start_response(status, headers, exc_info=None):
+			status_headers[:] = [int(status.split(' ', 1)[0]), headers]
+
+		def put(chunk):
+			# Waits for the client to take earlier chunks; returns False once the response is abandoned
+			if not closed:
+				asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+			return not closed
+
+		def run():
+			# The response is iterated in the thread that called the app, where
+			# streamed responses keep their request context and session
+			try:
+				iterable = self.app(environ, start_response)
+				try:
+					for chunk in iterable:
+						if chunk and not put(chunk):
+							break
+				finally:
+					if hasattr(iterable, 'close'):
+						iterable.close()
+			finally:
+				put(None)
+
+		async def start():
+			status, headers = status_headers
+			await send({
+				'type': 'http.response.start',
+				'status': status,
+				'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+			})
+
+		future = loop.run_in_executor(executor or self.executor, run)
+		started = False
+		try:
+			while True:
+				chunk = await chunks.get()
+				if chunk is None:
+					break
+				if not started:
+					await start()
+					started = True
+				await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+			# Raises the error of the app, if any
+			await future
+			if not started:
+				await start()
+			await send({'type': 'http.response.body', 'body': b''})
+		finally:
+			closed = True
+			while not chunks.empty():
+				chunks.get_nowait()
+
+	def wsgi_environ(self, scope, body):
+		server = scope.get('server') or ('localhost', 80)
+		environ = {
+			'REQUEST_METHOD': scope['method'],
+			'SCRIPT_NAME': scope.get('root_path', ''),
+			'PATH_INFO': unquote(scope['path']),
+			'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+			'SERVER_NAME': server[0],
+			'SERVER_PORT': str(server[1]),
+			'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+			'wsgi.version': (1, 0),
+			'wsgi.url_scheme': scope.get('scheme', 'http'),
+			'wsgi.input': body,
+			'wsgi.errors': sys.stderr,
+			'wsgi.multithread': True,
+			'wsgi.multiprocess': True,
+			'wsgi.run_once': False
+		}
+		if scope.get('client'):
+			environ['REMOTE_ADDR'] = scope['client'][0]
+		for name, value in scope['headers']:
+			key = name.decode('latin-1').upper().replace('-', '_')
+			value = value.decode('latin-1')
+			if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+				key = 'HTTP_' + key
+			if key in environ:
+				environ[key] += ',' + value
+			else:
+				environ[key] = value
+		return environ
@@ -0,0 +1,299 @@
+import calendar
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from importlib import import_module
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.session import make_transient_to_detached
+
+from app import db
+from app.database import read_primary
+
+
+class CacheBackend:
+	"""Storage used by the caches. Keys are strings, values are JSON-compatible.
+
+	Implement it on top of a shared store to share a cache between worker processes.
+	"""
+
+	def get(self, key):
+		"""Returns the value stored under key or None."""
+		raise NotImplementedError
+
+	def set(self, key, value):
+		raise NotImplementedError
+
+	def delete(self, key):
+		raise NotImplementedError
+
+	def clear(self):
+		raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+	"""Thread-safe in-process LRU storage, entries expire ttl seconds after they are set."""
+
+	def __init__(self, max_size=1024, ttl=None):
+		self.max_size = max_size
+		self.ttl = ttl
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is None:
+				return None
+			expires_at, value = entry
+			if expires_at is not None and expires_at < time.monotonic():
+				del self._entries[key]
+				return None
+			self._entries.move_to_end(key)
+			return value
+
+	def set(self, key, value):
+		expires_at = time.monotonic() + self.ttl if self.ttl else None
+		with self._lock:
+			self._entries[key] = (expires_at, value)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.max_size:
+				self._entries.popitem(last=False)
+
+	def delete(self, key):
+		with self._lock:
+			self._entries.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._entries.clear()
+
+	def __len__(self):
+		return len(self._entries)
+
+
+def create_backend(app, prefix):
+	"""Creates the backend configured by the <prefix>_BACKEND, <prefix>_SIZE and <prefix>_TTL settings.
+
+	<prefix>_BACKEND is the dotted path of a callable taking the app and returning
+	a CacheBackend; when it is not set an in-process MemoryBackend is used.
+	"""
+	factory_path = app.config.get(prefix + '_BACKEND')
+	if factory_path is None:
+		return MemoryBackend(app.config.get(prefix + '_SIZE', 1024), app.config.get(prefix + '_TTL'))
+	module_name, factory_name = factory_path.rsplit('.', 1)
+	return getattr(import_module(module_name), factory_name)(app)
+
+
+class ReferenceCache:
+	"""Read-through cache of the serialized rows of small reference tables, keyed by id.
+
+	Entries of registered models are dropped whenever the ORM flushes, commits or
+	rolls back a change to one of their rows. Misses are loaded from the primary,
+	so a lagging replica never fills the cache with rows changed since.
+	"""
+
+	def __init__(self):
+		self.backend = MemoryBackend()
+		self.models = ()
+		self.dependents = []
+		self.hits = 0
+		self.misses = 0
+		event.listen(Session, 'after_flush', self._after_flush)
+		event.listen(Session, 'after_commit', self._after_transaction)
+		event.listen(Session, 'after_soft_rollback', self._after_soft_rollback)
+
+	def init_app(self, app):
+		self.backend = create_backend(app, 'REFERENCE_CACHE')
+
+	def register(self, *models):
+		self.models = self.models + models
+
+	def get(self, model, id):
+		"""Returns the serialized row of model with the given id or None."""
+		return self.get_many(model, [id]).get(id)
+
+	def get_many(self, model, ids, session=None):
+		"""Returns {id: serialized row} for the ids that exist, loading misses with one query of session."""
+		found, missing = {}, []
+		for id in set(ids):
+			value = self.backend.get(self._key(model, id))
+			if value is None:
+				missing.append(id)
+			else:
+				found[id] = value
+		self.hits += len(found)
+		self.misses += len(missing)
+
+		if missing:
+			with read_primary(session or db.session) as session:
+				for row in session.query(model).filter(model.id.in_(missing)):
+					found[row.id] = row.serialized
+					self.backend.set(self._key(model, row.id), row.serialized)
+		return found
+
+	def instances(self, model, ids):
+		"""Returns instances of model attached to the current session without loading them."""
+		instances = []
+		for id, values in self.get_many(model, ids).items():
+			instance = model(**values)
+			make_transient_to_detached(instance)
+			instances.append(db.session.merge(instance, load=False))
+		return instances
+
+	def invalidate(self, model, id):
+		self.backend.delete(self._key(model, id))
+		self._clear_dependents()
+
+	def clear(self):
+		self.backend.clear()
+		self._clear_dependents()
+
+	def _clear_dependents(self):
+		for dependent in self.dependents:
+			dependent.clear()
+
+	def _key(self, model, id):
+		return '%s:%s' % (model.__tablename__, id)
+
+	def _after_flush(self, session, flush_context):
+		keys = session.info.setdefault('reference_cache_keys', set())
+		for instance in session.new | session.dirty | session.deleted:
+			if isinstance(instance, self.models):
+				keys.add(self._key(type(instance), instance.id))
+		for key in keys:
+			self.backend.delete(key)
+		if keys:
+			self._clear_dependents()
+
+	def _after_transaction(self, session):
+		# Drop the keys again so readers that cached the old row while the
+		# transaction was still open do not keep it.
+		keys = session.info.pop('reference_cache_keys', ())
+		for key in keys:
+			self.backend.delete(key)
+		if keys:
+			self._clear_dependents()
+
+	def _after_soft_rollback(self, session, previous_transaction):
+		self._after_transaction(session)
+
+
+def etag(body):
+	"""Returns the strong ETag of a response body."""
+	return hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+	"""Cache of rendered JSON documents with their validators, keyed by id.
+
+	An entry holds the body, its strong ETag, the Last-Modified timestamp and the
+	row version it was rendered from. Writers invalidate entries explicitly, which
+	only reaches other processes through a shared RESPONSE_CACHE_BACKEND; with the
+	in-process backend, readers check hits against the current row version with
+	validate, since job workers and the catalog import write from other processes.
+	A hit then costs one primary-key query instead of none.
+	"""
+
+	def __init__(self, prefix):
+		self.prefix = prefix
+		self.backend = MemoryBackend()
+		self.shared = False
+		self.hits = 0
+		self.misses = 0
+
+	def init_app(self, app):
+		self.backend = create_backend(app, 'RESPONSE_CACHE')
+		self.shared = app.config.get('RESPONSE_CACHE_BACKEND') is not None
+
+	def get(self, id):
+		entry = self.backend.get(self._key(id))
+		if entry is None:
+			self.misses += 1
+		else:
+			self.hits += 1
+		return entry
+
+	def set(self, id, body, version):
+		"""Stores body rendered from the row version (a datetime) and returns the entry."""
+		entry = {
+			'body': body,
+			'etag': etag(body),
+			'last_modified': calendar.timegm(version.utctimetuple()),
+			'version': version.isoformat()
+		}
+		self.backend.set(self._key(id), entry)
+		return entry
+
+	def validate(self, id, entry, version):
+		"""Returns entry if it was rendered from version, the current row version or None once the row is deleted.
+
+		A stale entry is dropped and counted as a miss instead of a hit.
+		"""
+		if entry is None or version is not None and entry['version'] == version.isoformat():
+			return entry
+		self.backend.delete(self._key(id))
+		self.hits -= 1
+		self.misses += 1
+		return None
+
+	def invalidate(self, id):
+		self.backend.delete(self._key(id))
+
+	def clear(self):
+		self.backend.clear()
+
+	def _key(self, id):
+		return '%s:%s' % (self.prefix, id)
+
+
+class Generation:
+	"""Counter identifying the current state of a table, for caches of values computed from all its rows.
+
+	Writers bump it after committing; such caches key their entries by the current
+	value, so a bump makes every entry computed before it unreachable. A counter
+	missing from the backend restarts from the current time in milliseconds so it
+	does not go back to a value that keys older entries.
+	"""
+
+	def __init__(self, name):
+		self.name = name
+		self.backend = MemoryBackend()
+		self._lock = threading.Lock()
+
+	def init_app(self, app):
+		self.backend = create_backend(app, 'GENERATION')
+
+	def current(self):
+		value = self.backend.get(self.name)
+		if value is None:
+			value = self._start()
+		return value
+
+	def bump(self):
+		with self._lock:
+			value = (self.backend.get(self.name) or self._start()) + 1
+			self.backend.set(self.name, value)
+		return value
+
+	def clear(self):
+		"""Bumps the counter, so it can be a dependent of the reference cache."""
+		self.bump()
+
+	def _start(self):
+		value = int(time.time() * 1000)
+		self.backend.set(self.name, value)
+		return value
+
+
+reference_cache = ReferenceCache()
+product_responses = ResponseCache('product_responses')
+# Product documents embed brands and categories
+reference_cache.dependents.append(product_responses)
+# Bumped by the writes of ProductService and the catalog import
+product_generation = Generation('products')
+# Keyed by product_generation; analytics include brand and category names
+analytics_responses = ResponseCache('analytics_responses')
+reference_cache.dependents.append(product_generation)
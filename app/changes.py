@@ -0,0 +1,107 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.models.products import ProductChange
+
+product_changes_table = ProductChange.__table__
+
+
+class ProductChanges:
+	"""Change feed of products, backed by the product_changes outbox table.
+
+	Writers append the ids of the products they create, update or delete in the
+	transaction of the write, so the feed holds exactly the committed mutations.
+	Sequence numbers are assigned when changes are inserted, not when they commit:
+	SQLite has a single writer, so there they follow commit order, but with
+	concurrent writers a lower one can commit after a higher one. Readers therefore
+	stop before a gap in the sequence numbers until it is gap_timeout seconds old,
+	after which it is taken for a rolled back transaction. Readers long-poll the
+	feed with wait: commits of this process wake them up at once, commits of other
+	processes are seen within poll_interval seconds. The table only shrinks when
+	changes are pruned, see prune.
+	"""
+
+	def __init__(self, poll_interval=0.5, gap_timeout=10):
+		self.poll_interval = poll_interval
+		self.gap_timeout = gap_timeout
+		self._condition = threading.Condition()
+		event.listen(Session, 'after_commit', self._after_commit)
+		event.listen(Session, 'after_rollback', self._after_rollback)
+
+	def init_app(self, app):
+		self.poll_interval = app.config.get('CHANGES_POLL_INTERVAL', self.poll_interval)
+		self.gap_timeout = app.config.get('CHANGES_GAP_TIMEOUT', self.gap_timeout)
+
+	def append(self, session, operation, product_ids):
+		"""Adds one change per product to the transaction of session; operation is created, updated or deleted."""
+		if not product_ids:
+			return
+		now = datetime.utcnow()
+		session.execute(product_changes_table.insert(), [
+			{'product_id': id, 'operation': operation, 'created_at': now} for id in product_ids
+		])
+		session.info['product_changes_appended'] = True
+
+	def prune(self, before, session=None):
+		"""Deletes the changes appended before the datetime before and commits; returns how many were deleted.
+
+		Readers still behind the pruned changes skip them, so keep those younger
+		than the time consumers may fall behind.
+		"""
+		session = session or db.session
+		deleted = session.execute(
+			product_changes_table.delete().where(product_changes_table.c.created_at < before)
+		).rowcount
+		session.commit()
+		return deleted
+
+	def get(self, since: int, limit: int, session=None):
+		"""Returns up to limit changes with a sequence number greater than since, in order.
+
+		Changes after a gap younger than gap_timeout are left for a later call, so
+		the change of a transaction still committing is not skipped.
+		"""
+		session = session or db.session
+		changes = session.execute(
+			select(ProductChange).where(ProductChange.seq > since).order_by(ProductChange.seq).limit(limit)
+		).scalars().all()
+		settled = datetime.utcnow() - timedelta(seconds=self.gap_timeout)
+		expected = since + 1
+		for index, change in enumerate(changes):
+			if change.seq != expected and change.created_at > settled:
+				return changes[:index]
+			expected = change.seq + 1
+		return changes
+
+	def wait(self, since: int, limit: int, timeout: float, session=None):
+		"""Like get, but waits up to timeout seconds for a change when there is none yet."""
+		if not math.isfinite(timeout):
+			raise ValueError('timeout must be finite, not %r' % timeout)
+		session = session or db.session
+		deadline = time.monotonic() + timeout
+		while True:
+			changes = self.get(since, limit, session)
+			remaining = deadline - time.monotonic()
+			if changes or remaining <= 0:
+				return changes
+			# End the read transaction so the next query sees the changes committed meanwhile
+			session.rollback()
+			with self._condition:
+				self._condition.wait(min(remaining, self.poll_interval))
+
+	def _after_commit(self, session):
+		if session.info.pop('product_changes_appended', False):
+			with self._condition:
+				self._condition.notify_all()
+
+	def _after_rollback(self, session):
+		session.info.pop('product_changes_appended', None)
+
+
+product_changes = ProductChanges()
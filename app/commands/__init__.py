@@ -1 +1,8 @@
+from .import_catalog import ImportCatalogCommand
 from .init_db import InitDbCommand
+from .lazy import LazyManagerCommand, setup_migrate
+from .prune_changes import PruneChangesCommand
+from .rebuild_read_model import RebuildReadModelCommand
+from .startup_profile import StartupProfileCommand
+from .sync_replicas import SyncReplicasCommand
+from .worker import EnqueueJobCommand, WorkerCommand
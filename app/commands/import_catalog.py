@@ -0,0 +1,198 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from flask import current_app
+from flask_script import Command, Option
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.cache import product_generation
+from app.changes import product_changes
+from app.models.imports import CatalogImport
+from app.models.products import Brand, Category, Product, products_categories
+from app.read_model import product_documents
+from app.settings import FEATURED_MIN_RATING
+
+PRODUCT_FIELDS = ('name', 'rating', 'featured', 'expiration_date', 'items_in_stock', 'receipt_date')
+
+
+class ImportCatalogCommand(Command):
+    """ Import products from a CSV or NDJSON catalog file."""
+
+    option_list = (
+        Option('path', help='CSV or NDJSON file; brand and categories are given by name'),
+        Option('--format', dest='format', choices=('csv', 'ndjson'), help='defaults to the file extension'),
+        Option('--batch-size', dest='batch_size', type=int, help='rows written per transaction'),
+        Option('--checkpoint', dest='checkpoint', help='name the progress is stored under, defaults to the absolute path'),
+        Option('--restart', dest='restart', action='store_true', help='ignore the progress of a previous import'),
+    )
+
+    def run(self, path, format=None, batch_size=None, checkpoint=None, restart=False):
+        try:
+            stats = import_catalog(path, format, batch_size, checkpoint, restart, report=print)
+        except CheckpointMismatch as error:
+            print(error)
+            return 1
+        print('Imported %(imported)d products, rejected %(rejected)d rows in %(seconds).1f s.' % stats)
+
+
+class CheckpointMismatch(ValueError):
+    """ The progress stored under a checkpoint was made on another file."""
+
+
+def import_catalog(path, format=None, batch_size=None, checkpoint=None, restart=False, report=None):
+    """ Stream a catalog file into the products tables.
+
+    Rows are validated with ProductCreate once their brand and category names
+    are resolved through in-memory maps, and written with executemany, one
+    transaction per batch_size rows. The number of rows consumed is stored in
+    catalog_imports in the transaction of every batch, so an interrupted import
+    resumes after the last committed batch and never writes a batch twice; a
+    finished import keeps it, so importing the same file again is a no-op
+    unless restart is set. Progress is only resumed on the file it was made on:
+    CheckpointMismatch is raised when the path, size or modification time of
+    the file differ. Rejected rows are reported with their line and errors.
+    Returns the import statistics.
+    """
+    format = format or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 5000)
+    report = report or (lambda message: None)
+
+    stat = os.stat(path)
+    progress = {
+        'checkpoint': checkpoint or os.path.abspath(path),
+        'path': os.path.abspath(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'consumed': 0
+    }
+    previous = db.session.get(CatalogImport, progress['checkpoint'])
+    if previous is not None and not restart:
+        if (previous.path, previous.size, previous.mtime_ns) != (progress['path'], progress['size'], progress['mtime_ns']):
+            raise CheckpointMismatch(
+                'Checkpoint %s was made on another file or version of %s; use --restart to import it from the start'
+                % (progress['checkpoint'], previous.path)
+            )
+        progress['consumed'] = previous.consumed
+        report('Resuming after row %d' % previous.consumed)
+    consumed = progress['consumed']
+
+    brands = {name: id for id, name in db.session.execute(select(Brand.id, Brand.name))}
+    categories = {name: id for id, name in db.session.execute(select(Category.id, Category.name))}
+
+    stats = {'imported': 0, 'rejected': 0}
+    started = time.perf_counter()
+    with open(path, newline='', encoding='utf-8') as catalog:
+        rows = islice(read_rows(catalog, format), consumed, None)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            products, links = [], []
+            for line, row in batch:
+                try:
+                    product, category_ids = parse_row(row, brands, categories)
+                except ValueError as error:
+                    stats['rejected'] += 1
+                    report('Rejected row %d: %s' % (line, error))
+                    continue
+                products.append(product)
+                links.append(category_ids)
+
+            consumed += len(batch)
+            write_batch(products, links, dict(progress, consumed=consumed))
+            stats['imported'] += len(products)
+
+            elapsed = time.perf_counter() - started
+            report('%d rows consumed, %d imported, %d rejected, %.0f rows/s' % (
+                consumed, stats['imported'], stats['rejected'], (stats['imported'] + stats['rejected']) / elapsed
+            ))
+
+    stats['seconds'] = time.perf_counter() - started
+    return stats
+
+
+def read_rows(catalog, format):
+    """ Yield (line number, row dict) for every record of the catalog."""
+    if format == 'csv':
+        reader = csv.DictReader(catalog)
+        for row in reader:
+            row['categories'] = [name for name in (row.get('categories') or '').split('|') if name]
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(catalog, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError as error:
+                    yield line, {'error': str(error)}
+
+
+def parse_row(row, brands, categories):
+    """ Return the products row and the category ids of a catalog row, or raise ValueError."""
+    # Imported on first use, so the other commands do not import pydantic
+    from pydantic import ValidationError
+    from app.schemas.product import ProductCreate
+
+    if 'error' in row:
+        raise ValueError(row['error'])
+    brand_id = brands.get(row.get('brand'))
+    if brand_id is None:
+        raise ValueError('Unknown brand %r' % row.get('brand'))
+    unknown = [name for name in row.get('categories') or () if name not in categories]
+    if unknown:
+        raise ValueError('Unknown categories %r' % unknown)
+
+    values = {field: row.get(field) for field in PRODUCT_FIELDS}
+    if values['featured'] == '':
+        values['featured'] = None
+    values['brand_id'] = brand_id
+    values['categories'] = [categories[name] for name in dict.fromkeys(row.get('categories') or ())]
+    try:
+        product = ProductCreate.parse_obj(values)
+    except ValidationError as error:
+        raise ValueError(json.dumps(error.errors(), default=str))
+
+    # ProductCreate parses dates into naive UTC datetimes
+    product = product.dict()
+    category_ids = product.pop('categories')
+    product['featured'] = bool(product['featured']) or product['rating'] > FEATURED_MIN_RATING
+    return product, category_ids
+
+
+def write_batch(products, links, progress=None, retries=3):
+    """ Insert the products and their category links in one transaction.
+
+    Ids are assigned from the current maximum so the links can be written with
+    executemany as well; a concurrent insert taking one of them makes the batch
+    retry. progress, the values of the CatalogImport row, is saved in the same
+    transaction.
+    """
+    for attempt in range(retries):
+        try:
+            first_id = (db.session.execute(select(func.max(Product.id))).scalar() or 0) + 1
+            ids = list(range(first_id, first_id + len(products)))
+            if products:
+                db.session.execute(Product.__table__.insert(), [
+                    dict(product, id=id) for id, product in zip(ids, products)
+                ])
+                db.session.execute(products_categories.insert(), [
+                    {'product_id': id, 'category_id': category_id}
+                    for id, category_ids in zip(ids, links)
+                    for category_id in category_ids
+                ])
+                product_documents.refresh(db.session, ids)
+                product_changes.append(db.session, 'created', ids)
+            if progress is not None:
+                db.session.merge(CatalogImport(**progress))
+            db.session.commit()
+            product_generation.bump()
+            return ids
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == retries - 1:
+                raise
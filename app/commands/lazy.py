@@ -0,0 +1,39 @@
+from importlib import import_module
+
+from flask_script import Command
+
+
+class LazyManagerCommand(Command):
+    """ Stand-in for a Flask-Script sub-manager imported only when it is run.
+
+    MigrateCommand imports Flask-Migrate and Alembic, which take longer to import
+    than the rest of the app; registering it through this command keeps them out
+    of every other manage.py invocation. All arguments, --help included, are
+    handed to the sub-manager. setup, when given, is called with the app first.
+    """
+
+    capture_all_args = True
+    help_args = ()
+
+    def __init__(self, path, help=None, setup=None):
+        super().__init__()
+        self.path = path
+        self.help = help
+        self.setup = setup
+
+    def __call__(self, app=None, remaining=()):
+        module_name, name = self.path.split(':')
+        manager = getattr(import_module(module_name), name)
+        if self.setup is not None:
+            self.setup(app)
+        # Without a parent the sub-manager would add the runserver and shell commands
+        manager.app, manager.parent = app, self.parent
+        return manager.handle('%s %s' % (self.parent.parser.prog, self.parser.prog), remaining)
+
+
+def setup_migrate(app):
+    """ Setup Flask-Migrate for the db commands."""
+    from flask_migrate import Migrate
+
+    from app import db
+    Migrate(app, db)
@@ -0,0 +1,19 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from flask_script import Command, Option
+
+from app.changes import product_changes
+
+
+class PruneChangesCommand(Command):
+    """ Delete the product_changes older than the retention window."""
+
+    option_list = (
+        Option('--days', dest='days', type=float, help='changes kept, in days; defaults to CHANGES_RETENTION_DAYS'),
+    )
+
+    def run(self, days=None):
+        days = current_app.config['CHANGES_RETENTION_DAYS'] if days is None else days
+        deleted = product_changes.prune(datetime.utcnow() - timedelta(days=days))
+        print('Pruned %d product changes older than %g days.' % (deleted, days))
@@ -0,0 +1,11 @@
+from flask_script import Command
+
+from app.read_model import product_documents
+
+
+class RebuildReadModelCommand(Command):
+    """ Render the product_read_model documents of every product again."""
+
+    def run(self):
+        product_documents.rebuild()
+        print('Product read model has been rebuilt.')
@@ -0,0 +1,59 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from flask_script import Command, Option
+
+# A line of "python -X importtime": self and cumulative microseconds, then the indented module name
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$')
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StartupProfileCommand(Command):
+    """ Report the time taken to import and create the app."""
+
+    option_list = (
+        Option('--profile', dest='profile', choices=('web', 'cli'), default='cli', help='create_app profile to measure'),
+        Option('--top', dest='top', type=int, default=15, help='number of slowest packages listed'),
+        Option('--budget', dest='budget', type=float, help='exit with status 1 above this startup time, in ms'),
+    )
+
+    def run(self, profile='cli', top=15, budget=None):
+        report = startup_profile(profile)
+        print('Startup of the %(profile)s profile: %(startup_ms).1f ms, %(import_ms).1f ms importing %(modules)d modules' % report)
+        for package, milliseconds in report['packages'][:top]:
+            print('%8.1f ms  %s' % (milliseconds, package))
+        if budget is not None and report['startup_ms'] > budget:
+            print('Startup exceeds the budget of %.0f ms' % budget)
+            return 1
+
+
+def startup_profile(profile='cli'):
+    """ Measure importing the app and create_app(profile=profile) in a new interpreter.
+
+    Returns the startup time, the time spent importing and the number of modules
+    imported, and the import time of every top-level package, slowest first.
+    """
+    script = (
+        'import time; started = time.perf_counter(); from app import create_app; '
+        'create_app(profile=%r); print((time.perf_counter() - started) * 1000)' % profile
+    )
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    packages = defaultdict(int)
+    modules = 0
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match is not None:
+            packages[match.group(4).split('.')[0]] += int(match.group(1))
+            modules += 1
+    return {
+        'profile': profile,
+        'startup_ms': float(process.stdout.split()[-1]),
+        'import_ms': sum(packages.values()) / 1000,
+        'modules': modules,
+        'packages': sorted(((package, us / 1000) for package, us in packages.items()), key=lambda item: -item[1])
+    }
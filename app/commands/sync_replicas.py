@@ -0,0 +1,41 @@
+import os
+import sqlite3
+
+from flask import current_app
+from flask_script import Command
+from sqlalchemy.engine import make_url
+
+from app import db
+
+
+class SyncReplicasCommand(Command):
+    """ Copy the database to the SQLite read replicas."""
+
+    def run(self):
+        for uri in sync_replicas():
+            print('Copied the database to %s.' % uri)
+
+
+def sync_replicas():
+    """ Copy the primary SQLite database to every SQLite URI of DATABASE_REPLICA_URIS.
+
+    The copy goes through the SQLite online backup API, so replicas get a
+    consistent snapshot while the primary keeps serving writes.
+    """
+    synced = []
+    primary = db.engine.raw_connection()
+    try:
+        for uri in current_app.config.get('DATABASE_REPLICA_URIS', []):
+            sa_url = make_url(uri)
+            if sa_url.get_backend_name() != 'sqlite':
+                continue
+            # Relative paths are resolved like Flask-SQLAlchemy does
+            replica = sqlite3.connect(os.path.join(current_app.root_path, sa_url.database))
+            try:
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            synced.append(uri)
+    finally:
+        primary.close()
+    return synced
@@ -0,0 +1,34 @@
+import json
+
+from flask_script import Command, Option
+
+from app.jobs import jobs
+
+
+class WorkerCommand(Command):
+    """ Run the background jobs of the jobs table."""
+
+    option_list = (
+        Option('--until-empty', dest='until_empty', action='store_true', help='exit once no job is due'),
+    )
+
+    def run(self, until_empty=False):
+        print('Worker started, handling %s jobs.' % ', '.join(sorted(jobs.handlers)))
+        try:
+            jobs.run_worker(until_empty=until_empty)
+        except KeyboardInterrupt:
+            pass
+        print('Worker stopped.')
+
+
+class EnqueueJobCommand(Command):
+    """ Add a background job to the jobs table."""
+
+    option_list = (
+        Option('kind', help='expire_products or recompute_featured'),
+        Option('--params', dest='params', default='{}', help='JSON object passed to the job'),
+    )
+
+    def run(self, kind, params='{}'):
+        job = jobs.enqueue(kind, json.loads(params))
+        print('Job %d (%s) has been enqueued.' % (job.id, job.kind))
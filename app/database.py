@@ -0,0 +1,165 @@
+import random
+from contextlib import contextmanager
+from threading import Lock
+from weakref import WeakKeyDictionary
+
+import flask_sqlalchemy
+from flask import request
+from sqlalchemy import event, orm
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+
+def is_in_memory(sa_url):
+	return sa_url.get_backend_name() == 'sqlite' and sa_url.database in (None, '', ':memory:')
+
+
+def sqlite_pragmas(config, read_only=False):
+	"""Returns the (pragma, value) pairs set on every new SQLite connection."""
+	pragmas = [
+		('synchronous', config.get('SQLITE_SYNCHRONOUS')),
+		('mmap_size', config.get('SQLITE_MMAP_SIZE')),
+		('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT_MS'))
+	]
+	if read_only:
+		pragmas.append(('query_only', 'ON'))
+	else:
+		# The journal mode is stored in the database file, read-only connections inherit it
+		pragmas.insert(0, ('journal_mode', config.get('SQLITE_JOURNAL_MODE')))
+	return [(name, value) for name, value in pragmas if value is not None]
+
+
+def listen_sqlite_pragmas(engine, pragmas):
+	def set_pragmas(dbapi_connection, connection_record):
+		cursor = dbapi_connection.cursor()
+		for name, value in pragmas:
+			cursor.execute('PRAGMA %s = %s' % (name, value))
+		cursor.close()
+
+	event.listen(engine, 'connect', set_pragmas)
+
+
+@contextmanager
+def read_primary(session):
+	"""Routes the reads of session to the primary engine within the block.
+
+	For reads that fill caches shared by every request, or that must not miss
+	recent writes, which a lagging replica may not have yet.
+	"""
+	nested = session.info.get('primary', False)
+	session.info['primary'] = True
+	try:
+		yield session
+	finally:
+		if not nested:
+			session.info.pop('primary', None)
+
+
+class RoutingSession(flask_sqlalchemy.SignallingSession):
+	"""Session reading through the read engines while read_only is set in its info.
+
+	A session sticks to one read engine. Flushes and DML statements go to the
+	primary engine, and so do the reads that follow them, for the session to
+	read its own writes, and the reads within read_primary. Sessions joined to
+	an external connection are not routed.
+	"""
+
+	def __init__(self, db, **options):
+		self.db = db
+		super().__init__(db, **options)
+
+	def get_bind(self, mapper=None, clause=None, **kwargs):
+		if self._flushing or isinstance(clause, UpdateBase):
+			self.info['wrote'] = True
+		elif (
+			self.info.get('read_only') and not self.info.get('wrote') and not self.info.get('primary')
+			and not isinstance(self.bind, Connection)
+		):
+			engines = self.db.get_read_engines(self.app)
+			if engines:
+				if 'read_engine' not in self.info:
+					self.info['read_engine'] = random.randrange(len(engines))
+				return engines[self.info['read_engine']]
+		return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+	"""Flask-SQLAlchemy extension with tuned engines.
+
+	Engines get the DATABASE_POOL_* settings (but in-memory SQLite ones, which
+	share a single connection) and SQLite connections the SQLITE_* pragmas.
+	GET and HEAD requests read through the DATABASE_REPLICA_URIS engines, or,
+	with DATABASE_READ_ONLY_ENGINE, through a second engine opening the primary
+	SQLite file read-only, so they never wait on the lock of a writing
+	connection.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		self._read_engines = WeakKeyDictionary()
+		self._read_engines_lock = Lock()
+
+	def init_app(self, app):
+		super().init_app(app)
+		app.before_request(self._route_request)
+		app.teardown_request(self._reset_route)
+
+	def create_session(self, options):
+		return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+	def apply_driver_hacks(self, app, sa_url, options):
+		sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+		if not is_in_memory(sa_url):
+			if sa_url.get_backend_name() == 'sqlite':
+				# SQLAlchemy opens a new SQLite connection per checkout by default. Pooled
+				# connections move between threads but are used by one at a time.
+				options['poolclass'] = QueuePool
+				options.setdefault('connect_args', {})['check_same_thread'] = False
+			options['pool_size'] = app.config.get('DATABASE_POOL_SIZE', 10)
+			options['max_overflow'] = app.config.get('DATABASE_MAX_OVERFLOW', 20)
+			options['pool_recycle'] = app.config.get('DATABASE_POOL_RECYCLE', -1)
+			options['pool_pre_ping'] = app.config.get('DATABASE_POOL_PRE_PING', False)
+		if sa_url.get_backend_name() == 'sqlite':
+			options['sqlite_pragmas'] = sqlite_pragmas(app.config)
+		return sa_url, options
+
+	def create_engine(self, sa_url, engine_opts):
+		pragmas = engine_opts.pop('sqlite_pragmas', None)
+		engine = super().create_engine(sa_url, engine_opts)
+		if pragmas:
+			listen_sqlite_pragmas(engine, pragmas)
+		return engine
+
+	def get_read_engines(self, app=None):
+		"""Returns the engines reads of app are spread over; empty when they use the primary engine."""
+		app = self.get_app(app)
+		with self._read_engines_lock:
+			if app not in self._read_engines:
+				self._read_engines[app] = self._create_read_engines(app)
+			return self._read_engines[app]
+
+	def _create_read_engines(self, app):
+		if app.config.get('DATABASE_REPLICA_URIS'):
+			return [self._create_read_engine(app, uri) for uri in app.config['DATABASE_REPLICA_URIS']]
+		sa_url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+		if not app.config.get('DATABASE_READ_ONLY_ENGINE') or sa_url.get_backend_name() != 'sqlite':
+			return []
+		if is_in_memory(sa_url):
+			return []
+		return [self._create_read_engine(app, sa_url)]
+
+	def _create_read_engine(self, app, uri):
+		sa_url, options = self.apply_driver_hacks(app, make_url(uri), self.apply_pool_defaults(app, {}))
+		if sa_url.get_backend_name() == 'sqlite' and not is_in_memory(sa_url):
+			sa_url = sa_url.set(database='file:' + sa_url.database).update_query_dict({'mode': 'ro', 'uri': 'true'})
+			options['sqlite_pragmas'] = sqlite_pragmas(app.config, read_only=True)
+		options.update(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+		return self.create_engine(sa_url, options)
+
+	def _route_request(self):
+		self.session.info['read_only'] = request.method in ('GET', 'HEAD')
+
+	def _reset_route(self, exception):
+		for key in ('read_only', 'read_engine', 'wrote', 'primary'):
+			self.session.info.pop(key, None)
@@ -1,4 +1,8 @@
+from .analytics import analytics_blueprint
+from .metrics import metrics_blueprint
 from .products import products_blueprint
 
 def register_blueprints(app):
-    app.register_blueprint(products_blueprint)
\ No newline at end of file
+    app.register_blueprint(products_blueprint)
+    app.register_blueprint(metrics_blueprint)
+    app.register_blueprint(analytics_blueprint)
\ No newline at end of file
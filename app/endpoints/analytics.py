@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request
+
+from app import db, services
+from app.cache import analytics_responses, product_generation
+from app.database import read_primary
+from app.instrumentation import instrumentation
+from app.settings import ANALYTICS_EXPIRING_WITHIN_DAYS
+
+analytics_blueprint = Blueprint('analytics', __name__)
+
+
+@analytics_blueprint.route('/analytics/products', methods=['GET'])
+def get_product_analytics():
+	days = request.args.get('expiring_within_days', ANALYTICS_EXPIRING_WITHIN_DAYS)
+	try:
+		days = int(days)
+		if days < 0:
+			raise ValueError(days)
+	except ValueError:
+		return {'error': 'Incorrect value', 'field': 'expiring_within_days'}, 400
+
+	# Expiration windows start at the current hour so entries stay valid until the next one
+	now = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+	key = '%s:%s:%s' % (product_generation.current(), now.isoformat(), days)
+	entry = analytics_responses.get(key)
+	if entry is None:
+		# Computed from the primary, a lagging replica would cache the previous generation under this one
+		with read_primary(db.session):
+			analytics = services.analytics.get_product_analytics(timedelta(days=days), now)
+		with instrumentation.serialization():
+			body = jsonify(analytics).get_data(as_text=True)
+		entry = analytics_responses.set(key, body, datetime.utcnow())
+
+	response = current_app.response_class(entry['body'], mimetype='application/json')
+	response.set_etag(entry['etag'])
+	response.last_modified = entry['last_modified']
+	return response.make_conditional(request)
@@ -0,0 +1,76 @@
+import gzip
+import json
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+try:
+	import msgpack
+except ImportError:
+	msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+
+class ResponseEncoder:
+	"""Content negotiation of JSON responses.
+
+	Responses are encoded with MessagePack when the Accept header prefers
+	application/msgpack, and compressed with brotli or gzip, as the
+	Accept-Encoding header allows, when their body is min_size bytes or more.
+	Encoded responses keep their ETag as a weak one. brotli and msgpack are
+	optional; without them responses are gzip compressed JSON.
+	"""
+
+	def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4):
+		self.min_size = min_size
+		self.gzip_level = gzip_level
+		self.brotli_quality = brotli_quality
+
+	def init_app(self, app):
+		self.min_size = app.config.get('COMPRESSION_MIN_SIZE', self.min_size)
+		self.gzip_level = app.config.get('COMPRESSION_GZIP_LEVEL', self.gzip_level)
+		self.brotli_quality = app.config.get('COMPRESSION_BROTLI_QUALITY', self.brotli_quality)
+
+	def encode(self, response, environ):
+		"""Encodes response for the Accept and Accept-Encoding headers of the WSGI environ; returns it."""
+		if response.mimetype != 'application/json' or response.is_streamed or response.direct_passthrough:
+			return response
+		response.vary.update(('Accept', 'Accept-Encoding'))
+		if response.status_code != 200 or 'Content-Encoding' in response.headers:
+			return response
+
+		encoded = False
+		accept = parse_accept_header(environ.get('HTTP_ACCEPT'), MIMEAccept)
+		if msgpack is not None and accept.best_match(('application/json', MSGPACK_MIMETYPE)) == MSGPACK_MIMETYPE:
+			response.set_data(msgpack.packb(json.loads(response.get_data()), use_bin_type=True))
+			response.mimetype = MSGPACK_MIMETYPE
+			encoded = True
+
+		body = response.get_data()
+		coding = self.content_coding(environ.get('HTTP_ACCEPT_ENCODING')) if len(body) >= self.min_size else None
+		if coding == 'br':
+			response.set_data(brotli.compress(body, quality=self.brotli_quality))
+		elif coding == 'gzip':
+			response.set_data(gzip.compress(body, compresslevel=self.gzip_level))
+		if coding is not None:
+			response.headers['Content-Encoding'] = coding
+			encoded = True
+
+		etag, weak = response.get_etag()
+		if encoded and etag is not None and not weak:
+			response.set_etag(etag, weak=True)
+		return response
+
+	def content_coding(self, accept_encoding):
+		"""Returns the content coding preferred by the Accept-Encoding header among the available ones, or None."""
+		codings = ('br', 'gzip') if brotli is not None else ('gzip',)
+		return parse_accept_header(accept_encoding).best_match(codings)
+
+
+response_encoder = ResponseEncoder()
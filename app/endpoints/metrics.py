@@ -0,0 +1,10 @@
+from flask import Blueprint
+
+from app.instrumentation import instrumentation
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def get_metrics():
+	return instrumentation.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
@@ -1,62 +1,220 @@
+import binascii
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime, timedelta
 
-from flask import Blueprint, jsonify, request, abort
-from flask_pydantic import validate
-from sqlalchemy.orm.exc import NoResultFound
+from flask import Blueprint, Response, current_app, json, jsonify, request, abort, stream_with_context
+from sqlalchemy.orm.exc import NoResultFound, StaleDataError
 
-from app import services
-from app.models.products import Product
-from app.schemas.product import ProductCreate, ProductUpdate
-from app.settings import TIME_FORMAT
+from app import db, services
+from app.cache import etag, product_responses
+from app.changes import product_changes
+from app.database import read_primary
+from app.endpoints.encoding import response_encoder
+from app.endpoints.validation import validate_body
+from app.instrumentation import instrumentation
+from app.serializers import product_serializer
+from app.schemas.product import ProductCreate, ProductUpdate, ProductBulk, StockReservation, CartReservation
+from app.settings import TIME_FORMAT, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, EXPORT_CHUNK_SIZE, CHANGES_WAIT, CHANGES_MAX_WAIT
+
+# JSON types of the cursor values of the sort columns, by their python_type
+CURSOR_VALUE_TYPES = {int: int, float: (int, float), str: str, datetime: str}
 
 products_blueprint = Blueprint('products', __name__)
 
 
+@products_blueprint.after_request
+def encode_response(response):
+	return response_encoder.encode(response, request.environ)
+
+
 @products_blueprint.route('/products/', methods=['GET'])
+@products_blueprint.route('/products', methods=['GET'])
 def get_products():
-	return jsonify({
-		'results': [p.serialized for p in Product.query.all()]
-	})
+	"""Lists a page of products, or with ids the products of a comma separated list of ids.
+
+	fields, a comma separated list of product fields, limits the products to them.
+	With shape=normalized products refer to their brand and categories by id and
+	the response lists them once in its brands and categories members.
+	"""
+	try:
+		fields = parse_fields(request.args)
+		references = {} if parse_shape(request.args) == 'normalized' else None
+		if references is not None and fields is None:
+			fields = list(services.product.projection_fields)
+		if 'ids' in request.args:
+			return get_products_by_ids(parse_ids(request.args), fields, references)
+		sort = parse_sort(request.args)
+		after, limit = parse_page_args(request.args, sort)
+		filters = parse_product_filters(request.args)
+	except ValueError as error:
+		return error.args[0], 400
+	if fields is not None:
+		products, next_after = services.product.get_projected_products(fields, after, limit, filters, sort, references)
+		with instrumentation.serialization():
+			return jsonify(dict(references or {}, results=products, next=encode_cursor(next_after)))
+	documents, next_after = services.product.get_documents(after, limit, filters, sort)
+	with instrumentation.serialization():
+		return product_serializer.documents_response(documents, next=encode_cursor(next_after))
+
+
+def get_products_by_ids(ids, fields, references):
+	if fields is not None:
+		products = services.product.get_projected_by_ids(fields, ids, references)
+		with instrumentation.serialization():
+			return jsonify(dict(references or {}, results=products))
+	documents = services.product.get_documents_by_ids(ids)
+	with instrumentation.serialization():
+		return product_serializer.documents_response(documents)
+
+
+@products_blueprint.route('/products/export.ndjson', methods=['GET'])
+def export_products():
+	def generate():
+		for rows in services.product.iter_products(EXPORT_CHUNK_SIZE):
+			category_ids = services.product.get_category_ids([row.id for row in rows])
+			yield ''.join(document + '\n' for document in product_serializer.render_many(rows, category_ids))
+
+	return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@products_blueprint.route('/products/search', methods=['GET'])
+def search_products():
+	q = request.args.get('q', '').strip()
+	if not q:
+		return {'error': 'Search query must not be empty', 'field': 'q'}, 400
+	try:
+		_, limit = parse_page_args(request.args)
+	except ValueError as error:
+		return error.args[0], 400
+	rows = services.product.search_products(q, limit)
+	category_ids = services.product.get_category_ids([row.id for row in rows])
+	with instrumentation.serialization():
+		return product_serializer.list_response(rows, category_ids)
+
+
+@products_blueprint.route('/products/changes', methods=['GET'])
+def get_product_changes():
+	"""Long-polls the product change feed: returns the changes after the since sequence number,
+	waiting up to wait seconds for one. Consumers pass next as since of their next request.
+	"""
+	try:
+		since = parse_arg(request.args, 'since', int) if 'since' in request.args else 0
+		wait = parse_arg(request.args, 'wait', parse_finite_float) if 'wait' in request.args else CHANGES_WAIT
+		_, limit = parse_page_args(request.args)
+	except ValueError as error:
+		return error.args[0], 400
+	# A lagging replica would hold back changes consumers already saw elsewhere
+	with read_primary(db.session):
+		changes = product_changes.wait(since, limit, min(max(wait, 0), CHANGES_MAX_WAIT))
+	with instrumentation.serialization():
+		return jsonify({
+			'results': [change.serialized for change in changes],
+			'next': changes[-1].seq if changes else since
+		})
 
 
 @products_blueprint.route('/products/<int:id>', methods=['GET'])
 def get_product(id: int):
-	try:
-		product = services.product.get_product(id)
-	except NoResultFound as error:
-		return error.args[0], 404
-	return jsonify(product.serialized)
+	entry = product_responses.get(id)
+	# The cache is filled and checked from the primary, a lagging replica would fill it with old documents
+	with read_primary(db.session):
+		if entry is not None and not product_responses.shared:
+			entry = product_responses.validate(id, entry, services.product.get_version(id))
+		if entry is None:
+			try:
+				document = services.product.get_document(id)
+			except NoResultFound as error:
+				return error.args[0], 404
+			entry = product_responses.set(id, document.document + '\n', document.version)
+
+	response = current_app.response_class(entry['body'], mimetype='application/json')
+	response.set_etag(entry['etag'])
+	response.last_modified = entry['last_modified']
+	return response.make_conditional(request)
 
 
 @products_blueprint.route('/products', methods=['POST'])
-@validate(body=ProductCreate)
+@validate_body(ProductCreate)
 def create_product():
-	product_dict = request.get_json()
+	product = request.body_params
 	try:
-		validate_expiration_date(product_dict)
+		validate_expiration_date(product)
 	except ValueError as error:
 		return error.args[0], 400
 	try:
-		new_product = services.product.create_product(product_dict)
+		new_product = services.product.create_product(product.dict(exclude_none=True))
 	except NoResultFound as error:
 		return error.args[0], 404
-	return jsonify(new_product.serialized)
+	with instrumentation.serialization():
+		return jsonify(new_product.serialized)
+
+
+@products_blueprint.route('/products/bulk', methods=['POST'])
+@validate_body(ProductBulk)
+def bulk_products():
+	bulk = request.body_params
+	upsert_results = services.product.bulk_upsert(bulk.upsert, validate_expiration_date)
+	delete_results = services.product.bulk_delete(bulk.delete)
+	for result in upsert_results + delete_results:
+		if result['status'] in ('updated', 'deleted'):
+			product_responses.invalidate(result['id'])
+	return jsonify({
+		'upsert': upsert_results,
+		'delete': delete_results
+	})
+
+
+@products_blueprint.route('/products/<int:id>/reserve', methods=['POST'])
+@validate_body(StockReservation)
+def reserve_product(id: int):
+	result, = services.product.reserve_stock([(id, request.body_params.quantity)])
+	if result['status'] == 'error':
+		if result['field'] == 'product_id':
+			return {'error': result['error'], 'field': 'id'}, 404
+		return {'error': result['error'], 'field': result['field']}, 409
+	product_responses.invalidate(id)
+	return jsonify({'id': id, 'quantity': result['quantity'], 'status': result['status']})
+
+
+@products_blueprint.route('/products/reserve', methods=['POST'])
+@validate_body(CartReservation)
+def reserve_cart():
+	cart = request.body_params
+	results = services.product.reserve_stock(
+		[(line.product_id, line.quantity) for line in cart.lines], cart.all_or_nothing
+	)
+	for result in results:
+		if result['status'] == 'reserved':
+			product_responses.invalidate(result['product_id'])
+	# An all_or_nothing cart is either reserved entirely or not at all
+	rolled_back = cart.all_or_nothing and any(result['status'] == 'error' for result in results)
+	return jsonify({'results': results}), 409 if rolled_back else 200
 
 
 @products_blueprint.route('/products/<int:id>', methods=['PUT'])
-@validate(body=ProductUpdate)
+@validate_body(ProductUpdate)
 def update_product(id: int):
-	product_dict = request.get_json()
+	product = request.body_params
 	try:
-		validate_expiration_date(product_dict)
+		validate_expiration_date(product)
 	except ValueError as error:
 		return error.args[0], 400
 
 	try:
-		updated_product = services.product.update_product(id, product_dict)
+		updated_product = services.product.update_product(
+			id, product.dict(exclude_none=True), request.if_match if request.if_match else None
+		)
 	except NoResultFound as error:
 		return error.args[0], 404
-	return jsonify(updated_product.serialized)
+	except StaleDataError as error:
+		return error.args[0], 409
+	product_responses.invalidate(id)
+	with instrumentation.serialization():
+		response = jsonify(updated_product.serialized)
+	# The body is the new GET /products/<id> representation, its ETag is the next If-Match
+	response.set_etag(etag(response.get_data(as_text=True)))
+	return response
 
 
 @products_blueprint.route('/products/<int:id>', methods=['DELETE'])
@@ -65,12 +223,141 @@ def delete_product(id: int):
 		removed_product = services.product.delete_product(id)
 	except NoResultFound as error:
 		return error.args[0], 404
-	return jsonify(removed_product.serialized)
+	except StaleDataError as error:
+		return error.args[0], 409
+	product_responses.invalidate(id)
+	with instrumentation.serialization():
+		return jsonify(removed_product.serialized)
+
+
+def validate_expiration_date(product):
+	"""Checks the parsed expiration_date of a ProductCreate, which is a naive UTC datetime."""
+	if product.expiration_date is not None:
+		if product.expiration_date < datetime.utcnow() + timedelta(days=30):
+			raise ValueError({'error': 'Expiration date lower than 30 days since now', 'field': 'expiration_date'})
+
+
+def parse_sort(args):
+	sort = args.get('sort', 'id')
+	if sort.lstrip('-') not in services.product.sort_columns:
+		raise ValueError({'error': 'Unknown sort field', 'field': 'sort'})
+	return sort
+
+
+def parse_page_args(args, sort='id'):
+	after = args.get('after')
+	if after is not None:
+		try:
+			after = decode_cursor(after, sort)
+		except ValueError:
+			raise ValueError({'error': 'Cursor is not valid', 'field': 'after'})
+
+	limit = args.get('limit')
+	if limit is None:
+		return after, DEFAULT_PAGE_SIZE
+	try:
+		limit = int(limit)
+	except ValueError:
+		raise ValueError({'error': 'Limit must be an integer', 'field': 'limit'})
+	if limit < 1:
+		raise ValueError({'error': 'Limit must be greater than 0', 'field': 'limit'})
+	return after, min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(after):
+	"""Cursors of pages sorted by id are plain ids, other cursors are opaque strings."""
+	if after is None or isinstance(after, int):
+		return after
+	value, id = after
+	if isinstance(value, datetime):
+		value = value.isoformat()
+	return urlsafe_b64encode(json.dumps([value, id]).encode()).decode()
+
+
+def decode_cursor(cursor, sort):
+	"""Returns the after value of a cursor of pages sorted by sort; raises ValueError when it is not valid."""
+	field = sort.lstrip('-')
+	if field == 'id':
+		return int(cursor)
+	python_type = services.product.sort_columns[field].type.python_type
+	try:
+		value, id = json.loads(urlsafe_b64decode(cursor.encode()))
+		if not is_cursor_value(value, python_type) or not is_cursor_value(id, int):
+			raise ValueError(cursor)
+		if python_type is datetime:
+			value = datetime.fromisoformat(value)
+	except (TypeError, ValueError, binascii.Error):
+		raise ValueError(cursor)
+	return value, id
+
+
+def is_cursor_value(value, python_type):
+	"""Whether value is the JSON value encode_cursor gives to a column of python_type."""
+	if isinstance(value, bool):
+		return False
+	return isinstance(value, CURSOR_VALUE_TYPES[python_type])
+
+
+def parse_ids(args):
+	ids = parse_arg(args, 'ids', lambda value: [int(id) for id in value.split(',')])
+	if len(ids) > MAX_PAGE_SIZE:
+		raise ValueError({'error': 'Too many ids, at most %d' % MAX_PAGE_SIZE, 'field': 'ids'})
+	return ids
+
+
+def parse_shape(args):
+	shape = args.get('shape', 'embedded')
+	if shape not in ('embedded', 'normalized'):
+		raise ValueError({'error': 'Shape must be embedded or normalized', 'field': 'shape'})
+	return shape
+
+
+def parse_fields(args):
+	"""Returns the fields asked for, in the order of the product representation, or None for all of them."""
+	if 'fields' not in args:
+		return None
+	fields = set(args['fields'].split(','))
+	if not fields <= set(services.product.projection_fields):
+		raise ValueError({'error': 'Unknown field', 'field': 'fields'})
+	return [field for field in services.product.projection_fields if field in fields]
+
+
+def parse_product_filters(args):
+	filters = {}
+	if 'brand_id' in args:
+		filters['brand_id'] = parse_arg(args, 'brand_id', int)
+	if 'categories' in args:
+		filters['categories'] = parse_arg(args, 'categories', lambda value: [int(id) for id in value.split(',')])
+	for field in ('min_rating', 'max_rating'):
+		if field in args:
+			filters[field] = parse_arg(args, field, float)
+	for field in ('featured', 'in_stock'):
+		if field in args:
+			filters[field] = parse_arg(args, field, parse_bool)
+	for field in ('expires_after', 'expires_before'):
+		if field in args:
+			filters[field] = parse_arg(args, field, lambda value: datetime.strptime(value, TIME_FORMAT))
+	return filters
+
+
+def parse_arg(args, field, parse):
+	try:
+		return parse(args[field])
+	except ValueError:
+		raise ValueError({'error': 'Incorrect value', 'field': field})
+
+
+def parse_finite_float(value):
+	number = float(value)
+	# nan and inf would never run out as a timeout
+	if not math.isfinite(number):
+		raise ValueError(value)
+	return number
 
 
-def validate_expiration_date(product_dict):
-	if product_dict['expiration_date'] is not None:
-		expiration_date = datetime.strptime(product_dict['expiration_date'], TIME_FORMAT)
-		min_date = datetime.now() + timedelta(days=30)
-		if expiration_date < min_date:
-			raise ValueError({'error': 'Expiration date lower than 30 days since now', 'field': 'expiration_date'})
\ No newline at end of file
+def parse_bool(value):
+	if value.lower() in ('true', '1'):
+		return True
+	if value.lower() in ('false', '0'):
+		return False
+	raise ValueError(value)
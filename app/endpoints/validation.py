@@ -0,0 +1,23 @@
+from functools import wraps
+
+from flask import jsonify, make_response, request
+from pydantic import ValidationError
+
+
+def validate_body(model):
+	"""Parses the JSON body of the request with the pydantic model before calling the view.
+
+	The view reads the parsed model from request.body_params and invalid bodies get
+	the 400 response of flask_pydantic.validate. Unlike flask_pydantic.validate, the
+	view signature is not inspected on every request and only the body is validated.
+	"""
+	def decorate(view):
+		@wraps(view)
+		def wrapper(*args, **kwargs):
+			try:
+				request.body_params = model.parse_obj(request.get_json())
+			except ValidationError as error:
+				return make_response(jsonify({'validation_error': {'body_params': error.errors()}}), 400)
+			return view(*args, **kwargs)
+		return wrapper
+	return decorate
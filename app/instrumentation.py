@@ -0,0 +1,192 @@
+import heapq
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+class RequestStats:
+	"""Timings collected while one request is handled."""
+
+	def __init__(self):
+		self.started = time.perf_counter()
+		self.queries = 0
+		self.sql_time = 0.0
+		self.serialization_time = 0.0
+		# Min-heap of the slowest (duration, statement) pairs
+		self.statements = []
+
+	def add_statement(self, duration, statement, max_statements):
+		"""Records a statement, keeping only the max_statements slowest ones of the request."""
+		if len(self.statements) < max_statements:
+			heapq.heappush(self.statements, (duration, statement))
+		elif max_statements:
+			heapq.heappushpop(self.statements, (duration, statement))
+
+	@property
+	def slowest_statements(self):
+		return sorted(self.statements, reverse=True)
+
+
+class Instrumentation:
+	"""Records query count, SQL time and serialization time of every request.
+
+	Adds them to the responses as a Server-Timing header, aggregates them per
+	endpoint for the Prometheus /metrics endpoint and logs the statements of
+	requests slower than SLOW_REQUEST_THRESHOLD_MS.
+	"""
+
+	def __init__(self):
+		self.caches = {}
+		self._lock = threading.Lock()
+		self._requests = defaultdict(int)
+		self._durations = defaultdict(lambda: [0] * (len(DURATION_BUCKETS) + 1))
+		self._duration_sums = defaultdict(float)
+		self._queries = defaultdict(int)
+		self._sql_time = defaultdict(float)
+		self._serialization_time = defaultdict(float)
+		self._engine_events_registered = False
+
+	def init_app(self, app):
+		if not app.config.get('INSTRUMENTATION_ENABLED', True):
+			return
+		self.slow_request_threshold = app.config.get('SLOW_REQUEST_THRESHOLD_MS', 500) / 1000
+		self.max_statements = app.config.get('INSTRUMENTATION_MAX_STATEMENTS', 100)
+		app.before_request(self._before_request)
+		app.after_request(self._after_request)
+
+		if not self._engine_events_registered:
+			event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+			event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+			event.listen(Engine, 'handle_error', self._handle_error)
+			self._engine_events_registered = True
+
+	def register_cache(self, name, cache):
+		"""Exposes the hits and misses counters of cache in the metrics."""
+		self.caches[name] = cache
+
+	@contextmanager
+	def serialization(self):
+		"""Adds the time spent in the block to the serialization time of the request."""
+		started = time.perf_counter()
+		try:
+			yield
+		finally:
+			stats = self._stats()
+			if stats is not None:
+				stats.serialization_time += time.perf_counter() - started
+
+	def render_prometheus(self):
+		"""Returns the aggregated metrics in the Prometheus text exposition format."""
+		lines = []
+		with self._lock:
+			lines += [
+				'# HELP http_requests_total Requests handled.',
+				'# TYPE http_requests_total counter'
+			]
+			for (endpoint, method, status), count in sorted(self._requests.items()):
+				lines.append('http_requests_total{endpoint="%s",method="%s",status="%s"} %d' % (
+					endpoint, method, status, count
+				))
+
+			lines += [
+				'# HELP http_request_duration_seconds Request handling time.',
+				'# TYPE http_request_duration_seconds histogram'
+			]
+			for endpoint, buckets in sorted(self._durations.items()):
+				cumulative = 0
+				for bound, count in zip(DURATION_BUCKETS + ('+Inf',), buckets):
+					cumulative += count
+					lines.append('http_request_duration_seconds_bucket{endpoint="%s",le="%s"} %d' % (
+						endpoint, bound, cumulative
+					))
+				lines.append('http_request_duration_seconds_sum{endpoint="%s"} %f' % (
+					endpoint, self._duration_sums[endpoint]
+				))
+				lines.append('http_request_duration_seconds_count{endpoint="%s"} %d' % (endpoint, cumulative))
+
+			for name, description, values, value_format in (
+				('db_queries_total', 'SQL statements executed.', self._queries, '%d'),
+				('db_query_duration_seconds_total', 'Time spent executing SQL statements.', self._sql_time, '%f'),
+				('serialization_duration_seconds_total', 'Time spent serializing responses.',
+					self._serialization_time, '%f'),
+			):
+				lines += ['# HELP %s %s' % (name, description), '# TYPE %s counter' % name]
+				for endpoint, value in sorted(values.items()):
+					lines.append(('%s{endpoint="%s"} ' + value_format) % (name, endpoint, value))
+
+		for metric in ('hits', 'misses'):
+			lines += [
+				'# HELP cache_%s_total Cache %s.' % (metric, metric),
+				'# TYPE cache_%s_total counter' % metric
+			]
+			for name, cache in sorted(self.caches.items()):
+				lines.append('cache_%s_total{cache="%s"} %d' % (metric, name, getattr(cache, metric)))
+		return '\n'.join(lines) + '\n'
+
+	def _stats(self):
+		if not has_request_context():
+			return None
+		return g.get('request_stats')
+
+	def _before_request(self):
+		g.request_stats = RequestStats()
+
+	def _after_request(self, response):
+		stats = self._stats()
+		if stats is None:
+			return response
+		duration = time.perf_counter() - stats.started
+		endpoint = request.endpoint or 'unknown'
+
+		response.headers['Server-Timing'] = ', '.join((
+			'db;dur=%.3f;desc="%d queries"' % (stats.sql_time * 1000, stats.queries),
+			'serialize;dur=%.3f' % (stats.serialization_time * 1000),
+			'total;dur=%.3f' % (duration * 1000)
+		))
+
+		with self._lock:
+			self._requests[(endpoint, request.method, response.status_code)] += 1
+			bucket = next(
+				(i for i, bound in enumerate(DURATION_BUCKETS) if duration <= bound), len(DURATION_BUCKETS)
+			)
+			self._durations[endpoint][bucket] += 1
+			self._duration_sums[endpoint] += duration
+			self._queries[endpoint] += stats.queries
+			self._sql_time[endpoint] += stats.sql_time
+			self._serialization_time[endpoint] += stats.serialization_time
+
+		if duration > self.slow_request_threshold:
+			current_app.logger.warning(
+				'Slow request %s %s: %.1f ms, %d queries in %.1f ms, serialization %.1f ms\n%s',
+				request.method, request.full_path, duration * 1000, stats.queries, stats.sql_time * 1000,
+				stats.serialization_time * 1000,
+				'\n'.join('%8.1f ms  %s' % (d * 1000, statement) for d, statement in stats.slowest_statements)
+			)
+		return response
+
+	def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+		conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+	def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+		duration = time.perf_counter() - conn.info['query_started'].pop()
+		stats = self._stats()
+		if stats is None:
+			return
+		stats.queries += 1
+		stats.sql_time += duration
+		stats.add_statement(duration, statement, self.max_statements)
+
+	def _handle_error(self, exception_context):
+		connection = exception_context.connection
+		if connection is not None and connection.info.get('query_started'):
+			connection.info['query_started'].pop()
+
+
+instrumentation = Instrumentation()
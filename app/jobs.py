@@ -0,0 +1,200 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_, select, update
+
+from app import db
+from app.cache import product_generation, product_responses
+from app.changes import product_changes
+from app.models.jobs import Job
+from app.models.products import Product, products_categories
+from app.read_model import product_documents
+from app.settings import FEATURED_MIN_RATING
+
+
+class JobQueue:
+	"""Background jobs persisted in the jobs table and run by workers, chunk by chunk.
+
+	A handler is called with the session, the job params, the last product id
+	processed and the chunk size; it changes one chunk of products with set-based
+	statements and returns their ids in ascending order, or an empty list once
+	there is nothing left. Every chunk is committed together with the job progress,
+	so a retried job resumes after the last committed chunk. Failed jobs are
+	retried max_attempts times with an exponential delay; chunks are rate limited
+	to max_chunks_per_second so a sweep does not starve the request threads.
+	"""
+
+	def __init__(self):
+		self.handlers = {}
+		self.chunk_size = 500
+		self.max_attempts = 3
+		self.retry_delay = 10
+		self.lease = 300
+		self.max_chunks_per_second = None
+		self.poll_interval = 1
+
+	def init_app(self, app):
+		self.chunk_size = app.config.get('JOBS_CHUNK_SIZE', self.chunk_size)
+		self.max_attempts = app.config.get('JOBS_MAX_ATTEMPTS', self.max_attempts)
+		self.retry_delay = app.config.get('JOBS_RETRY_DELAY', self.retry_delay)
+		self.lease = app.config.get('JOBS_LEASE', self.lease)
+		self.max_chunks_per_second = app.config.get('JOBS_MAX_CHUNKS_PER_SECOND', self.max_chunks_per_second)
+		self.poll_interval = app.config.get('JOBS_POLL_INTERVAL', self.poll_interval)
+
+	def handler(self, kind):
+		"""Registers the decorated function as the handler of the jobs of kind."""
+		def decorate(function):
+			self.handlers[kind] = function
+			return function
+		return decorate
+
+	def enqueue(self, kind, params=None, max_attempts=None, session=None):
+		"""Adds a pending job and commits it; returns the job."""
+		if kind not in self.handlers:
+			raise ValueError({'error': 'Unknown job kind', 'field': 'kind'})
+		session = session or db.session
+		job = Job(kind=kind, params=json.dumps(params or {}), max_attempts=max_attempts or self.max_attempts)
+		session.add(job)
+		session.commit()
+		return job
+
+	def run_next(self, session=None):
+		"""Claims the next due job and runs it until it is done or fails; returns it, or None when no job is due."""
+		session = session or db.session
+		job = self._claim(session)
+		if job is not None:
+			self._run(session, job)
+		return job
+
+	def run_worker(self, stop=None, until_empty=False):
+		"""Runs due jobs until stop, a threading.Event, is set, or until no job is due with until_empty."""
+		stop = stop or threading.Event()
+		while not stop.is_set():
+			try:
+				job = self.run_next()
+			finally:
+				db.session.remove()
+			if job is None:
+				if until_empty:
+					return
+				stop.wait(self.poll_interval)
+
+	def start(self, app):
+		"""Runs a worker in a daemon thread of this process; returns the event that stops it."""
+		stop = threading.Event()
+
+		def work():
+			with app.app_context():
+				self.run_worker(stop)
+
+		threading.Thread(target=work, name='jobs-worker', daemon=True).start()
+		return stop
+
+	def _claim(self, session):
+		# Jobs are claimed with a conditional update, so concurrent workers never run the same job
+		while True:
+			now = datetime.utcnow()
+			due = or_(
+				and_(Job.status == 'pending', Job.run_after <= now),
+				and_(Job.status == 'running', Job.locked_until < now)
+			)
+			job_id = session.execute(select(Job.id).where(due).order_by(Job.run_after, Job.id).limit(1)).scalar()
+			if job_id is None:
+				session.commit()
+				return None
+			claimed = session.execute(
+				update(Job).where(Job.id == job_id, due)
+				.values(status='running', attempts=Job.attempts + 1, locked_until=now + timedelta(seconds=self.lease))
+				.execution_options(synchronize_session=False)
+			).rowcount
+			session.commit()
+			if claimed:
+				return session.get(Job, job_id, populate_existing=True)
+
+	def _run(self, session, job):
+		handler = self.handlers.get(job.kind)
+		params = json.loads(job.params)
+		interval = 1 / self.max_chunks_per_second if self.max_chunks_per_second else 0
+		next_chunk = time.monotonic()
+		try:
+			if handler is None:
+				raise LookupError('No handler for %r jobs' % job.kind)
+			while True:
+				delay = next_chunk - time.monotonic()
+				if delay > 0:
+					time.sleep(delay)
+				next_chunk = time.monotonic() + interval
+
+				ids = handler(session, params, job.after_id, self.chunk_size)
+				if not ids:
+					job.status = 'done'
+					job.finished_at = datetime.utcnow()
+					job.locked_until = None
+					session.commit()
+					return
+				job.after_id = ids[-1]
+				job.processed += len(ids)
+				job.locked_until = datetime.utcnow() + timedelta(seconds=self.lease)
+				session.commit()
+				for id in ids:
+					product_responses.invalidate(id)
+				product_generation.bump()
+		except Exception as error:
+			session.rollback()
+			current_app.logger.exception('Job %d (%s) failed on attempt %d', job.id, job.kind, job.attempts)
+			job.error = '%s: %s' % (type(error).__name__, error)
+			job.locked_until = None
+			if job.attempts >= job.max_attempts:
+				job.status = 'failed'
+				job.finished_at = datetime.utcnow()
+			else:
+				job.status = 'pending'
+				job.run_after = datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1))
+			session.commit()
+
+
+jobs = JobQueue()
+
+
+@jobs.handler('expire_products')
+def expire_products(session, params, after_id, limit):
+	"""Deletes the products that expired before params['before'], an ISO datetime in UTC, by default now."""
+	before = datetime.fromisoformat(params['before']) if params.get('before') else datetime.utcnow()
+	ids = [id for id, in session.execute(
+		select(Product.id).where(Product.id > after_id, Product.expiration_date < before)
+		.order_by(Product.id).limit(limit)
+	)]
+	if ids:
+		session.execute(products_categories.delete().where(products_categories.c.product_id.in_(ids)))
+		session.execute(Product.__table__.delete().where(Product.id.in_(ids)))
+		product_documents.refresh(session, ids)
+		product_changes.append(session, 'deleted', ids)
+	return ids
+
+
+@jobs.handler('recompute_featured')
+def recompute_featured(session, params, after_id, limit):
+	"""Features the products rated above params['min_rating'], by default FEATURED_MIN_RATING.
+
+	With params['reset'] the other products stop being featured, otherwise they
+	are left unchanged like the writes of ProductService do.
+	"""
+	min_rating = params.get('min_rating', FEATURED_MIN_RATING)
+	changed = and_(Product.featured.is_(False), Product.rating > min_rating)
+	if params.get('reset'):
+		changed = or_(changed, and_(Product.featured.is_(True), Product.rating <= min_rating))
+	ids = [id for id, in session.execute(
+		select(Product.id).where(Product.id > after_id, changed).order_by(Product.id).limit(limit)
+	)]
+	if ids:
+		session.execute(
+			update(Product).where(Product.id.in_(ids))
+			.values(featured=Product.rating > min_rating, updated_at=datetime.utcnow(), version=Product.version + 1)
+			.execution_options(synchronize_session=False)
+		)
+		product_documents.refresh(session, ids)
+		product_changes.append(session, 'updated', ids)
+	return ids
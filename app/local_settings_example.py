@@ -0,0 +1,11 @@
+# Environment specific settings, loaded after app/settings.py.
+# Copy this file to app/local_settings.py, which is not committed, and edit it.
+
+import os
+
+# Flask settings
+DEBUG = True
+
+# SQLAlchemy settings
+SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app.sqlite')
+SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -0,0 +1,17 @@
+import datetime
+
+from app import db
+
+
+class CatalogImport(db.Model):
+    """Progress of "python manage.py import_catalog", updated in the transaction of every batch."""
+    __tablename__ = 'catalog_imports'
+
+    # Absolute path of the catalog file, unless named with --checkpoint
+    checkpoint = db.Column(db.Unicode(1024), primary_key=True)
+    path = db.Column(db.Unicode(1024), nullable=False)
+    # Size and modification time of the file the rows were consumed from
+    size = db.Column(db.BigInteger, nullable=False)
+    mtime_ns = db.Column(db.BigInteger, nullable=False)
+    consumed = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
@@ -0,0 +1,45 @@
+import datetime
+
+from app import db
+
+
+class Job(db.Model):
+    """Background job run by app.jobs workers, in chunks of products."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.Unicode(50), nullable=False)
+    # JSON object passed to the job handler
+    params = db.Column(db.UnicodeText, nullable=False, default='{}')
+    # pending, running, done or failed
+    status = db.Column(db.Unicode(10), nullable=False, default='pending')
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    error = db.Column(db.UnicodeText, nullable=True)
+
+    # Last product id processed, chunks of a retried job start after it
+    after_id = db.Column(db.Integer, nullable=False, default=0)
+    processed = db.Column(db.Integer, nullable=False, default=0)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    # A running job whose worker stopped renewing the lease is claimed again
+    locked_until = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    @property
+    def serialized(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'processed': self.processed,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
@@ -1,9 +1,19 @@
+from sqlalchemy import DDL, event
+
 from app import db
+from app.cache import reference_cache
 import datetime
 
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        db.Index('ix_products_brand_id_rating', 'brand_id', 'rating'),
+        db.Index('ix_products_featured_rating', 'featured', 'rating'),
+        db.Index('ix_products_rating_id', 'rating', 'id'),
+        db.Index('ix_products_expiration_date', 'expiration_date'),
+        db.Index('ix_products_items_in_stock', 'items_in_stock'),
+    )
     id = db.Column(db.Integer, primary_key=True)
 
     name = db.Column(db.Unicode(50), nullable=False)
@@ -11,6 +21,8 @@ class Product(db.Model):
     featured = db.Column(db.Boolean, nullable=False, default=False)
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.datetime.utcnow,
+                           onupdate=datetime.datetime.utcnow)
     expiration_date = db.Column(db.DateTime, nullable=True)
 
     brand_id = db.Column(db.Integer, db.ForeignKey('brands.id'), nullable=False)
@@ -19,6 +31,12 @@ class Product(db.Model):
     items_in_stock = db.Column(db.Integer, nullable=False)
     receipt_date = db.Column(db.DateTime, nullable=True)
 
+    # Incremented by every ORM update; updates and deletes of a stale version raise StaleDataError.
+    # Core statements updating products increment it themselves.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
     @property
     def serialized(self):
         return {
@@ -28,13 +46,45 @@ class Product(db.Model):
             'featured': self.featured,
             'items_in_stock': self.items_in_stock,
             'receipt_date': self.receipt_date,
-            'brand': self.brand.serialized,
+            'brand': reference_cache.get(Brand, self.brand_id),
             'categories': [c.serialized for c in self.categories],
             'expiration_date': self.expiration_date,
             'created_at': self.created_at
         }
 
 
+class ProductReadModel(db.Model):
+    """Rendered JSON document of each product, maintained by app.read_model."""
+    __tablename__ = 'product_read_model'
+
+    product_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    document = db.Column(db.UnicodeText, nullable=False)
+    # updated_at, or created_at, of the product the document was rendered from
+    version = db.Column(db.DateTime, nullable=False)
+
+
+class ProductChange(db.Model):
+    """Outbox of product mutations, appended by app.changes in the transaction of the write."""
+    __tablename__ = 'product_changes'
+    # Sequence numbers of changes pruned by "python manage.py prune_changes" are never given out again
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    # created, updated or deleted
+    operation = db.Column(db.Unicode(10), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+    @property
+    def serialized(self):
+        return {
+            'seq': self.seq,
+            'product_id': self.product_id,
+            'operation': self.operation,
+            'created_at': self.created_at
+        }
+
+
 class Brand(db.Model):
     __tablename__ = 'brands'
 
@@ -69,5 +119,38 @@ class Category(db.Model):
 
 products_categories = db.Table('products_categories',
     db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
-    db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True),
+    db.Index('ix_products_categories_category_id_product_id', 'category_id', 'product_id')
 )
+
+
+# Brands and categories are served from the reference data cache
+reference_cache.register(Brand, Category)
+
+
+# Full-text index over product names, kept in sync by triggers (SQLite with FTS5 only)
+def fts5_available(ddl, target, bind, **kw):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return any(option == 'ENABLE_FTS5' for option, in bind.execute('PRAGMA compile_options'))
+
+
+products_fts_ddl = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts
+       USING fts5(name, content='products', content_rowid='id', prefix='2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+         INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+         INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF id, name ON products BEGIN
+         INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+         INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+       END""",
+]
+
+for statement in products_fts_ddl:
+    event.listen(Product.__table__, 'after_create', DDL(statement).execute_if(callable_=fts5_available))
+event.listen(Product.__table__, 'before_drop',
+             DDL('DROP TABLE IF EXISTS products_fts').execute_if(dialect='sqlite'))
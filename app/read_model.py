@@ -0,0 +1,110 @@
+from collections import defaultdict
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db
+from app.cache import reference_cache
+from app.models.products import Brand, Category, Product, ProductReadModel, products_categories
+from app.serializers import product_serializer
+
+read_models = ProductReadModel.__table__
+# Columns the documents are rendered from. Migrations render documents before later columns exist.
+document_columns = tuple(
+	Product.__table__.c[name] for name in dict.fromkeys(product_serializer.product.column_fields + ('brand_id', 'updated_at'))
+)
+
+
+class ProductDocuments:
+	"""Maintains product_read_model, the ready-to-serve JSON document of each product.
+
+	Documents are rendered by the product serializer, so they change with the
+	JSON_SORT_KEYS and JSON_AS_ASCII settings; rebuild them after changing those.
+	ORM changes to products, brands and categories refresh the documents they
+	affect in the same transaction. Writes that bypass the ORM unit of work
+	(bulk mappings, Core statements) call refresh themselves.
+	"""
+
+	def __init__(self, chunk_size=500):
+		self.chunk_size = chunk_size
+		event.listen(Session, 'before_flush', self._before_flush)
+		event.listen(Session, 'after_flush', self._after_flush)
+
+	def init_app(self, app):
+		self.chunk_size = app.config.get('READ_MODEL_CHUNK_SIZE', self.chunk_size)
+
+	def refresh(self, session, product_ids):
+		"""Renders the documents of product_ids again; documents of deleted products are removed."""
+		product_ids = list(set(product_ids))
+		for start in range(0, len(product_ids), self.chunk_size):
+			chunk = product_ids[start:start + self.chunk_size]
+			rows = session.execute(select(*document_columns).where(Product.id.in_(chunk))).all()
+			category_ids = defaultdict(list)
+			for product_id, category_id in session.execute(
+				select(products_categories.c.product_id, products_categories.c.category_id)
+				.where(products_categories.c.product_id.in_(chunk))
+			):
+				category_ids[product_id].append(category_id)
+
+			# Brands and categories missing from the reference cache are loaded by session
+			reference_cache.get_many(Brand, {row.brand_id for row in rows}, session)
+			reference_cache.get_many(Category, {id for ids in category_ids.values() for id in ids}, session)
+
+			session.execute(read_models.delete().where(read_models.c.product_id.in_(chunk)))
+			if rows:
+				documents = product_serializer.render_many(rows, category_ids)
+				session.execute(read_models.insert(), [
+					{'product_id': row.id, 'document': document, 'version': row.updated_at or row.created_at}
+					for row, document in zip(rows, documents)
+				])
+
+	def rebuild(self, session=None):
+		"""Renders the documents of every product again, committing every chunk_size products."""
+		session = session or db.session
+		session.execute(read_models.delete())
+		after = 0
+		while True:
+			product_ids = [id for id, in session.execute(
+				select(Product.id).where(Product.id > after).order_by(Product.id).limit(self.chunk_size)
+			)]
+			if not product_ids:
+				break
+			self.refresh(session, product_ids)
+			session.commit()
+			after = product_ids[-1]
+		session.commit()
+
+	def _before_flush(self, session, flush_context, instances):
+		# Products of changed brands and categories are looked up before the flush
+		# removes the links of deleted categories.
+		brand_ids, category_ids = set(), set()
+		changed = list(session.deleted) + [
+			# Linking products only changes the collections of brands and categories
+			instance for instance in session.dirty if session.is_modified(instance, include_collections=False)
+		]
+		for instance in changed:
+			if isinstance(instance, Brand):
+				brand_ids.add(instance.id)
+			elif isinstance(instance, Category):
+				category_ids.add(instance.id)
+
+		product_ids = session.info.setdefault('read_model_product_ids', set())
+		if brand_ids:
+			product_ids.update(id for id, in session.execute(
+				select(Product.id).where(Product.brand_id.in_(brand_ids))
+			))
+		if category_ids:
+			product_ids.update(id for id, in session.execute(
+				select(products_categories.c.product_id).where(products_categories.c.category_id.in_(category_ids))
+			))
+
+	def _after_flush(self, session, flush_context):
+		product_ids = session.info.pop('read_model_product_ids', set())
+		for instance in session.new | session.dirty | session.deleted:
+			if isinstance(instance, Product):
+				product_ids.add(instance.id)
+		if product_ids:
+			self.refresh(session, product_ids)
+
+
+product_documents = ProductDocuments()
@@ -1,10 +1,10 @@
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timezone
 
-from pydantic import BaseModel, conlist, constr, conint
+from pydantic import BaseModel, conlist, constr, conint, validator
 
 from app.schemas.category import Category
-from app.settings import MIN_CATEGORIES_COUNT, MAX_CATEGORIES_COUNT
+from app.settings import MIN_CATEGORIES_COUNT, MAX_CATEGORIES_COUNT, BULK_MAX_ITEMS, RESERVATION_MAX_LINES
 
 
 class ProductBase(BaseModel):
@@ -15,6 +15,23 @@ class ProductBase(BaseModel):
 	items_in_stock: conint(gt=0, lt=9223372036854775807)
 	receipt_date: datetime
 
+	@validator('expiration_date', 'receipt_date', pre=True)
+	def parse_time_format(cls, value):
+		# Fast path for TIME_FORMAT, the format of the API; other values go through the pydantic parser
+		if isinstance(value, str) and len(value) == 20 and value[-1] == 'Z':
+			try:
+				return datetime.fromisoformat(value[:-1])
+			except ValueError:
+				pass
+		return value
+
+	@validator('expiration_date', 'receipt_date')
+	def to_naive_utc(cls, value):
+		"""Dates are stored as naive UTC datetimes."""
+		if value.tzinfo is not None:
+			value = value.astimezone(timezone.utc).replace(tzinfo=None)
+		return value
+
 
 class ProductInDB(ProductBase):
 	id: int
@@ -30,6 +47,24 @@ class ProductUpdate(ProductCreate):
 	pass
 
 
+class ProductBulk(BaseModel):
+	upsert: conlist(dict, max_items=BULK_MAX_ITEMS) = []
+	delete: conlist(int, max_items=BULK_MAX_ITEMS) = []
+
+
+class StockReservation(BaseModel):
+	quantity: conint(gt=0, lt=9223372036854775807) = 1
+
+
+class CartLine(StockReservation):
+	product_id: int
+
+
+class CartReservation(BaseModel):
+	lines: conlist(CartLine, min_items=1, max_items=RESERVATION_MAX_LINES)
+	all_or_nothing: bool = False
+
+
 class BrandInfo(BaseModel):
 	id: int
 	name: str
@@ -0,0 +1,177 @@
+from datetime import timezone
+from json.encoder import encode_basestring, encode_basestring_ascii
+
+from flask import current_app, json
+from sqlalchemy import Boolean, DateTime, Float, Integer
+
+from app.cache import reference_cache
+from app.models.products import Brand, Category, Product
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def encode_datetime(value):
+	"""Encodes a datetime like the Flask JSON encoder does, as an RFC 1123 date string."""
+	if value.tzinfo is not None:
+		value = value.astimezone(timezone.utc)
+	return '"%s, %02d %s %04d %02d:%02d:%02d GMT"' % (
+		WEEKDAYS[value.weekday()], value.day, MONTHS[value.month - 1], value.year,
+		value.hour, value.minute, value.second
+	)
+
+
+def encode_float(value):
+	if value != value:
+		return 'NaN'
+	if value in (float('inf'), float('-inf')):
+		return 'Infinity' if value > 0 else '-Infinity'
+	return repr(value)
+
+
+def orjson_encode_string(value):
+	return orjson.dumps(value).decode()
+
+
+class ModelSerializer:
+	"""Renders the fields of a model straight to a JSON object.
+
+	The renderer is compiled once per configuration into a function that reads
+	the fields from a row (attribute access, as on ORM instances and result rows,
+	or item access, as on cached dicts) and concatenates the pre-encoded keys with
+	type-specific encoders. fields are given in the order of the serialized
+	property of the model, which unsorted keys keep; the nested ones among them
+	are passed to the renderer already rendered.
+	"""
+
+	def __init__(self, model, fields, nested=(), item_access=False):
+		self.model = model
+		self.fields = fields
+		self.nested = nested
+		self.column_fields = tuple(field for field in fields if field not in nested)
+		self.item_access = item_access
+		self.render = None
+
+	def compile(self, sort_keys=True, encode_string=encode_basestring_ascii):
+		keys = list(self.fields)
+		if sort_keys:
+			keys.sort()
+
+		namespace = {
+			'encode_string': encode_string,
+			'encode_float': encode_float,
+			'encode_datetime': encode_datetime
+		}
+		parts = []
+		for index, key in enumerate(keys):
+			prefix = ('{' if index == 0 else ',') + encode_string(key) + ':'
+			if key in self.nested:
+				expression = key
+			else:
+				expression = self._field_expression(key)
+			parts.append('%r + %s' % (prefix, expression))
+
+		source = 'def render(row%s):\n\treturn %s + "}"\n' % (
+			''.join(', ' + key for key in self.nested),
+			' + '.join('(%s)' % part for part in parts)
+		)
+		exec(source, namespace)
+		self.render = namespace['render']
+
+	def _field_expression(self, key):
+		value = 'row[%r]' % key if self.item_access else 'row.%s' % key
+		column = self.model.__table__.c[key]
+		if isinstance(column.type, Boolean):
+			expression = '("true" if %s else "false")' % value
+		elif isinstance(column.type, Integer):
+			expression = 'repr(%s)' % value
+		elif isinstance(column.type, Float):
+			expression = 'encode_float(%s)' % value
+		elif isinstance(column.type, DateTime):
+			expression = 'encode_datetime(%s)' % value
+		else:
+			expression = 'encode_string(%s)' % value
+		if column.nullable:
+			expression = '("null" if %s is None else %s)' % (value, expression)
+		return expression
+
+
+class ProductSerializer:
+	"""Renders products to the same bytes as jsonify(Product.serialized).
+
+	Products are rendered from result rows of the products columns (or Product
+	instances) and the ids of their categories; brands and categories come from
+	the reference cache. Pretty printing (JSONIFY_PRETTYPRINT_REGULAR or debug
+	mode) is not applied.
+	"""
+
+	columns = tuple(Product.__table__.columns)
+
+	def __init__(self):
+		self.product = ModelSerializer(Product, (
+			'id', 'name', 'rating', 'featured', 'items_in_stock', 'receipt_date', 'brand', 'categories',
+			'expiration_date', 'created_at'
+		), nested=('brand', 'categories'))
+		self.brand = ModelSerializer(Brand, ('id', 'name', 'country_code'), item_access=True)
+		self.category = ModelSerializer(Category, ('id', 'name'), item_access=True)
+		self.compile()
+
+	def init_app(self, app):
+		self.compile(app.config.get('JSON_SORT_KEYS', True), app.config.get('JSON_AS_ASCII', True))
+
+	def compile(self, sort_keys=True, as_ascii=True):
+		"""Compiles the renderers for the JSON_SORT_KEYS and JSON_AS_ASCII settings.
+
+		Without ASCII escaping strings are encoded by orjson when it is installed.
+		"""
+		if as_ascii:
+			encode_string = encode_basestring_ascii
+		elif orjson is not None:
+			encode_string = orjson_encode_string
+		else:
+			encode_string = encode_basestring
+		for serializer in (self.product, self.brand, self.category):
+			serializer.compile(sort_keys, encode_string)
+
+	def render_many(self, rows, category_ids):
+		"""Returns the JSON documents of rows; category_ids maps product ids to category ids."""
+		brands = reference_cache.get_many(Brand, {row.brand_id for row in rows})
+		categories = reference_cache.get_many(Category, {id for ids in category_ids.values() for id in ids})
+		render_brand, render_category, render_product = self.brand.render, self.category.render, self.product.render
+
+		brand_documents = {id: render_brand(brand) for id, brand in brands.items()}
+		category_documents = {id: render_category(category) for id, category in categories.items()}
+		return [
+			render_product(
+				row,
+				brand_documents.get(row.brand_id, 'null'),
+				'[' + ','.join(category_documents[id] for id in category_ids.get(row.id, ()) if id in category_documents) + ']'
+			)
+			for row in rows
+		]
+
+	def render(self, product, category_ids):
+		return self.render_many([product], {product.id: category_ids})[0]
+
+	def response(self, body):
+		return current_app.response_class(body + '\n', mimetype='application/json')
+
+	def list_response(self, rows, category_ids, **extra):
+		"""Returns {'results': [...], **extra} as a JSON response; extra values are encoded with flask.json."""
+		return self.documents_response(self.render_many(rows, category_ids), **extra)
+
+	def documents_response(self, documents, **extra):
+		"""Like list_response, for documents already rendered."""
+		members = [('results', '[' + ','.join(documents) + ']')]
+		members += [(key, json.dumps(value)) for key, value in extra.items()]
+		if current_app.config.get('JSON_SORT_KEYS', True):
+			members.sort()
+		return self.response('{' + ','.join('"%s":%s' % member for member in members) + '}')
+
+
+product_serializer = ProductSerializer()
@@ -1 +1,2 @@
-from .products_service import product
\ No newline at end of file
+from .analytics_service import analytics
+from .products_service import product
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, case, cast, func, select
+
+from app import db
+from app.models.products import Brand, Category, Product, products_categories
+
+
+class AnalyticsService:
+	"""Aggregates over the whole products table, each computed by one GROUP BY statement."""
+
+	def get_product_analytics(self, expiring_within: timedelta, now: datetime = None):
+		"""Returns the stock per brand, the rating distribution per category, the products
+		expiring within expiring_within of now and the share of featured products.
+		"""
+		now = now or datetime.utcnow()
+		return {
+			'stock_per_brand': self.stock_per_brand(),
+			'rating_distribution_per_category': self.rating_distribution_per_category(),
+			'expiration': self.expiration(now, now + expiring_within),
+			'featured': self.featured_share()
+		}
+
+	def stock_per_brand(self):
+		"""Returns the products and items in stock of every brand, brands without products included."""
+		rows = db.session.execute(
+			select(
+				Brand.id, Brand.name, func.count(Product.id).label('products'),
+				func.coalesce(func.sum(Product.items_in_stock), 0).label('items_in_stock')
+			)
+			.select_from(Brand)
+			.outerjoin(Product, Product.brand_id == Brand.id)
+			.group_by(Brand.id, Brand.name)
+			.order_by(Brand.id)
+		)
+		return [
+			{'brand_id': row.id, 'name': row.name, 'products': row.products, 'items_in_stock': row.items_in_stock}
+			for row in rows
+		]
+
+	def rating_distribution_per_category(self):
+		"""Returns the products of every category counted by whole rating, i.e. rating 7.5 counts as 7."""
+		# The cast truncates toward zero, so negative ratings with a fraction are moved one bucket down;
+		# floor() is not available on every SQLite build
+		truncated = cast(Product.rating, Integer)
+		bucket = (truncated - case((Product.rating < truncated, 1), else_=0)).label('bucket')
+		rows = db.session.execute(
+			select(Category.id, Category.name, bucket, func.count().label('products'))
+			.select_from(products_categories)
+			.join(Category, Category.id == products_categories.c.category_id)
+			.join(Product, Product.id == products_categories.c.product_id)
+			.group_by(Category.id, Category.name, bucket)
+			.order_by(Category.id, bucket)
+		)
+		categories = {}
+		for row in rows:
+			category = categories.get(row.id)
+			if category is None:
+				category = categories[row.id] = {'category_id': row.id, 'name': row.name, 'ratings': []}
+			category['ratings'].append({'rating': row.bucket, 'products': row.products})
+		return list(categories.values())
+
+	def expiration(self, now: datetime, until: datetime):
+		"""Returns the products, and their items in stock, already expired and expiring before until."""
+		expired = Product.expiration_date < now
+		expiring = Product.expiration_date.between(now, until)
+		row = db.session.execute(select(
+			func.count(case((expired, 1))).label('expired'),
+			func.coalesce(func.sum(case((expired, Product.items_in_stock))), 0).label('expired_items'),
+			func.count(case((expiring, 1))).label('expiring'),
+			func.coalesce(func.sum(case((expiring, Product.items_in_stock))), 0).label('expiring_items')
+		)).one()
+		return {
+			'until': until,
+			'expired': {'products': row.expired, 'items_in_stock': row.expired_items},
+			'expiring': {'products': row.expiring, 'items_in_stock': row.expiring_items}
+		}
+
+	def featured_share(self):
+		row = db.session.execute(select(
+			func.count().label('products'),
+			func.count(case((Product.featured, 1))).label('featured')
+		)).one()
+		return {
+			'products': row.products,
+			'featured': row.featured,
+			'share': row.featured / row.products if row.products else 0.0
+		}
+
+
+analytics = AnalyticsService()
@@ -1,54 +1,328 @@
-from sqlalchemy.orm.exc import NoResultFound
+import re
+from collections import Counter, defaultdict
+from weakref import WeakKeyDictionary
+
+from pydantic import ValidationError
+from sqlalchemy import and_, inspect, or_, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.exc import NoResultFound, StaleDataError
 
 from app import db
-from app.models.products import Product, Brand, Category
+from app.cache import etag, product_generation, reference_cache
+from app.changes import product_changes
+from app.models.products import Product, Brand, Category, ProductReadModel, products_categories
+from app.read_model import product_documents
+from app.schemas.product import ProductCreate
 from datetime import datetime
 
-from app.settings import TIME_FORMAT
+from app.settings import DEFAULT_PAGE_SIZE, BULK_CHUNK_SIZE, FEATURED_MIN_RATING
+
+# Writes of a bulk upsert chunk whose products are updated concurrently
+BULK_CHUNK_ATTEMPTS = 3
+STALE_VERSION_ERROR = {'error': 'Product was changed by another request', 'field': 'version'}
+
+
+def escape_like(value, escape='\\'):
+	"""Escapes the LIKE wildcards of value, to be matched with escape=escape."""
+	return value.replace(escape, escape * 2).replace('%', escape + '%').replace('_', escape + '_')
 
 
 class ProductService:
 	time_format = "%Y-%m-%dT%H:%M:%SZ"
 
+	def __init__(self):
+		self.__fts_engines = WeakKeyDictionary()
+
 	def get_product(self, id: int):
 		product = Product.query.get(id)
 		if product is None:
 			raise NoResultFound({'error': 'Product not found', 'field': 'id'})
 		return product
 
+	def get_document(self, id: int):
+		"""Returns the rendered JSON document of a product and its version, from product_read_model."""
+		row = db.session.execute(self.document_statement(id)).first()
+		if row is None:
+			raise NoResultFound({'error': 'Product not found', 'field': 'id'})
+		return row
+
+	def document_statement(self, id: int):
+		return select(ProductReadModel.document, ProductReadModel.version).where(ProductReadModel.product_id == id)
+
+	def get_version(self, id: int):
+		"""Returns the version of the product document, or None when the product does not exist."""
+		return db.session.execute(self.version_statement(id)).scalar()
+
+	def version_statement(self, id: int):
+		return select(ProductReadModel.version).where(ProductReadModel.product_id == id)
+
+	sort_columns = {
+		'id': Product.id,
+		'name': Product.name,
+		'rating': Product.rating,
+		'items_in_stock': Product.items_in_stock,
+		'created_at': Product.created_at
+	}
+
+	def get_products(self, after=None, limit: int = DEFAULT_PAGE_SIZE, filters: dict = None, sort: str = 'id'):
+		"""Returns one keyset page of filtered product rows and the cursor of the next page.
+
+		Rows hold the columns of products, without relationships; see get_category_ids.
+		sort is a key of sort_columns, prefixed with '-' for descending order. Pages
+		are ordered by the sort column and then by id; the cursor is the last id when
+		sorting by id and a (value, id) pair otherwise.
+		"""
+		rows = db.session.execute(self.products_statement(after, limit, filters, sort)).all()
+		return self.page(rows, limit, sort)
+
+	def get_documents(self, after=None, limit: int = DEFAULT_PAGE_SIZE, filters: dict = None, sort: str = 'id'):
+		"""Returns the rendered JSON documents of a get_products page and the cursor of the next page."""
+		rows = db.session.execute(self.documents_statement(after, limit, filters, sort)).all()
+		rows, next_after = self.page(rows, limit, sort)
+		return [row.document for row in rows], next_after
+
+	def documents_statement(self, after=None, limit: int = DEFAULT_PAGE_SIZE, filters: dict = None, sort: str = 'id'):
+		"""Returns the select of a get_documents page: the page of products joined to their documents."""
+		column = self.sort_columns[sort.lstrip('-')]
+		columns = [Product.id, ProductReadModel.document]
+		if column is not Product.id:
+			columns.append(column)
+		statement = self.products_statement(after, limit, filters, sort, columns)
+		return statement.join_from(Product, ProductReadModel, ProductReadModel.product_id == Product.id)
+
+	def get_documents_by_ids(self, ids):
+		"""Returns the rendered JSON documents of the products with the given ids, in the order of ids.
+
+		Unknown ids are skipped.
+		"""
+		if not ids:
+			return []
+		documents = dict(db.session.execute(
+			select(ProductReadModel.product_id, ProductReadModel.document).where(ProductReadModel.product_id.in_(ids))
+		).all())
+		return [documents[id] for id in dict.fromkeys(ids) if id in documents]
+
+	# Fields of the product representation, see Product.serialized
+	projection_fields = (
+		'id', 'name', 'rating', 'featured', 'items_in_stock', 'receipt_date', 'brand', 'categories',
+		'expiration_date', 'created_at'
+	)
+
+	def get_projected_products(
+		self, fields, after=None, limit: int = DEFAULT_PAGE_SIZE, filters: dict = None, sort: str = 'id',
+		references=None
+	):
+		"""Like get_products, returning dicts of the given fields of each product, see project."""
+		columns = self.projection_columns(fields, sort)
+		rows = db.session.execute(self.products_statement(after, limit, filters, sort, columns)).all()
+		rows, next_after = self.page(rows, limit, sort)
+		return self.project(rows, fields, references), next_after
+
+	def get_projected_by_ids(self, fields, ids, references=None):
+		"""Returns dicts of the given fields of the products with the given ids, in the order of ids."""
+		return self.project(self.get_products_by_ids(ids, self.projection_columns(fields)), fields, references)
+
+	def get_products_by_ids(self, ids, columns=None):
+		"""Returns the rows of the products with the given ids, in the order of ids; unknown ids are skipped.
+
+		columns default to the columns of products and must include id.
+		"""
+		if not ids:
+			return []
+		statement = select(*(columns or Product.__table__.columns)).where(Product.id.in_(ids))
+		rows = {row.id: row for row in db.session.execute(statement)}
+		return [rows[id] for id in dict.fromkeys(ids) if id in rows]
+
+	def projection_columns(self, fields, sort: str = 'id'):
+		"""Returns the products columns read for fields: the ones asked for, id, the sort column
+		and brand_id when the brand is asked for.
+		"""
+		names = {'id', sort.lstrip('-')} | {field for field in fields if field not in ('brand', 'categories')}
+		if 'brand' in fields:
+			names.add('brand_id')
+		return [column for column in Product.__table__.columns if column.name in names]
+
+	def project(self, rows, fields, references=None):
+		"""Returns dicts of the given fields of rows read with projection_columns.
+
+		Brands and categories come from the reference cache and category links are
+		only read when they are asked for. Given a references dict, products refer to
+		their brand and categories by id and references gets them once each, in its
+		'brands' and 'categories' lists.
+		"""
+		columns = [field for field in fields if field not in ('brand', 'categories')]
+		brands = categories = category_ids = None
+		if 'brand' in fields:
+			brands = reference_cache.get_many(Brand, {row.brand_id for row in rows})
+		if 'categories' in fields:
+			category_ids = self.get_category_ids([row.id for row in rows])
+			categories = reference_cache.get_many(Category, {id for ids in category_ids.values() for id in ids})
+
+		products = []
+		for row in rows:
+			product = {field: getattr(row, field) for field in columns}
+			if brands is not None:
+				brand = brands.get(row.brand_id)
+				product['brand'] = brand if references is None or brand is None else row.brand_id
+			if categories is not None:
+				product['categories'] = [
+					categories[id] if references is None else id for id in category_ids[row.id] if id in categories
+				]
+			products.append(product)
+
+		if references is not None:
+			references['brands'] = sorted((brands or {}).values(), key=lambda brand: brand['id'])
+			references['categories'] = sorted((categories or {}).values(), key=lambda category: category['id'])
+		return products
+
+	def products_statement(
+		self, after=None, limit: int = DEFAULT_PAGE_SIZE, filters: dict = None, sort: str = 'id', columns=None
+	):
+		"""Returns the select of a get_products page; it reads one row more than limit, see page.
+
+		columns default to the columns of products and must include id and the sort column.
+		"""
+		descending = sort.startswith('-')
+		field = sort.lstrip('-')
+		column = self.sort_columns[field]
+
+		statement = self.__filter_products(select(*(columns or Product.__table__.columns)), filters or {})
+		if field == 'id':
+			statement = statement.order_by(Product.id.desc() if descending else Product.id)
+			if after is not None:
+				statement = statement.where(Product.id < after if descending else Product.id > after)
+		else:
+			if descending:
+				statement = statement.order_by(column.desc(), Product.id.desc())
+			else:
+				statement = statement.order_by(column, Product.id)
+			if after is not None:
+				value, after_id = after
+				if descending:
+					statement = statement.where(or_(column < value, and_(column == value, Product.id < after_id)))
+				else:
+					statement = statement.where(or_(column > value, and_(column == value, Product.id > after_id)))
+		return statement.limit(limit + 1)
+
+	def page(self, rows, limit: int, sort: str = 'id'):
+		"""Splits the rows read by products_statement into the page and the cursor of the next page."""
+		next_after = None
+		if len(rows) > limit:
+			rows = rows[:limit]
+			last = rows[-1]
+			field = sort.lstrip('-')
+			next_after = last.id if field == 'id' else (getattr(last, field), last.id)
+		return rows, next_after
+
+	def iter_products(self, chunk_size: int):
+		"""Yields lists of product rows covering the whole table, chunk_size rows at most each."""
+		after = None
+		while True:
+			rows, after = self.get_products(after, chunk_size)
+			yield rows
+			if after is None:
+				return
+
+	def get_category_ids(self, product_ids):
+		"""Returns {product id: [category ids]} for the given products, with one query."""
+		if not product_ids:
+			return defaultdict(list)
+		return self.group_category_ids(db.session.execute(self.category_ids_statement(product_ids)))
+
+	def category_ids_statement(self, product_ids):
+		return select(products_categories.c.product_id, products_categories.c.category_id).where(
+			products_categories.c.product_id.in_(product_ids)
+		)
+
+	def group_category_ids(self, links):
+		category_ids = defaultdict(list)
+		for product_id, category_id in links:
+			category_ids[product_id].append(category_id)
+		return category_ids
+
+	def search_products(self, q: str, limit: int = DEFAULT_PAGE_SIZE):
+		"""Returns up to limit product rows whose name matches every word of q, best matches first.
+
+		The last word may be a prefix. Uses the products_fts index when the database
+		has one and falls back to LIKE matching ordered by name otherwise.
+		"""
+		words = re.findall(r'\w+', q)
+		if not words:
+			return []
+
+		if self.__has_fts():
+			match = ' '.join('"%s"' % word for word in words) + '*'
+			ids = [id for id, in db.session.execute(
+				text('SELECT rowid FROM products_fts WHERE products_fts MATCH :match ORDER BY rank LIMIT :limit'),
+				{'match': match, 'limit': limit}
+			)]
+		else:
+			query = db.session.query(Product.id)
+			for word in words:
+				query = query.filter(Product.name.ilike('%' + escape_like(word) + '%', escape='\\'))
+			ids = [id for id, in query.order_by(Product.name, Product.id).limit(limit)]
+
+		if not ids:
+			return []
+		rows = {
+			row.id: row
+			for row in db.session.query(*Product.__table__.columns).filter(Product.id.in_(ids))
+		}
+		return [rows[id] for id in ids if id in rows]
+
 	def create_product(self, new_product_dict: dict):
-		brand = Brand.query.get(new_product_dict.get('brand_id'))
+		"""Creates a product from the parsed fields of a ProductCreate, see ProductCreate.dict."""
+		brand = reference_cache.get(Brand, new_product_dict.get('brand_id'))
 		if brand is None:
 			raise NoResultFound({'error': 'Brand not found', 'field': 'brand_id'})
 
-		new_product_dict = self.__normalize_json(new_product_dict)
+		new_product_dict = self.__resolve_categories(new_product_dict)
 		new_product = Product(**new_product_dict)
 
-		if new_product.rating > 8:
+		if new_product.rating > FEATURED_MIN_RATING:
 			new_product.featured = True
 		db.session.add(new_product)
+		db.session.flush()
+		product_changes.append(db.session, 'created', [new_product.id])
 		db.session.commit()
+		product_generation.bump()
 		db.session.refresh(new_product)
 		return new_product
 
-	def update_product(self, id, update_product_dict: dict):
+	def update_product(self, id, update_product_dict: dict, if_match=None):
+		"""Updates a product with the parsed fields of a ProductUpdate; None fields are left unchanged.
+
+		if_match, when given, is the werkzeug ETags of the If-Match header, which must
+		contain the ETag of the current GET /products/<id> response. Weak ETags match
+		too: compressed responses carry it as a weak one. StaleDataError is raised
+		when it does not, or when another transaction updated the product since it
+		was loaded.
+		"""
 		product = Product.query.get(id)
 		if product is None:
 			raise NoResultFound({'error': 'Product not found', 'field': 'id'})
-		brand = Brand.query.get(update_product_dict.get('brand_id'))
+		# The product is loaded first, so a document of an older version never matches
+		if if_match is not None and not if_match.contains_weak(etag(self.get_document(id).document + '\n')):
+			raise StaleDataError({'error': 'Product does not match If-Match', 'field': 'id'})
+		brand = reference_cache.get(Brand, update_product_dict.get('brand_id'))
 		if brand is None:
 			raise NoResultFound({'error': 'Brand not found', 'field': 'brand_id'})
 
 
-		update_product_dict = self.__normalize_json(update_product_dict)
-		for field in product.__dict__:
+		update_product_dict = self.__resolve_categories(update_product_dict)
+		# Mapped attributes, so categories are replaced even though the relationship is not loaded yet
+		for field in inspect(Product).attrs.keys():
 			if field in update_product_dict and (not update_product_dict[field] is None):
 				setattr(product, field, update_product_dict[field])
 
-		if product.rating > 8:
+		if product.rating > FEATURED_MIN_RATING:
 			product.featured = True
+		# Category changes do not touch the row, bump the version explicitly
+		product.updated_at = datetime.utcnow()
 		db.session.add(product)
-		db.session.commit()
+		product_changes.append(db.session, 'updated', [product.id])
+		self.__commit_versioned()
+		product_generation.bump()
 		db.session.refresh(product)
 		return product
 
@@ -57,15 +331,292 @@ class ProductService:
 		if product is None:
 			raise NoResultFound({'error': 'Product not found', 'field': 'id'})
 		db.session.delete(product)
-		db.session.commit()
+		product_changes.append(db.session, 'deleted', [id])
+		self.__commit_versioned()
+		product_generation.bump()
 		return product
 
-	def __normalize_json(self, obj):
-		obj['receipt_date'] = datetime.strptime(obj['receipt_date'], TIME_FORMAT)
-		obj['expiration_date'] = datetime.strptime(obj['expiration_date'], TIME_FORMAT)
+	def bulk_upsert(self, items: list, validate_item=None):
+		"""Creates items without an id and updates items with one.
+
+		Every item is parsed with ProductCreate and, when given, the parsed item is
+		checked by validate_item, which raises ValueError.
+		Referenced brands and categories are resolved with one query each and rows
+		are written with bulk statements, one transaction per BULK_CHUNK_SIZE items.
+		Items updating a product may give the version they were read at; items of
+		another version, or of a product updated by another request while the chunk
+		is written, are reported as errors instead of overwriting the product, and
+		the rest of the chunk is written again. A product can be updated by one item
+		only: items sharing an id are all rejected.
+		Returns one result per item, in order; invalid items are reported and skipped.
+		"""
+		results = [None] * len(items)
+		valid = []
+		id_counts = Counter(item['id'] for item in items if isinstance(item, dict) and isinstance(item.get('id'), int))
+		duplicate_ids = {id for id, count in id_counts.items() if count > 1}
+		for index, item in enumerate(items):
+			try:
+				product = ProductCreate.parse_obj(item)
+				if item.get('id') is not None and not isinstance(item['id'], int):
+					raise ValueError({'error': 'Product id must be an integer', 'field': 'id'})
+				if item.get('id') in duplicate_ids:
+					raise ValueError({'error': 'Product id is given by more than one item', 'field': 'id'})
+				if item.get('version') is not None and not isinstance(item['version'], int):
+					raise ValueError({'error': 'Product version must be an integer', 'field': 'version'})
+				if validate_item is not None:
+					validate_item(product)
+			except ValidationError as error:
+				results[index] = {'index': index, 'status': 'error', 'validation_error': error.errors()}
+				continue
+			except ValueError as error:
+				results[index] = self.__error_result(index, error)
+				continue
+			valid.append((index, dict(product.dict(), id=item.get('id'), version=item.get('version'))))
+
+		brand_ids = set(reference_cache.get_many(Brand, {item['brand_id'] for _, item in valid}))
+		category_ids = set(reference_cache.get_many(Category, {c for _, item in valid for c in item['categories']}))
+		versions = self.__versions({item['id'] for _, item in valid if item.get('id') is not None})
+
+		resolved = []
+		for index, item in valid:
+			if item['brand_id'] not in brand_ids:
+				results[index] = {'index': index, 'status': 'error', 'error': 'Brand not found', 'field': 'brand_id'}
+			elif item['id'] is not None and item['id'] not in versions:
+				results[index] = {'index': index, 'status': 'error', 'error': 'Product not found', 'field': 'id'}
+			elif item['id'] is not None and item['version'] not in (None, versions[item['id']]):
+				results[index] = dict({'index': index, 'status': 'error'}, **STALE_VERSION_ERROR)
+			else:
+				if item['id'] is not None:
+					# Updates of a product changed since its version was read fail with StaleDataError
+					item['version'] = versions[item['id']]
+				resolved.append((index, item))
+
+		for start in range(0, len(resolved), BULK_CHUNK_SIZE):
+			chunk = resolved[start:start + BULK_CHUNK_SIZE]
+			for attempt in range(BULK_CHUNK_ATTEMPTS):
+				try:
+					chunk_results = self.__write_upsert_chunk(chunk, category_ids)
+					product_documents.refresh(db.session, [result['id'] for result in chunk_results])
+					for operation in ('created', 'updated'):
+						product_changes.append(db.session, operation, [
+							result['id'] for result in chunk_results if result['status'] == operation
+						])
+					db.session.commit()
+					break
+				except StaleDataError:
+					# Products updated since their versions were read are reported, the others written again
+					db.session.rollback()
+					chunk_results = []
+					chunk = self.__drop_stale_items(chunk, results)
+				except SQLAlchemyError:
+					db.session.rollback()
+					chunk_results = []
+					break
+			else:
+				chunk_results = []
+			written = {result['index'] for result in chunk_results}
+			for index, _ in chunk:
+				if index not in written:
+					results[index] = {'index': index, 'status': 'error', 'error': 'Product could not be saved'}
+			for result in chunk_results:
+				results[result['index']] = result
+
+		if resolved:
+			product_generation.bump()
+		return results
+
+	def bulk_delete(self, ids: list):
+		"""Deletes products by id, one transaction per BULK_CHUNK_SIZE ids.
+
+		Returns one result per id, in order; unknown ids are reported as errors.
+		"""
+		existing_ids = self.__existing_ids(Product.id, set(ids))
+		results = []
+		to_delete = []
+		for id in ids:
+			if id in existing_ids and id not in to_delete:
+				to_delete.append(id)
+				results.append({'id': id, 'status': 'deleted'})
+			else:
+				results.append({'id': id, 'status': 'error', 'error': 'Product not found', 'field': 'id'})
+
+		failed = set()
+		for start in range(0, len(to_delete), BULK_CHUNK_SIZE):
+			chunk = to_delete[start:start + BULK_CHUNK_SIZE]
+			try:
+				db.session.execute(products_categories.delete().where(products_categories.c.product_id.in_(chunk)))
+				db.session.execute(Product.__table__.delete().where(Product.id.in_(chunk)))
+				product_documents.refresh(db.session, chunk)
+				product_changes.append(db.session, 'deleted', chunk)
+				db.session.commit()
+			except SQLAlchemyError:
+				db.session.rollback()
+				failed.update(chunk)
+		if to_delete:
+			product_generation.bump()
+
+		for result in results:
+			if result['status'] == 'deleted' and result['id'] in failed:
+				result.update({'status': 'error', 'error': 'Product could not be deleted'})
+		return results
+
+	def reserve_stock(self, lines: list, all_or_nothing: bool = False):
+		"""Takes items out of the stock of products; lines are (product_id, quantity) pairs.
+
+		Every line is one conditional UPDATE that decrements items_in_stock only when
+		enough items are left, so concurrent reservations neither read the stock first
+		nor lose decrements. Lines are applied in product id order, which keeps
+		concurrent carts from deadlocking on databases with row locks, and committed in
+		one transaction; with all_or_nothing none is committed when one fails, and the
+		reserved lines are reported as rolled_back. Reservations bump the product
+		version, so a concurrent PUT of a stale stock fails instead of undoing them.
+		Returns one result per line, in order.
+		"""
+		now = datetime.utcnow()
+		results = [None] * len(lines)
+		reserved = set()
+		for index in sorted(range(len(lines)), key=lambda index: lines[index][0]):
+			product_id, quantity = lines[index]
+			updated = db.session.execute(
+				update(Product)
+				.where(Product.id == product_id, Product.items_in_stock >= quantity)
+				.values(items_in_stock=Product.items_in_stock - quantity, version=Product.version + 1, updated_at=now)
+				.execution_options(synchronize_session=False)
+			).rowcount
+			if updated:
+				reserved.add(product_id)
+				results[index] = {'index': index, 'product_id': product_id, 'quantity': quantity, 'status': 'reserved'}
+
+		failed = [index for index, result in enumerate(results) if result is None]
+		existing_ids = self.__existing_ids(Product.id, {lines[index][0] for index in failed})
+		for index in failed:
+			product_id, quantity = lines[index]
+			if product_id in existing_ids:
+				error = {'error': 'Not enough items in stock', 'field': 'quantity'}
+			else:
+				error = {'error': 'Product not found', 'field': 'product_id'}
+			results[index] = dict({'index': index, 'product_id': product_id, 'quantity': quantity, 'status': 'error'}, **error)
+
+		if failed and all_or_nothing:
+			db.session.rollback()
+			for result in results:
+				if result['status'] == 'reserved':
+					result['status'] = 'rolled_back'
+			return results
+
+		if reserved:
+			product_documents.refresh(db.session, sorted(reserved))
+			product_changes.append(db.session, 'updated', sorted(reserved))
+		db.session.commit()
+		if reserved:
+			product_generation.bump()
+		return results
+
+	def __write_upsert_chunk(self, chunk, category_ids):
+		created, updated = [], []
+		for index, item in chunk:
+			row = dict(item)
+			categories = list(dict.fromkeys(c for c in row.pop('categories') if c in category_ids))
+			if row.get('id') is None:
+				row.pop('id', None)
+				row.pop('version', None)
+				row['featured'] = bool(row.get('featured')) or row['rating'] > FEATURED_MIN_RATING
+				created.append((index, row, categories))
+			else:
+				row = {field: value for field, value in row.items() if value is not None}
+				if row['rating'] > FEATURED_MIN_RATING:
+					row['featured'] = True
+				updated.append((index, row, categories))
+
+		if created:
+			rows = [row for _, row, _ in created]
+			db.session.bulk_insert_mappings(Product, rows, return_defaults=True)
+		if updated:
+			db.session.bulk_update_mappings(Product, [row for _, row, _ in updated])
+			db.session.execute(products_categories.delete().where(
+				products_categories.c.product_id.in_([row['id'] for _, row, _ in updated])
+			))
+
+		links = [
+			{'product_id': row['id'], 'category_id': category_id}
+			for _, row, categories in created + updated
+			for category_id in categories
+		]
+		if links:
+			db.session.execute(products_categories.insert(), links)
+
+		return (
+			[{'index': index, 'status': 'created', 'id': row['id']} for index, row, _ in created] +
+			[{'index': index, 'status': 'updated', 'id': row['id']} for index, row, _ in updated]
+		)
+
+	def __has_fts(self):
+		engine = db.engine
+		if engine not in self.__fts_engines:
+			self.__fts_engines[engine] = inspect(engine).has_table('products_fts')
+		return self.__fts_engines[engine]
+
+	def __filter_products(self, statement, filters: dict):
+		if filters.get('brand_id') is not None:
+			statement = statement.where(Product.brand_id == filters['brand_id'])
+		if filters.get('categories'):
+			# Served by the (category_id, product_id) index of products_categories
+			product_ids = select(products_categories.c.product_id).where(
+				products_categories.c.category_id.in_(filters['categories'])
+			)
+			statement = statement.where(Product.id.in_(product_ids))
+		if filters.get('featured') is not None:
+			statement = statement.where(Product.featured == filters['featured'])
+		if filters.get('min_rating') is not None:
+			statement = statement.where(Product.rating >= filters['min_rating'])
+		if filters.get('max_rating') is not None:
+			statement = statement.where(Product.rating <= filters['max_rating'])
+		if filters.get('in_stock') is not None:
+			statement = statement.where(Product.items_in_stock > 0 if filters['in_stock'] else Product.items_in_stock <= 0)
+		if filters.get('expires_after') is not None:
+			statement = statement.where(Product.expiration_date >= filters['expires_after'])
+		if filters.get('expires_before') is not None:
+			statement = statement.where(Product.expiration_date <= filters['expires_before'])
+		return statement
+
+	def __commit_versioned(self):
+		try:
+			db.session.commit()
+		except StaleDataError:
+			db.session.rollback()
+			raise StaleDataError({'error': 'Product was changed by another request', 'field': 'id'})
+
+	def __drop_stale_items(self, chunk, results):
+		"""Reports the update items of chunk whose product changed version or was deleted; returns the others."""
+		versions = self.__versions({item['id'] for _, item in chunk if item['id'] is not None})
+		current = []
+		for index, item in chunk:
+			if item['id'] is not None and item['id'] not in versions:
+				results[index] = {'index': index, 'status': 'error', 'error': 'Product not found', 'field': 'id'}
+			elif item['id'] is not None and versions[item['id']] != item['version']:
+				results[index] = dict({'index': index, 'status': 'error'}, **STALE_VERSION_ERROR)
+			else:
+				current.append((index, item))
+		return current
+
+	def __versions(self, ids: set):
+		if not ids:
+			return {}
+		return dict(db.session.execute(select(Product.id, Product.version).where(Product.id.in_(ids))).all())
+
+	def __existing_ids(self, column, ids: set):
+		if not ids:
+			return set()
+		return {id for id, in db.session.query(column).filter(column.in_(ids))}
+
+	def __error_result(self, index, error):
+		detail = error.args[0] if error.args and isinstance(error.args[0], dict) else {'error': str(error)}
+		return dict({'index': index, 'status': 'error'}, **detail)
+
+	def __resolve_categories(self, obj):
 		categories = obj.get('categories')
 		if categories:
-			obj['categories'] = Category.query.filter(Category.id.in_(categories)).all()
+			obj['categories'] = reference_cache.instances(Category, categories)
 
 		return obj
 
@@ -18,5 +18,118 @@ JSONIFY_PRETTYPRINT_REGULAR = False
 MIN_CATEGORIES_COUNT = 1
 MAX_CATEGORIES_COUNT = 5
 
+# Products rated above it become featured when they are written
+FEATURED_MIN_RATING = 8
+
+# Pagination settings
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Number of products read from the database per chunk by streaming exports
+EXPORT_CHUNK_SIZE = 1000
+
+# GET /products/changes long-polling: default and maximum seconds a request waits for a change,
+# and seconds between checks for changes committed by other processes
+CHANGES_WAIT = 20
+CHANGES_MAX_WAIT = 60
+CHANGES_POLL_INTERVAL = 0.5
+# Seconds after which a gap in the change sequence numbers is taken for a rolled back
+# transaction; until then readers wait for it to commit
+CHANGES_GAP_TIMEOUT = 10
+# Days of changes kept by "python manage.py prune_changes"; consumers further behind miss the pruned ones
+CHANGES_RETENTION_DAYS = 7
+
+# Product responses of at least COMPRESSION_MIN_SIZE bytes are compressed with brotli
+# (when installed) or gzip, as the Accept-Encoding header allows
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 4
+
+# Bulk write settings: items accepted per request and rows written per transaction
+BULK_MAX_ITEMS = 10000
+BULK_CHUNK_SIZE = 500
+
+# Lines accepted per POST /products/reserve cart
+RESERVATION_MAX_LINES = 100
+
+# Catalog rows written per transaction by "python manage.py import_catalog"
+IMPORT_BATCH_SIZE = 5000
+
+# Products whose product_read_model documents are rendered per statement
+READ_MODEL_CHUNK_SIZE = 500
+
+# Background jobs (app.jobs) settings, run by "python manage.py worker"
+# Products changed per transaction and chunks run per second by a worker, None for no limit
+JOBS_CHUNK_SIZE = 500
+JOBS_MAX_CHUNKS_PER_SECOND = 20
+# Attempts of a failing job; the n-th retry waits JOBS_RETRY_DELAY * 2 ** (n - 1) seconds
+JOBS_MAX_ATTEMPTS = 3
+JOBS_RETRY_DELAY = 10
+# Seconds a worker holds a running job without finishing a chunk before other workers claim it
+JOBS_LEASE = 300
+# Seconds an idle worker waits before looking for due jobs again
+JOBS_POLL_INTERVAL = 1
+# Run a worker thread in the web server process too, i.e. in the 'web' profile of create_app
+JOBS_WORKER_IN_PROCESS = False
+
+# Reference data (brands and categories) cache settings
+REFERENCE_CACHE_SIZE = 4096
+REFERENCE_CACHE_TTL = 300
+# Dotted path of a callable returning a shared app.cache.CacheBackend for the app.
+# None keeps the cache in process.
+REFERENCE_CACHE_BACKEND = None
+
+# Rendered GET /products/<id> responses cache settings
+RESPONSE_CACHE_SIZE = 10000
+RESPONSE_CACHE_TTL = 300
+# Dotted path of a callable returning a shared app.cache.CacheBackend. With the in-process
+# default, hits are checked against the product version, as other processes write too.
+RESPONSE_CACHE_BACKEND = None
+
+# GET /analytics/products responses are cached per product_generation, see app.cache
+# Default of its expiring_within_days parameter
+ANALYTICS_EXPIRING_WITHIN_DAYS = 30
+# Dotted path of a callable returning the app.cache.CacheBackend holding generation counters.
+# Share it between worker processes along with RESPONSE_CACHE_BACKEND.
+GENERATION_BACKEND = None
+
+# Request instrumentation settings: Server-Timing headers, /metrics and slow request logs
+INSTRUMENTATION_ENABLED = True
+SLOW_REQUEST_THRESHOLD_MS = 500
+# Statements kept per request for the slow request log
+INSTRUMENTATION_MAX_STATEMENTS = 100
+
+# Database engine settings. Pool settings do not apply to in-memory SQLite databases.
+DATABASE_POOL_SIZE = 10
+DATABASE_MAX_OVERFLOW = 20
+# Seconds after which pooled connections are replaced, -1 to keep them
+DATABASE_POOL_RECYCLE = 3600
+DATABASE_POOL_PRE_PING = True
+# URIs of read replicas of SQLALCHEMY_DATABASE_URI. GET and HEAD requests read from one of
+# them until they write, but for cache fills and the change feed, which read the primary;
+# "python manage.py sync_replicas" copies the primary to SQLite replicas.
+DATABASE_REPLICA_URIS = []
+# Without replicas, GET and HEAD requests read SQLite file databases through a separate
+# read-only engine
+DATABASE_READ_ONLY_ENGINE = True
+
+# Pragmas set on every SQLite connection, None leaves the SQLite default
+SQLITE_JOURNAL_MODE = 'WAL'
+SQLITE_SYNCHRONOUS = 'NORMAL'
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+SQLITE_BUSY_TIMEOUT_MS = 5000
+
+# ASGI serving mode (app.asgi) settings
+# Async database URL; None derives it from SQLALCHEMY_DATABASE_URI with the aiosqlite driver
+ASGI_DATABASE_URI = None
+ASGI_POOL_SIZE = 20
+# Requests run at once by the async handlers; up to ASGI_MAX_PENDING more wait, later ones get a 503
+ASGI_MAX_CONCURRENCY = 100
+ASGI_MAX_PENDING = 1000
+# Threads running the Flask app for the routes without an async handler
+ASGI_WSGI_THREADS = 16
+# Threads running GET /products/changes long-polls apart from the others; more concurrent ones get a 503
+ASGI_LONG_POLL_THREADS = 4
+
 # Flask-SQLAlchemy settings
 SQLALCHEMY_TRACK_MODIFICATIONS = False
@@ -0,0 +1,139 @@
+"""Throughput of the ASGI serving mode against the WSGI app under concurrent clients.
+
+Both apps are called in process, without a server or network in between: the
+WSGI app by one thread per client, as a threaded WSGI server would, and the
+ASGI app by one task per client on a single event loop. Every client sends
+requests back to back until the total is reached.
+
+Usage:
+    python -m benchmarks.asgi_vs_wsgi --size 10000 --concurrency 100,250,500,1000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import inspect
+
+from app import db
+from app.asgi import create_asgi_app
+from app.cache import product_responses
+from app.commands.init_db import init_db
+from app.models.products import Product
+from benchmarks.run import seed
+
+
+def request_paths(size, count, route):
+	"""Returns count request paths with their query strings."""
+	paths = []
+	for i in range(count):
+		if route == 'list':
+			paths.append(('/products/', 'after=%d&limit=50' % random.randint(0, size)))
+		else:
+			paths.append(('/products/%d' % random.randint(1, size), ''))
+	return paths
+
+
+def run_wsgi(app, paths, concurrency):
+	"""Sends the requests to the WSGI app from concurrency threads and returns the requests per second."""
+	queue = iter(paths)
+
+	def client():
+		test_client = app.test_client()
+		for path, query_string in queue:
+			response = test_client.get(path, query_string=query_string)
+			assert response.status_code == 200, response.data
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(concurrency) as executor:
+		for future in [executor.submit(client) for _ in range(concurrency)]:
+			future.result()
+	return len(paths) / (time.perf_counter() - started)
+
+
+def run_asgi(asgi_app, paths, concurrency):
+	"""Sends the requests to the ASGI app from concurrency tasks and returns the requests per second."""
+	queue = iter(paths)
+
+	async def request(path, query_string):
+		messages = []
+
+		async def receive():
+			return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+		async def send(message):
+			messages.append(message)
+
+		await asgi_app({
+			'type': 'http', 'method': 'GET', 'path': path, 'query_string': query_string.encode(),
+			'headers': [], 'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80)
+		}, receive, send)
+		assert messages[0]['status'] == 200, messages[-1]['body']
+
+	async def client():
+		for path, query_string in queue:
+			await request(path, query_string)
+
+	async def main():
+		started = time.perf_counter()
+		await asyncio.gather(*[client() for _ in range(concurrency)])
+		elapsed = time.perf_counter() - started
+		await asgi_app.close()
+		return len(paths) / elapsed
+
+	return asyncio.run(main())
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--size', type=int, default=10000, help='number of seeded products')
+	parser.add_argument('--requests', type=int, default=2000, help='requests per run')
+	parser.add_argument('--concurrency', default='100,250,500,1000', help='comma separated client counts')
+	parser.add_argument('--routes', default='list,get', help='comma separated routes among list and get')
+	parser.add_argument('--database', help='SQLite file to use, a temporary file by default')
+	parser.add_argument('--output', help='file the JSON results are written to')
+	parser.add_argument('--seed', type=int, default=0, help='random seed')
+	args = parser.parse_args(argv)
+
+	random.seed(args.seed)
+	database = args.database or os.path.join(tempfile.mkdtemp(), 'bench.sqlite')
+	asgi_app = create_asgi_app(dict(
+		SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.abspath(database),
+		# Queued requests are expected to be slow at high concurrency
+		SLOW_REQUEST_THRESHOLD_MS=60000
+	))
+	app = asgi_app.app
+
+	with app.app_context():
+		if not inspect(db.engine).has_table('products') or Product.query.count() != args.size:
+			init_db()
+			seed(args.size)
+		db.session.remove()
+
+	results = {}
+	for route in args.routes.split(','):
+		for concurrency in [int(value) for value in args.concurrency.split(',')]:
+			paths = request_paths(args.size, args.requests, route)
+			# Every product is rendered from the database, not the response cache
+			product_responses.clear()
+			wsgi = run_wsgi(app, paths, concurrency)
+			product_responses.clear()
+			asgi = run_asgi(asgi_app, paths, concurrency)
+			results['%s_%d' % (route, concurrency)] = {'wsgi_rps': wsgi, 'asgi_rps': asgi}
+			print('%-5s %5d clients  WSGI %8.1f req/s  ASGI %8.1f req/s  (x%.2f)' % (
+				route, concurrency, wsgi, asgi, asgi / wsgi
+			))
+
+	if args.output:
+		with open(args.output, 'w') as output:
+			json.dump({'meta': vars(args), 'results': results}, output, indent=2, sort_keys=True)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,131 @@
+"""Throughput of stock reservations under concurrent checkouts of the same products.
+
+Compares ProductService.reserve_stock, one conditional UPDATE per line, with the
+read-modify-write a checkout had to do through update_product before it: load
+the product, decrement items_in_stock and commit, retrying when the version
+check finds a concurrent write. Every client thread reserves one item of a
+random hot product per request until the total is reached; the stock left is
+checked against the reservations made, so lost decrements would show.
+
+Usage:
+    python -m benchmarks.reservations --size 1000 --hot 10 --concurrency 1,8,32
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, inspect, select, update
+from sqlalchemy.orm.exc import StaleDataError
+
+from app import create_app, db, services
+from app.changes import product_changes
+from app.commands.init_db import init_db
+from app.models.products import Product
+from benchmarks.run import seed
+
+
+def reserve_conditional(product_id):
+	"""Reserves one item with a conditional update; returns the retries it took, always 0."""
+	result, = services.product.reserve_stock([(product_id, 1)])
+	assert result['status'] == 'reserved', result
+	return 0
+
+
+def reserve_read_modify_write(product_id):
+	"""Reserves one item by loading and updating the product; returns the retries it took."""
+	retries = 0
+	while True:
+		product = db.session.get(Product, product_id, populate_existing=True)
+		assert product.items_in_stock > 0
+		product.items_in_stock -= 1
+		product_changes.append(db.session, 'updated', [product_id])
+		try:
+			db.session.commit()
+			return retries
+		except StaleDataError:
+			db.session.rollback()
+			retries += 1
+
+
+def run(app, reserve, product_ids, requests, concurrency):
+	"""Sends the reservations from concurrency threads; returns the reservations per second and retries."""
+	queue = iter([random.choice(product_ids) for _ in range(requests)])
+	retries = []
+
+	def client():
+		with app.app_context():
+			try:
+				for product_id in queue:
+					retries.append(reserve(product_id))
+			finally:
+				db.session.remove()
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(concurrency) as executor:
+		for future in [executor.submit(client) for _ in range(concurrency)]:
+			future.result()
+	return requests / (time.perf_counter() - started), sum(retries)
+
+
+def stock(product_ids):
+	return db.session.execute(select(func.sum(Product.items_in_stock)).where(Product.id.in_(product_ids))).scalar()
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--size', type=int, default=1000, help='number of seeded products')
+	parser.add_argument('--hot', type=int, default=10, help='number of products all clients reserve')
+	parser.add_argument('--requests', type=int, default=2000, help='reservations per run')
+	parser.add_argument('--concurrency', default='1,8,32', help='comma separated client counts')
+	parser.add_argument('--database', help='SQLite file to use, a temporary file by default')
+	parser.add_argument('--output', help='file the JSON results are written to')
+	parser.add_argument('--seed', type=int, default=0, help='random seed')
+	args = parser.parse_args(argv)
+
+	random.seed(args.seed)
+	database = args.database or os.path.join(tempfile.mkdtemp(), 'bench.sqlite')
+	app = create_app(dict(
+		SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.abspath(database),
+		SLOW_REQUEST_THRESHOLD_MS=60000
+	))
+	with app.app_context():
+		if not inspect(db.engine).has_table('products') or Product.query.count() != args.size:
+			init_db()
+			seed(args.size)
+		product_ids = list(range(1, args.hot + 1))
+		db.session.remove()
+
+	results = {}
+	for concurrency in [int(value) for value in args.concurrency.split(',')]:
+		for name, reserve in (('conditional', reserve_conditional), ('read_modify_write', reserve_read_modify_write)):
+			with app.app_context():
+				db.session.execute(
+					update(Product).where(Product.id.in_(product_ids))
+					.values(items_in_stock=args.requests, version=Product.version + 1)
+				)
+				db.session.commit()
+				before = stock(product_ids)
+				db.session.remove()
+
+			rps, retries = run(app, reserve, product_ids, args.requests, concurrency)
+			with app.app_context():
+				lost = stock(product_ids) - (before - args.requests)
+				db.session.remove()
+			results['%s_%d' % (name, concurrency)] = {'rps': rps, 'retries': retries, 'lost_decrements': lost}
+			print('%-17s %4d clients  %8.1f reservations/s  %6d retries  %d lost' % (
+				name, concurrency, rps, retries, lost
+			))
+
+	if args.output:
+		with open(args.output, 'w') as output:
+			json.dump({'meta': vars(args), 'results': results}, output, indent=2, sort_keys=True)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,264 @@
+"""Benchmarks of the products API and service layer.
+
+Seeds an SQLite database with the factories of tests/factories.py, measures
+latency percentiles, throughput and queries per request of the hot paths and
+writes the results as JSON.
+
+Usage:
+    python -m benchmarks.run --size 1000 --output bench.json
+    python -m benchmarks.run --size 100000 --database /tmp/bench.sqlite --compare bench.json
+    python -m benchmarks.run --thresholds benchmarks/thresholds.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import factory
+from flask import json as flask_json, url_for
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import selectinload
+
+from app import create_app, db, services
+from app.cache import product_responses
+from app.commands.init_db import init_db
+from app.models.products import Brand, Category, Product, products_categories
+from app.read_model import product_documents
+from app.serializers import product_serializer
+from app.settings import TIME_FORMAT
+from tests.databases import restore, template
+from tests.factories import BrandFactory, CategoryFactory, ProductFactory
+
+SEED_CHUNK_SIZE = 10000
+PERCENTILES = (50, 90, 95, 99)
+
+
+class QueryCounter:
+	"""Counts the statements executed on the given engines."""
+
+	def __init__(self, *engines):
+		self.count = 0
+		for engine in engines:
+			event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+
+	def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+		self.count += 1
+
+
+def seed(size, brands_count=50, categories_count=20):
+	"""Inserts size products built by ProductFactory, in chunks of SEED_CHUNK_SIZE rows, and their documents."""
+	brands = factory.build_batch(dict, brands_count, FACTORY_CLASS=BrandFactory)
+	categories = factory.build_batch(dict, categories_count, FACTORY_CLASS=CategoryFactory)
+	db.session.execute(Brand.__table__.insert(), brands)
+	db.session.execute(Category.__table__.insert(), categories)
+	brand_ids = [id for id, in db.session.query(Brand.id)]
+	category_ids = [id for id, in db.session.query(Category.id)]
+
+	for start in range(0, size, SEED_CHUNK_SIZE):
+		count = min(SEED_CHUNK_SIZE, size - start)
+		products = factory.build_batch(
+			dict, count, FACTORY_CLASS=ProductFactory,
+			brand_id=factory.Iterator(brand_ids), categories=None
+		)
+		links = []
+		for offset, product in enumerate(products):
+			product['id'] = start + offset + 1
+			del product['categories']
+			links += [
+				{'product_id': product['id'], 'category_id': category_id}
+				for category_id in random.sample(category_ids, random.randint(1, 5))
+			]
+		db.session.execute(Product.__table__.insert(), products)
+		db.session.execute(products_categories.insert(), links)
+		db.session.commit()
+	product_documents.rebuild()
+
+
+def product_payload(brand_id, category_ids):
+	return {
+		'name': 'bench',
+		'rating': round(random.uniform(0, 10), 1),
+		'featured': False,
+		'expiration_date': (datetime.datetime.utcnow() + datetime.timedelta(days=365)).strftime(TIME_FORMAT),
+		'items_in_stock': random.randint(1, 100),
+		'receipt_date': datetime.datetime.utcnow().strftime(TIME_FORMAT),
+		'brand_id': brand_id,
+		'categories': random.sample(category_ids, 2)
+	}
+
+
+def measure(name, iterations, counter, operation):
+	"""Runs operation iterations times and returns its latency and query statistics."""
+	durations = []
+	queries = 0
+	for i in range(iterations):
+		before = counter.count
+		started = time.perf_counter()
+		operation(i)
+		durations.append(time.perf_counter() - started)
+		queries += counter.count - before
+
+	durations.sort()
+	result = {
+		'iterations': iterations,
+		'mean_ms': sum(durations) / iterations * 1000,
+		'max_ms': durations[-1] * 1000,
+		'throughput_per_s': iterations / sum(durations),
+		'queries_per_request': queries / iterations
+	}
+	for percentile in PERCENTILES:
+		index = min(iterations - 1, int(round(percentile / 100 * iterations)) - 1)
+		result['p%s_ms' % percentile] = durations[max(index, 0)] * 1000
+	print('%-20s p50 %8.3f ms  p95 %8.3f ms  %9.1f ops/s  %6.2f queries' % (
+		name, result['p50_ms'], result['p95_ms'], result['throughput_per_s'], result['queries_per_request']
+	))
+	return result
+
+
+def run_benchmarks(app, size, iterations):
+	client = app.test_client()
+	counter = QueryCounter(db.engine, *db.get_read_engines(app))
+	brand_ids = [id for id, in db.session.query(Brand.id)]
+	category_ids = [id for id, in db.session.query(Category.id)]
+	created_ids = []
+
+	def check(response):
+		assert response.status_code == 200, response.data
+		return response
+
+	def list_products(i):
+		check(client.get(url_for('products.get_products', after=random.randint(0, size), limit=50)))
+
+	def get_product(i):
+		id = random.randint(1, size)
+		product_responses.invalidate(id)
+		check(client.get(url_for('products.get_product', id=id)))
+
+	def get_cached_product(i):
+		check(client.get(url_for('products.get_product', id=1)))
+
+	# Served from the response cache from the first measured request on; with the in-process
+	# backend every hit still checks the product version with one primary-key query
+	get_cached_product(None)
+
+	def create_product(i):
+		response = check(client.post(
+			url_for('products.create_product'), json=product_payload(random.choice(brand_ids), category_ids)
+		))
+		created_ids.append(json.loads(response.data)['id'])
+
+	def update_product(i):
+		check(client.put(
+			url_for('products.update_product', id=created_ids[i]),
+			json=product_payload(random.choice(brand_ids), category_ids)
+		))
+
+	def delete_product(i):
+		check(client.delete(url_for('products.delete_product', id=created_ids[i])))
+
+	def serialize_page(i):
+		product_serializer.render_many(rows, category_ids)
+
+	def serialize_page_property(i):
+		flask_json.dumps([product.serialized for product in page])
+
+	results = {
+		'list': measure('list', iterations, counter, list_products),
+		'get': measure('get', iterations, counter, get_product),
+		'get_cached': measure('get_cached', iterations, counter, get_cached_product),
+		'create': measure('create', iterations, counter, create_product),
+		'update': measure('update', iterations, counter, update_product),
+		'delete': measure('delete', iterations, counter, delete_product)
+	}
+	# Loaded after the writes, which expire every instance of the session
+	rows, _ = services.product.get_products(limit=50)
+	category_ids = services.product.get_category_ids([row.id for row in rows])
+	page = Product.query.options(selectinload(Product.categories)).filter(Product.id.in_(category_ids)).all()
+	# Brands and categories of the page are in the reference cache from the first measured render on
+	serialize_page(None)
+	results['serializer'] = measure('serializer', iterations, counter, serialize_page)
+	results['serialized_property'] = measure('serialized_property', iterations, counter, serialize_page_property)
+	return results
+
+
+def check_thresholds(results, thresholds):
+	"""Returns a message for every metric above its threshold."""
+	failures = []
+	for name, limits in thresholds.items():
+		for metric, limit in limits.items():
+			value = results.get(name, {}).get(metric)
+			if value is not None and value > limit:
+				failures.append('%s %s is %.3f, threshold is %.3f' % (name, metric, value, limit))
+	return failures
+
+
+def print_comparison(results, previous):
+	for name, result in results.items():
+		before = previous.get(name)
+		if before is None:
+			continue
+		change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+		print('%-20s p95 %8.3f ms -> %8.3f ms (%+.1f%%)' % (name, before['p95_ms'], result['p95_ms'], change))
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--size', type=int, default=1000, help='number of seeded products')
+	parser.add_argument('--iterations', type=int, default=200, help='requests per benchmark')
+	parser.add_argument('--database', help='SQLite file to use, an in-memory database by default')
+	parser.add_argument('--output', help='file the JSON results are written to')
+	parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+	parser.add_argument('--thresholds', help='JSON file of {benchmark: {metric: maximum}}')
+	parser.add_argument('--seed', type=int, default=0, help='random seed')
+	args = parser.parse_args(argv)
+
+	random.seed(args.seed)
+	database_uri = 'sqlite:///' + os.path.abspath(args.database) if args.database else 'sqlite:///:memory:'
+	app = create_app(dict(SQLALCHEMY_DATABASE_URI=database_uri, SERVER_NAME='localhost'))
+
+	def build():
+		init_db()
+		started = time.perf_counter()
+		seed(args.size)
+		print('Seeded %s products in %.1f s' % (args.size, time.perf_counter() - started))
+
+	with app.app_context():
+		if not args.database:
+			# The in-memory database is restored from the template seeded by the first run of the same size and seed
+			restore(template('bench-%d-%d' % (args.size, args.seed), build))
+		# A file database that already holds the catalog is reused as is
+		elif not inspect(db.engine).has_table('products') or Product.query.count() != args.size:
+			build()
+		results = run_benchmarks(app, args.size, args.iterations)
+
+	report = {
+		'meta': {
+			'size': args.size,
+			'iterations': args.iterations,
+			'python': platform.python_version(),
+			'timestamp': datetime.datetime.utcnow().strftime(TIME_FORMAT)
+		},
+		'results': results
+	}
+	if args.output:
+		with open(args.output, 'w') as output:
+			json.dump(report, output, indent=2, sort_keys=True)
+	if args.compare:
+		with open(args.compare) as previous:
+			print_comparison(results, json.load(previous)['results'])
+	if args.thresholds:
+		with open(args.thresholds) as thresholds:
+			failures = check_thresholds(results, json.load(thresholds))
+		for failure in failures:
+			print('FAILED: ' + failure)
+		if failures:
+			return 1
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,103 @@
+"""Per-request cost of validating POST /products and PUT /products/<id> payloads.
+
+Compares the validation stage before the fast path, flask_pydantic.validate
+followed by the strptime calls of the endpoint and the service, with
+app.endpoints.validation.validate_body, which parses every field once. Both
+run in a request context of the same payload, without the database work of the
+endpoints.
+
+Usage:
+    python -m benchmarks.validation --iterations 20000
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+from flask import request
+from flask_pydantic import validate
+from pydantic import BaseModel, conint, conlist, constr
+
+from app import create_app
+from app.endpoints.products import validate_expiration_date
+from app.endpoints.validation import validate_body
+from app.schemas.product import ProductCreate
+from app.settings import MAX_CATEGORIES_COUNT, MIN_CATEGORIES_COUNT, TIME_FORMAT
+
+PAYLOAD = {
+	'name': 'Product',
+	'rating': 7.5,
+	'featured': False,
+	'expiration_date': '2099-04-23T18:25:43Z',
+	'items_in_stock': 10,
+	'receipt_date': '2012-04-23T18:25:43Z',
+	'brand_id': 1,
+	'categories': [1, 2, 3]
+}
+
+
+class LegacyProductCreate(BaseModel):
+	"""ProductCreate as it was before the fast path: dates went through the pydantic parser."""
+	name: constr(min_length=1, max_length=50)
+	rating: float
+	featured: bool = None
+	expiration_date: datetime
+	items_in_stock: conint(gt=0, lt=9223372036854775807)
+	receipt_date: datetime
+	brand_id: int
+	categories: conlist(int, min_items=MIN_CATEGORIES_COUNT, max_items=MAX_CATEGORIES_COUNT)
+
+
+@validate(body=LegacyProductCreate)
+def legacy_view():
+	product_dict = dict(request.get_json())
+	# The endpoint check of the expiration date
+	if datetime.strptime(product_dict['expiration_date'], TIME_FORMAT) < datetime.now() + timedelta(days=30):
+		raise ValueError(product_dict['expiration_date'])
+	# The service parsing the dates again
+	product_dict['receipt_date'] = datetime.strptime(product_dict['receipt_date'], TIME_FORMAT)
+	product_dict['expiration_date'] = datetime.strptime(product_dict['expiration_date'], TIME_FORMAT)
+	return product_dict
+
+
+@validate_body(ProductCreate)
+def fast_path_view():
+	validate_expiration_date(request.body_params)
+	return request.body_params.dict(exclude_none=True)
+
+
+def measure(app, view, iterations):
+	"""Returns the mean microseconds per call of view in a request context of PAYLOAD."""
+	with app.test_request_context('/products', method='POST', json=PAYLOAD):
+		request.get_json()
+		view()
+		started = time.perf_counter()
+		for _ in range(iterations):
+			view()
+		return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--iterations', type=int, default=20000, help='validations per measure')
+	parser.add_argument('--output', help='file the JSON results are written to')
+	args = parser.parse_args(argv)
+
+	app = create_app(dict(SQLALCHEMY_DATABASE_URI='sqlite:///:memory:'))
+	results = {
+		'before_us': measure(app, legacy_view, args.iterations),
+		'after_us': measure(app, fast_path_view, args.iterations)
+	}
+	print('before %6.1f us/request  after %6.1f us/request  (x%.2f)' % (
+		results['before_us'], results['after_us'], results['before_us'] / results['after_us']
+	))
+
+	if args.output:
+		with open(args.output, 'w') as output:
+			json.dump({'meta': vars(args), 'results': results}, output, indent=2, sort_keys=True)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
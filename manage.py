@@ -7,16 +7,35 @@ Use "python manage.py runserver" to start the development web server on localhos
 Use "python manage.py runserver --help" for a list of runserver options.
 """
 
-from flask_migrate import MigrateCommand
+import sys
+
 from flask_script import Manager
 
 from app import create_app
-from app.commands import InitDbCommand
+from app.commands import (
+    EnqueueJobCommand, ImportCatalogCommand, InitDbCommand, LazyManagerCommand, PruneChangesCommand,
+    RebuildReadModelCommand, StartupProfileCommand, SyncReplicasCommand, WorkerCommand, setup_migrate
+)
+
+
+def create_manage_app():
+    # runserver serves requests, the other commands only need the lightweight CLI profile
+    return create_app(profile='web' if sys.argv[1:2] == ['runserver'] else 'cli')
+
 
 # Setup Flask-Script with command line commands
-manager = Manager(create_app)
-manager.add_command('db', MigrateCommand)
+manager = Manager(create_manage_app)
+manager.add_command('db', LazyManagerCommand(
+    'flask_migrate:MigrateCommand', help='Perform database migrations', setup=setup_migrate
+))
 manager.add_command('init_db', InitDbCommand)
+manager.add_command('import_catalog', ImportCatalogCommand)
+manager.add_command('rebuild_read_model', RebuildReadModelCommand)
+manager.add_command('prune_changes', PruneChangesCommand)
+manager.add_command('sync_replicas', SyncReplicasCommand)
+manager.add_command('enqueue_job', EnqueueJobCommand)
+manager.add_command('worker', WorkerCommand)
+manager.add_command('startup_profile', StartupProfileCommand)
 
 if __name__ == "__main__":
     # python manage.py                      # shows available commands
@@ -1,4 +1,6 @@
 from __future__ import with_statement
+import re
+
 from alembic import context
 from sqlalchemy import engine_from_config, pool
 from logging.config import fileConfig
@@ -21,6 +23,16 @@ from flask import current_app
 config.set_main_option('sqlalchemy.url', current_app.config.get('SQLALCHEMY_DATABASE_URI'))
 target_metadata = current_app.extensions['migrate'].db.metadata
 
+# Tables that are not models: the products_fts search index and its FTS5 shadow
+# tables (see app.models.products), and sqlite_sequence of AUTOINCREMENT keys
+UNMANAGED_TABLES = re.compile(r'^(products_fts(_(data|idx|content|docsize|config))?|sqlite_sequence)$')
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Leave the unmanaged tables out of autogenerate, which would drop them."""
+    return not (type_ == 'table' and reflected and compare_to is None and UNMANAGED_TABLES.match(name))
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -40,7 +52,7 @@ def run_migrations_offline():
 
     """
     url = config.get_main_option("sqlalchemy.url")
-    context.configure(url=url)
+    context.configure(url=url, include_object=include_object)
 
     with context.begin_transaction():
         context.run_migrations()
@@ -60,6 +72,7 @@ def run_migrations_online():
     connection = engine.connect()
     context.configure(connection=connection,
                       target_metadata=target_metadata,
+                      include_object=include_object,
                       **current_app.extensions['migrate'].configure_args)
 
     try:
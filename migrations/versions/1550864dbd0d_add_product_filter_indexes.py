@@ -0,0 +1,33 @@
+"""add product filter indexes
+
+Revision ID: 1550864dbd0d
+Revises: 4dcfffdb9465
+Create Date: 2026-10-18 10:03:54.218604
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1550864dbd0d'
+down_revision = '4dcfffdb9465'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_index('ix_products_brand_id_rating', 'products', ['brand_id', 'rating'])
+    op.create_index('ix_products_featured_rating', 'products', ['featured', 'rating'])
+    op.create_index('ix_products_rating_id', 'products', ['rating', 'id'])
+    op.create_index('ix_products_expiration_date', 'products', ['expiration_date'])
+    op.create_index('ix_products_items_in_stock', 'products', ['items_in_stock'])
+    op.create_index('ix_products_categories_category_id_product_id', 'products_categories',
+                    ['category_id', 'product_id'])
+
+
+def downgrade():
+    op.drop_index('ix_products_categories_category_id_product_id', table_name='products_categories')
+    op.drop_index('ix_products_items_in_stock', table_name='products')
+    op.drop_index('ix_products_expiration_date', table_name='products')
+    op.drop_index('ix_products_rating_id', table_name='products')
+    op.drop_index('ix_products_featured_rating', table_name='products')
+    op.drop_index('ix_products_brand_id_rating', table_name='products')
@@ -0,0 +1,23 @@
+"""add products.version
+
+Revision ID: 3b8e5f1c2a47
+Revises: dc9a44043f59
+Create Date: 2026-10-18 16:41:52.130918
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3b8e5f1c2a47'
+down_revision = 'dc9a44043f59'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('products', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,24 @@
+"""add products.updated_at
+
+Revision ID: 4dcfffdb9465
+Revises: 75a6545b696a
+Create Date: 2026-10-18 09:12:31.402117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4dcfffdb9465'
+down_revision = '75a6545b696a'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('products', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute('UPDATE products SET updated_at = created_at')
+
+
+def downgrade():
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,34 @@
+"""add product_read_model
+
+Revision ID: 55fc2bd26c7f
+Revises: e716ee0fa838
+Create Date: 2026-10-18 16:32:10.418207
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '55fc2bd26c7f'
+down_revision = 'e716ee0fa838'
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from app.read_model import product_documents
+
+
+def upgrade():
+    op.create_table('product_read_model',
+        sa.Column('product_id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('document', sa.UnicodeText(), nullable=False),
+        sa.Column('version', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id')
+    )
+    # render the documents of the existing products
+    session = Session(bind=op.get_bind())
+    product_documents.rebuild(session)
+    session.close()
+
+
+def downgrade():
+    op.drop_table('product_read_model')
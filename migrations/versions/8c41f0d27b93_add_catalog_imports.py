@@ -0,0 +1,30 @@
+"""add catalog_imports
+
+Revision ID: 8c41f0d27b93
+Revises: 3b8e5f1c2a47
+Create Date: 2026-10-18 19:12:40.518372
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '8c41f0d27b93'
+down_revision = '3b8e5f1c2a47'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('catalog_imports',
+        sa.Column('checkpoint', sa.Unicode(length=1024), nullable=False),
+        sa.Column('path', sa.Unicode(length=1024), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('mtime_ns', sa.BigInteger(), nullable=False),
+        sa.Column('consumed', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('checkpoint')
+    )
+
+
+def downgrade():
+    op.drop_table('catalog_imports')
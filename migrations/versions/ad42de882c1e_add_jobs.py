@@ -0,0 +1,39 @@
+"""add jobs
+
+Revision ID: ad42de882c1e
+Revises: 55fc2bd26c7f
+Create Date: 2026-10-18 16:22:19.244730
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'ad42de882c1e'
+down_revision = '55fc2bd26c7f'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.Unicode(length=50), nullable=False),
+        sa.Column('params', sa.UnicodeText(), nullable=False),
+        sa.Column('status', sa.Unicode(length=10), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('error', sa.UnicodeText(), nullable=True),
+        sa.Column('after_id', sa.Integer(), nullable=False),
+        sa.Column('processed', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('locked_until', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_jobs_status_run_after', 'jobs', ['status', 'run_after'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_jobs_status_run_after', table_name='jobs')
+    op.drop_table('jobs')
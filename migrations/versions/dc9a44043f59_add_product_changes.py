@@ -0,0 +1,30 @@
+"""add product_changes
+
+Revision ID: dc9a44043f59
+Revises: ad42de882c1e
+Create Date: 2026-10-18 16:23:35.621690
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'dc9a44043f59'
+down_revision = 'ad42de882c1e'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    # Changes are recorded from this revision on; consumers start with a full export
+    op.create_table('product_changes',
+        sa.Column('seq', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('operation', sa.Unicode(length=10), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('seq'),
+        sqlite_autoincrement=True
+    )
+
+
+def downgrade():
+    op.drop_table('product_changes')
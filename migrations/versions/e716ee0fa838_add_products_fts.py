@@ -0,0 +1,51 @@
+"""add products_fts full-text index
+
+Revision ID: e716ee0fa838
+Revises: 1550864dbd0d
+Create Date: 2026-10-18 10:41:07.512930
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'e716ee0fa838'
+down_revision = '1550864dbd0d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def fts5_available(bind):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return any(option == 'ENABLE_FTS5' for option, in bind.execute('PRAGMA compile_options'))
+
+
+def upgrade():
+    # Other engines fall back to LIKE matching in ProductService.search_products
+    if not fts5_available(op.get_bind()):
+        return
+
+    op.execute("""CREATE VIRTUAL TABLE products_fts
+        USING fts5(name, content='products', content_rowid='id', prefix='2 3')""")
+    op.execute("""CREATE TRIGGER products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+    END""")
+    op.execute("""CREATE TRIGGER products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""")
+    op.execute("""CREATE TRIGGER products_fts_update AFTER UPDATE OF id, name ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO products_fts(rowid, name) VALUES (new.id, new.name);
+    END""")
+    # index the existing products
+    op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+
+    op.execute('DROP TRIGGER IF EXISTS products_fts_update')
+    op.execute('DROP TRIGGER IF EXISTS products_fts_delete')
+    op.execute('DROP TRIGGER IF EXISTS products_fts_insert')
+    op.execute('DROP TABLE IF EXISTS products_fts')
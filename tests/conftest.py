@@ -1,28 +1,31 @@
+import random
+
 import pytest
 from app import create_app, db as the_db
 
 # Initialize the Flask-App with test-specific settings
 from app.models.products import Product
 from app.services.products_service import ProductService
+from tests.databases import restore, template
 from tests.factories import ProductFactory, BrandFactory, CategoryFactory
 
+# Products of the template restored by the catalog fixture
+CATALOG_SIZE = 5000
+
 the_app = create_app(dict(
 	TESTING=True,  # Propagate exceptions
 	LOGIN_DISABLED=False,  # Enable @register_required
 	MAIL_SUPPRESS_SEND=True,  # Disable Flask-Mail send
 	SERVER_NAME='localhost',  # Enable url_for() without request context
-	SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',  # In-memory SQLite DB
+	SQLALCHEMY_DATABASE_URI='sqlite:///:memory:',  # In-memory SQLite DB, one per test process
 	WTF_CSRF_ENABLED=False,  # Disable CSRF form validation
 ))
 
 # Setup an application context (since the tests run outside of the webserver context)
 the_app.app_context().push()
 
-# Create and populate roles and users tables
 from app.commands.init_db import init_db
 
-init_db()
-
 
 @pytest.fixture(scope='session')
 def app():
@@ -36,6 +39,38 @@ def db():
 	return the_db
 
 
+@pytest.fixture(scope='session')
+def empty_template():
+	""" Path of the template database with the tables and no rows. """
+	return template('empty', init_db)
+
+
+@pytest.fixture(scope='session')
+def catalog_template():
+	""" Path of the template database with CATALOG_SIZE products, built by the benchmarks seed. """
+	from benchmarks.run import seed
+
+	def build():
+		init_db()
+		random.seed(0)
+		seed(CATALOG_SIZE)
+
+	return template('catalog-%d' % CATALOG_SIZE, build)
+
+
+@pytest.fixture(autouse=True)
+def database(empty_template):
+	""" Gives every test the empty database, so tests do not depend on the data of others or on their order. """
+	restore(empty_template)
+
+
+@pytest.fixture
+def catalog(database, catalog_template):
+	""" Gives the test the database with CATALOG_SIZE products instead of the empty one. """
+	restore(catalog_template)
+	return CATALOG_SIZE
+
+
 @pytest.fixture(scope='function')
 def session(db, request):
 	"""Creates a new database session for a test."""
@@ -0,0 +1,101 @@
+"""Template databases that tests and benchmarks restore instead of building them again.
+
+A template is an SQLite file snapshot of the app database, built once by a build
+function and shared by every test process through TEMPLATE_DIRECTORY. Its file
+name holds a hash of the schema and of the source of the modules the rows come
+from, so changing the models, their DDL events or the code of the build function
+builds it again.
+Restoring a template copies it into the database of the current app with the
+SQLite backup API. Each test process, e.g. every pytest-xdist worker, restores
+into its own in-memory database, so processes never share one.
+"""
+import fcntl
+import hashlib
+import inspect
+import os
+import sqlite3
+
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from app import db
+from app.cache import analytics_responses, product_responses, reference_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_DIRECTORY = os.path.join(ROOT, '.pytest_cache', 'd', 'db-templates')
+
+
+def schema_hash():
+	"""Returns a hash of the DDL of the tables and indexes of the models."""
+	ddl = []
+	for table in db.metadata.sorted_tables:
+		ddl.append(str(CreateTable(table).compile(db.engine)))
+		ddl += sorted(str(CreateIndex(index).compile(db.engine)) for index in table.indexes)
+	return hashlib.sha1('\n'.join(ddl).encode()).hexdigest()[:12]
+
+
+def source_hash(build):
+	"""Returns a hash of the project modules that build and the models are defined in, and of those build refers to.
+
+	These hold what the DDL does not show: the DDL events of the models, e.g. the
+	products_fts triggers, and the functions build calls, such as init_db and the
+	benchmarks seed.
+	"""
+	code = build.__code__
+	closure = [cell.cell_contents for cell in build.__closure__ or ()]
+	referenced = [build.__globals__[name] for name in code.co_names if name in build.__globals__]
+	modules = {inspect.getmodule(value) for value in [build] + closure + referenced}
+	modules |= {inspect.getmodule(mapper.class_) for mapper in db.Model.registry.mappers}
+	files = sorted({
+		module.__file__ for module in modules
+		if getattr(module, '__file__', None) and os.path.abspath(module.__file__).startswith(ROOT + os.sep)
+	})
+	digest = hashlib.sha1()
+	for path in files:
+		with open(path, 'rb') as source:
+			digest.update(source.read())
+	return digest.hexdigest()[:12]
+
+
+def template(name, build, directory=TEMPLATE_DIRECTORY):
+	"""Returns the path of the template name, built the first time by calling build on an empty app database.
+
+	Concurrent processes wait for the one building the template instead of building it too.
+	"""
+	os.makedirs(directory, exist_ok=True)
+	path = os.path.join(directory, '%s-%s-%s.sqlite' % (name, schema_hash(), source_hash(build)))
+	with open(path + '.lock', 'w') as lock:
+		fcntl.flock(lock, fcntl.LOCK_EX)
+		if not os.path.exists(path):
+			db.session.remove()
+			db.drop_all()
+			build()
+			db.session.remove()
+			snapshot(path + '.tmp')
+			os.replace(path + '.tmp', path)
+	return path
+
+
+def snapshot(path):
+	"""Copies the app database to the SQLite file path."""
+	connection = db.engine.raw_connection()
+	try:
+		target = sqlite3.connect(path)
+		connection.driver_connection.backup(target)
+		target.close()
+	finally:
+		connection.close()
+
+
+def restore(path):
+	"""Replaces the app database with a copy of the SQLite file path and empties the caches of its rows."""
+	db.session.remove()
+	connection = db.engine.raw_connection()
+	try:
+		source = sqlite3.connect('file:%s?mode=ro' % path, uri=True)
+		source.backup(connection.driver_connection)
+		source.close()
+	finally:
+		connection.close()
+	reference_cache.clear()
+	product_responses.clear()
+	analytics_responses.clear()
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import url_for, json
+from sqlalchemy import event
+
+from app import services
+from app.cache import product_generation
+
+from tests.factories import ProductFactory, BrandFactory, CategoryFactory
+
+
+@pytest.fixture
+def created(db):
+	"""Collects the rows a test creates and deletes them afterwards, later tests expect empty tables."""
+	instances = []
+	yield instances
+	for instance in reversed(instances):
+		db.session.delete(instance)
+	db.session.commit()
+
+
+def get_analytics(client, **args):
+	response = client.get(url_for("analytics.get_product_analytics", **args))
+	assert response.status_code == 200
+	return json.loads(response.data)
+
+
+class TestAnalytics:
+	def test_should_aggregate_stock_and_ratings(self, client, db, created):
+		brand, category = BrandFactory(), CategoryFactory()
+		created.extend([brand, category] + [
+			ProductFactory(brand=brand, categories=[category], rating=rating, items_in_stock=items_in_stock)
+			for rating, items_in_stock in ((7.5, 3), (7, 4), (9, 5))
+		])
+		db.session.commit()
+		product_generation.bump()
+
+		analytics = get_analytics(client)
+		assert {'brand_id': brand.id, 'name': brand.name, 'products': 3, 'items_in_stock': 12} in \
+			analytics['stock_per_brand']
+		assert {'category_id': category.id, 'name': category.name, 'ratings': [
+			{'rating': 7, 'products': 2}, {'rating': 9, 'products': 1}
+		]} in analytics['rating_distribution_per_category']
+		featured = analytics['featured']
+		assert featured['share'] == featured['featured'] / featured['products']
+
+	def test_should_count_negative_ratings_by_their_floor(self, client, db, created):
+		brand, category = BrandFactory(), CategoryFactory()
+		created.extend([brand, category] + [
+			ProductFactory(brand=brand, categories=[category], rating=rating)
+			for rating in (-0.5, -1, 0.5)
+		])
+		db.session.commit()
+		product_generation.bump()
+
+		analytics = get_analytics(client)
+		assert {'category_id': category.id, 'name': category.name, 'ratings': [
+			{'rating': -1, 'products': 2}, {'rating': 0, 'products': 1}
+		]} in analytics['rating_distribution_per_category']
+
+	def test_should_count_products_expiring_within_days(self, client, db, created):
+		before = get_analytics(client, expiring_within_days=10)['expiration']['expiring']
+		brand = BrandFactory()
+		created.extend([brand] + [
+			ProductFactory(brand=brand, expiration_date=datetime.utcnow() + timedelta(days=days), items_in_stock=2)
+			for days in (5, 20)
+		])
+		db.session.commit()
+		product_generation.bump()
+
+		after = get_analytics(client, expiring_within_days=10)['expiration']['expiring']
+		assert after == {'products': before['products'] + 1, 'items_in_stock': before['items_in_stock'] + 2}
+
+	def test_should_return_400_on_invalid_days(self, client):
+		response = client.get(url_for("analytics.get_product_analytics", expiring_within_days='x'))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'expiring_within_days'
+
+	def test_should_cache_analytics_until_products_change(self, client, db, created):
+		brand = BrandFactory()
+		product = ProductFactory(brand=brand, categories=[])
+		created.append(brand)
+		db.session.commit()
+		first = client.get(url_for("analytics.get_product_analytics"))
+
+		statements = []
+
+		def count(conn, cursor, statement, *args):
+			statements.append(statement)
+
+		event.listen(db.engine, 'before_cursor_execute', count)
+		try:
+			second = client.get(url_for("analytics.get_product_analytics"))
+			assert statements == []
+			assert second.data == first.data
+			assert client.get(
+				url_for("analytics.get_product_analytics"), headers={'If-None-Match': first.headers['ETag']}
+			).status_code == 304
+		finally:
+			event.remove(db.engine, 'before_cursor_execute', count)
+
+		services.product.delete_product(product.id)
+		assert client.get(url_for("analytics.get_product_analytics")).data != first.data
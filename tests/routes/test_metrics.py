@@ -0,0 +1,35 @@
+from flask import url_for
+
+from app.instrumentation import RequestStats
+
+
+class TestMetrics:
+	def test_responses_should_have_server_timing(self, client):
+		response = client.get(url_for("products.get_products"))
+		server_timing = response.headers['Server-Timing']
+		assert 'db;dur=' in server_timing
+		assert 'serialize;dur=' in server_timing
+		assert 'total;dur=' in server_timing
+
+	def test_get_metrics_should_render_prometheus_text(self, client):
+		client.get(url_for("products.get_products"))
+		response = client.get(url_for("metrics.get_metrics"))
+		text = response.data.decode()
+		assert response.status_code == 200
+		assert response.mimetype == 'text/plain'
+		assert 'http_requests_total{endpoint="products.get_products",method="GET",status="200"}' in text
+		assert 'db_queries_total{endpoint="products.get_products"}' in text
+		assert 'cache_hits_total{cache="reference"}' in text
+
+	def test_slow_requests_should_be_logged(self, app, client, caplog, monkeypatch):
+		from app.instrumentation import instrumentation
+		monkeypatch.setattr(instrumentation, 'slow_request_threshold', 0)
+		client.get(url_for("products.get_products"))
+		assert any('Slow request GET' in record.getMessage() and 'SELECT' in record.getMessage()
+			for record in caplog.records)
+
+	def test_slowest_statements_should_keep_slowest_of_long_requests(self):
+		stats = RequestStats()
+		for duration in (0.3, 0.1, 0.5, 0.2, 0.9, 0.4):
+			stats.add_statement(duration, 'SELECT %s' % duration, 3)
+		assert stats.slowest_statements == [(0.9, 'SELECT 0.9'), (0.5, 'SELECT 0.5'), (0.4, 'SELECT 0.4')]
@@ -1,7 +1,20 @@
+import gzip
+import time
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
+
+import pytest
 from flask import url_for, json
+from sqlalchemy import event, func, update
+from sqlalchemy.orm.exc import StaleDataError
 
-from app.models.products import Product
-from app.settings import MAX_CATEGORIES_COUNT, MIN_CATEGORIES_COUNT
+from app import services
+from app.cache import product_responses
+from app.changes import product_changes
+from app.endpoints.encoding import response_encoder
+from app.models.products import Product, ProductChange
+from app.schemas.product import ProductUpdate
+from app.settings import MAX_CATEGORIES_COUNT, MIN_CATEGORIES_COUNT, MAX_PAGE_SIZE, TIME_FORMAT
 
 from tests.factories import ProductFactory, BrandFactory, CategoryFactory
 
@@ -129,6 +142,28 @@ class TestProducts:
 		assert 'error' not in response_dict
 		assert response_dict['featured'] == True
 
+	def test_create_product_should_store_dates_in_utc(self, db, product_request, client):
+		brand = BrandFactory()
+		category = CategoryFactory()
+		db.session.commit()
+
+		expiration_date = (datetime.utcnow() + timedelta(days=365)).replace(microsecond=0)
+		product_request['brand_id'] = brand.id
+		product_request['categories'] = [category.id]
+		product_request['receipt_date'] = '2012-04-23T20:25:43+02:00'
+		product_request['expiration_date'] = (expiration_date + timedelta(hours=2)).isoformat() + '+02:00'
+
+		response = client.post(url_for("products.create_product"), json=product_request)
+		assert response.status_code == 200
+		product = Product.query.get(json.loads(response.data)['id'])
+		assert product.receipt_date == datetime(2012, 4, 23, 18, 25, 43)
+		assert product.expiration_date == expiration_date
+
+	def test_create_product_with_non_object_body_should_raise_400(self, client):
+		response = client.post(url_for("products.create_product"), json=[1])
+		assert response.status_code == 400
+		assert 'body_params' in json.loads(response.data)['validation_error']
+
 	def test_update_product_just_do_it(self, db, product_request, client):
 		product, brand, category = self.create_product(db)
 
@@ -183,6 +218,585 @@ class TestProducts:
 		assert response_dict['id'] == product.id
 		assert removed_product is None
 
+	def test_get_products_should_paginate_by_cursor(self, db, client):
+		products = [self.create_product(db)[0] for _ in range(3)]
+		after = products[0].id - 1
+
+		response = client.get(url_for("products.get_products", after=after, limit=2))
+		first_page = json.loads(response.data)
+		assert response.status_code == 200
+		assert [p['id'] for p in first_page['results']] == [products[0].id, products[1].id]
+		assert first_page['next'] == products[1].id
+
+		response = client.get(url_for("products.get_products", after=first_page['next'], limit=2))
+		second_page = json.loads(response.data)
+		assert [p['id'] for p in second_page['results']] == [products[2].id]
+		assert second_page['next'] is None
+
+	def test_get_products_query_count_should_not_depend_on_page_size(self, db, client):
+		for _ in range(5):
+			self.create_product(db)
+
+		statements = []
+
+		def count(conn, cursor, statement, parameters, context, executemany):
+			statements.append(statement)
+
+		client.get(url_for("products.get_products", limit=5))
+		event.listen(db.engine, 'before_cursor_execute', count)
+		try:
+			client.get(url_for("products.get_products", limit=1))
+			small_page_count = len(statements)
+			del statements[:]
+			client.get(url_for("products.get_products", limit=5))
+			large_page_count = len(statements)
+		finally:
+			event.remove(db.engine, 'before_cursor_execute', count)
+
+		assert small_page_count == large_page_count
+
+	def test_get_products_should_page_through_catalog(self, catalog, db, client):
+		statements = []
+
+		def count(conn, cursor, statement, parameters, context, executemany):
+			statements.append(statement)
+
+		ids, after, pages = [], 0, 0
+		event.listen(db.engine, 'before_cursor_execute', count)
+		try:
+			while after is not None:
+				page = json.loads(client.get(url_for("products.get_products", after=after, limit=MAX_PAGE_SIZE)).data)
+				ids += [p['id'] for p in page['results']]
+				after = page['next']
+				pages += 1
+		finally:
+			event.remove(db.engine, 'before_cursor_execute', count)
+
+		assert ids == list(range(1, catalog + 1))
+		assert len(statements) <= 2 * pages
+
+	def test_get_products_limit_should_be_capped(self, client):
+		response = client.get(url_for("products.get_products", limit=MAX_PAGE_SIZE + 1))
+		assert response.status_code == 200
+		assert len(json.loads(response.data)['results']) <= MAX_PAGE_SIZE
+
+	def test_get_products_incorrect_limit_should_raise_400(self, client):
+		response = client.get(url_for("products.get_products", limit=0))
+		response_dict = json.loads(response.data)
+		assert response.status_code == 400
+		assert response_dict['field'] == 'limit'
+
+	def test_export_products_should_stream_one_product_per_line(self, db, client):
+		product, brand, category = self.create_product(db)
+
+		response = client.get(url_for("products.export_products"))
+		lines = response.data.decode().splitlines()
+		exported = [json.loads(line) for line in lines]
+
+		assert response.status_code == 200
+		assert response.mimetype == 'application/x-ndjson'
+		assert len(exported) == Product.query.count()
+		assert exported[-1]['id'] == product.id
+		assert exported[-1]['brand']['id'] == brand.id
+
+	def test_bulk_products_should_report_per_item_results(self, db, product_request, client):
+		product, brand, category = self.create_product(db)
+		removed_product, _, _ = self.create_product(db)
+		removed_id = removed_product.id
+
+		created_request = self.future_request(product_request, brand_id=brand.id, categories=[category.id])
+		updated_request = self.future_request(
+			product_request, id=product.id, brand_id=brand.id, categories=[category.id], rating=9
+		)
+		invalid_request = self.future_request(product_request, brand_id=brand.id, categories=[])
+		missing_brand_request = self.future_request(product_request, brand_id=removed_product.brand_id + 1000)
+
+		response = client.post(url_for("products.bulk_products"), json={
+			'upsert': [created_request, updated_request, invalid_request, missing_brand_request],
+			'delete': [removed_id, removed_id + 1000]
+		})
+		response_dict = json.loads(response.data)
+		upsert, delete = response_dict['upsert'], response_dict['delete']
+
+		assert response.status_code == 200
+		assert [r['status'] for r in upsert] == ['created', 'updated', 'error', 'error']
+		assert 'validation_error' in upsert[2]
+		assert upsert[3]['field'] == 'brand_id'
+		assert [r['status'] for r in delete] == ['deleted', 'error']
+
+		db.session.expire_all()
+		created_product = Product.query.get(upsert[0]['id'])
+		assert created_product.name == product_request['name']
+		assert [c.id for c in created_product.categories] == [category.id]
+		assert Product.query.get(product.id).featured == True
+		assert Product.query.get(removed_id) is None
+
+	def test_get_product_should_support_conditional_requests(self, db, client):
+		product, brand, category = self.create_product(db)
+
+		response = client.get(url_for("products.get_product", id=product.id))
+		etag, last_modified = response.headers['ETag'], response.headers['Last-Modified']
+		assert response.status_code == 200
+
+		hits = product_responses.hits
+		response = client.get(url_for("products.get_product", id=product.id), headers={'If-None-Match': etag})
+		assert response.status_code == 304
+		assert product_responses.hits == hits + 1
+
+		response = client.get(
+			url_for("products.get_product", id=product.id),
+			headers={'If-Modified-Since': last_modified}
+		)
+		assert response.status_code == 304
+
+	def test_update_product_should_invalidate_cached_response(self, db, product_request, client):
+		product, brand, category = self.create_product(db)
+		etag = client.get(url_for("products.get_product", id=product.id)).headers['ETag']
+
+		product_request = self.future_request(product_request, brand_id=brand.id, categories=[category.id], name='renamed')
+		client.put(url_for("products.update_product", id=product.id), json=product_request)
+
+		response = client.get(url_for("products.get_product", id=product.id), headers={'If-None-Match': etag})
+		assert response.status_code == 200
+		assert json.loads(response.data)['name'] == 'renamed'
+
+	def test_get_product_should_not_serve_cached_responses_of_writes_of_other_processes(self, db, client):
+		product, brand, category = self.create_product(db)
+		product_id = product.id
+		client.get(url_for("products.get_product", id=product_id))
+
+		# Job workers and the catalog import cannot invalidate the cache of this process
+		product.name = 'renamed elsewhere'
+		db.session.commit()
+		response = client.get(url_for("products.get_product", id=product_id))
+		assert json.loads(response.data)['name'] == 'renamed elsewhere'
+
+		db.session.delete(product)
+		db.session.commit()
+		assert client.get(url_for("products.get_product", id=product_id)).status_code == 404
+
+	def test_get_products_should_filter(self, db, client):
+		product, brand, category = self.create_product(db)
+		product.featured = True
+		product.rating = 9
+		db.session.commit()
+
+		response = client.get(url_for(
+			"products.get_products",
+			brand_id=brand.id, categories=str(category.id), featured='true', min_rating=8.5, max_rating=10
+		))
+		assert response.status_code == 200
+		assert [p['id'] for p in json.loads(response.data)['results']] == [product.id]
+
+		response = client.get(url_for("products.get_products", brand_id=brand.id, featured='false'))
+		assert json.loads(response.data)['results'] == []
+
+	def test_get_products_should_sort_by_cursor(self, db, client):
+		brand = BrandFactory()
+		db.session.commit()
+		products = [ProductFactory(brand=brand, rating=rating, categories=[]) for rating in (3, 7, 7, 5)]
+		db.session.commit()
+
+		ids, after = [], None
+		while True:
+			response = client.get(url_for(
+				"products.get_products", brand_id=brand.id, sort='-rating', limit=1, **({'after': after} if after else {})
+			))
+			page = json.loads(response.data)
+			ids += [p['id'] for p in page['results']]
+			after = page['next']
+			if after is None:
+				break
+
+		assert ids == [products[2].id, products[1].id, products[3].id, products[0].id]
+
+	@pytest.mark.parametrize('sort', ['name', '-created_at', 'rating'])
+	@pytest.mark.parametrize('cursor', [[1, [1]], [[1], 1], ['x', True], [True, 1], [1], 'x', None])
+	def test_get_products_malformed_cursor_should_raise_400(self, client, sort, cursor):
+		after = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+		response = client.get(url_for("products.get_products", sort=sort, after=after))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'after'
+
+	def test_get_products_incorrect_filter_should_raise_400(self, client):
+		response = client.get(url_for("products.get_products", featured='maybe'))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'featured'
+
+		response = client.get(url_for("products.get_products", sort='brand'))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'sort'
+
+	def test_filter_indexes_should_be_used(self, db):
+		plans = [
+			db.session.execute('EXPLAIN QUERY PLAN SELECT id FROM products WHERE brand_id = 1 AND rating > 5'),
+			db.session.execute('EXPLAIN QUERY PLAN SELECT product_id FROM products_categories WHERE category_id = 1')
+		]
+		details = [' '.join(str(row[-1]) for row in plan) for plan in plans]
+		assert 'ix_products_brand_id_rating' in details[0]
+		assert 'ix_products_categories_category_id_product_id' in details[1]
+
+	def test_search_products_should_match_name_prefix(self, db, client):
+		product, brand, category = self.create_product(db)
+		product.name = 'Zanzibar spice'
+		db.session.commit()
+
+		response = client.get(url_for("products.search_products", q='zanzi'))
+		assert response.status_code == 200
+		assert [p['id'] for p in json.loads(response.data)['results']] == [product.id]
+
+		product.name = 'Pepper'
+		db.session.commit()
+		response = client.get(url_for("products.search_products", q='zanzi'))
+		assert json.loads(response.data)['results'] == []
+
+	def test_search_products_should_fall_back_to_like(self, db, client, monkeypatch):
+		product, brand, category = self.create_product(db)
+		product.name = 'Madagascar vanilla'
+		db.session.commit()
+
+		monkeypatch.setattr(services.product, '_ProductService__has_fts', lambda: False)
+		response = client.get(url_for("products.search_products", q='gascar'))
+		assert [p['id'] for p in json.loads(response.data)['results']] == [product.id]
+
+	def test_search_products_like_fallback_should_match_wildcards_literally(self, db, client, monkeypatch):
+		product, brand, category = self.create_product(db)
+		other, _, _ = self.create_product(db)
+		product.name, other.name = 'snake_case', 'snakexcase'
+		db.session.commit()
+
+		monkeypatch.setattr(services.product, '_ProductService__has_fts', lambda: False)
+		response = client.get(url_for("products.search_products", q='snake_case'))
+		assert [p['id'] for p in json.loads(response.data)['results']] == [product.id]
+
+	def test_search_products_without_query_should_raise_400(self, client):
+		response = client.get(url_for("products.search_products", q=' '))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'q'
+
+	def test_product_changes_should_list_mutations_in_order(self, db, product_request, client):
+		product, brand, category = self.create_product(db)
+		since = self.last_change_seq(db)
+		product_request = self.future_request(product_request, brand_id=brand.id, categories=[category.id])
+
+		created_id = json.loads(client.post(url_for("products.create_product"), json=product_request).data)['id']
+		client.put(url_for("products.update_product", id=product.id), json=product_request)
+		client.delete(url_for("products.delete_product", id=created_id))
+
+		response = client.get(url_for("products.get_product_changes", since=since, wait=0))
+		response_dict = json.loads(response.data)
+		assert response.status_code == 200
+		assert [(change['product_id'], change['operation']) for change in response_dict['results']] == [
+			(created_id, 'created'), (product.id, 'updated'), (created_id, 'deleted')
+		]
+		assert response_dict['next'] == response_dict['results'][-1]['seq']
+
+		response = client.get(url_for("products.get_product_changes", since=since, wait=0, limit=1))
+		assert [change['operation'] for change in json.loads(response.data)['results']] == ['created']
+
+	def test_product_changes_should_stop_at_recent_gaps(self, db, client):
+		since = self.last_change_seq(db)
+		# The change since + 1 is still being committed by another transaction
+		db.session.add(ProductChange(seq=since + 2, product_id=1, operation='updated'))
+		db.session.commit()
+
+		response = client.get(url_for("products.get_product_changes", since=since, wait=0))
+		assert json.loads(response.data) == {'results': [], 'next': since}
+
+		db.session.add(ProductChange(seq=since + 1, product_id=2, operation='updated'))
+		db.session.commit()
+		response = client.get(url_for("products.get_product_changes", since=since, wait=0))
+		assert [change['seq'] for change in json.loads(response.data)['results']] == [since + 1, since + 2]
+
+		# Older gaps were left by rolled back transactions
+		db.session.add(ProductChange(seq=since + 4, product_id=3, operation='updated', created_at=datetime(2000, 1, 1)))
+		db.session.commit()
+		response = client.get(url_for("products.get_product_changes", since=since + 2, wait=0))
+		assert [change['seq'] for change in json.loads(response.data)['results']] == [since + 4]
+
+	def test_product_changes_should_prune_old_changes(self, db, client):
+		since = self.last_change_seq(db)
+		db.session.add(ProductChange(seq=since + 1, product_id=1, operation='updated', created_at=datetime(2000, 1, 1)))
+		db.session.add(ProductChange(
+			seq=since + 2, product_id=2, operation='updated', created_at=datetime.utcnow() - timedelta(hours=1)
+		))
+		db.session.commit()
+
+		assert product_changes.prune(datetime.utcnow() - timedelta(days=1)) >= 1
+		response = client.get(url_for("products.get_product_changes", since=since, wait=0))
+		assert [change['seq'] for change in json.loads(response.data)['results']] == [since + 2]
+		assert ProductChange.query.filter(ProductChange.created_at < datetime(2001, 1, 1)).count() == 0
+
+	def test_product_changes_should_wait_for_changes(self, db, client):
+		since = self.last_change_seq(db)
+		started = time.monotonic()
+		response = client.get(url_for("products.get_product_changes", since=since, wait=0.2))
+		assert time.monotonic() - started >= 0.2
+		assert json.loads(response.data) == {'results': [], 'next': since}
+
+	@pytest.mark.parametrize('wait', ['nan', 'inf', '-inf'])
+	def test_product_changes_non_finite_wait_should_raise_400(self, client, wait):
+		response = client.get(url_for("products.get_product_changes", wait=wait))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'wait'
+
+	def test_product_changes_incorrect_since_should_raise_400(self, client):
+		response = client.get(url_for("products.get_product_changes", since='x'))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'since'
+
+	def test_update_product_should_replace_categories(self, db, product_request, client):
+		product, brand, category = self.create_product(db)
+		other = CategoryFactory()
+		db.session.commit()
+		product_request = self.future_request(product_request, brand_id=brand.id, categories=[other.id])
+
+		response = client.put(url_for("products.update_product", id=product.id), json=product_request)
+		assert response.status_code == 200
+		response = client.get(url_for("products.get_product", id=product.id))
+		assert [c['id'] for c in json.loads(response.data)['categories']] == [other.id]
+
+	def test_update_product_should_check_if_match(self, db, product_request, client):
+		product, brand, category = self.create_product(db)
+		product_request = self.future_request(product_request, brand_id=brand.id, categories=[category.id])
+		current = client.get(url_for("products.get_product", id=product.id)).headers['ETag']
+
+		response = client.put(url_for("products.update_product", id=product.id), json=product_request,
+			headers={'If-Match': current})
+		assert response.status_code == 200
+		assert response.headers['ETag'] == client.get(url_for("products.get_product", id=product.id)).headers['ETag']
+
+		response = client.put(url_for("products.update_product", id=product.id), json=product_request,
+			headers={'If-Match': current})
+		assert response.status_code == 409
+		assert json.loads(response.data)['field'] == 'id'
+
+	def test_update_product_should_match_etag_of_compressed_response(self, db, product_request, client, monkeypatch):
+		monkeypatch.setattr(response_encoder, 'min_size', 0)
+		product, brand, category = self.create_product(db)
+		product_request = self.future_request(product_request, brand_id=brand.id, categories=[category.id])
+		current = client.get(url_for("products.get_product", id=product.id), headers={'Accept-Encoding': 'gzip'})
+		assert current.headers['ETag'].startswith('W/')
+
+		response = client.put(url_for("products.update_product", id=product.id), json=product_request,
+			headers={'If-Match': current.headers['ETag']})
+		assert response.status_code == 200
+
+	def test_update_product_should_raise_on_concurrent_update(self, db, product_request):
+		product, brand, category = self.create_product(db)
+		product_request.update(brand_id=brand.id, categories=[category.id], name='Mine')
+		# Another transaction updates the product after it was loaded
+		db.session.execute(
+			update(Product).where(Product.id == product.id).values(version=Product.version + 1)
+			.execution_options(synchronize_session=False)
+		)
+
+		with pytest.raises(StaleDataError):
+			services.product.update_product(product.id, ProductUpdate.parse_obj(product_request).dict())
+		assert Product.query.get(product.id).name != 'Mine'
+
+	def test_bulk_products_should_reject_stale_versions(self, db, product_request, client):
+		product, brand, category = self.create_product(db)
+		other, _, _ = self.create_product(db)
+		item = self.future_request(product_request, brand_id=brand.id, categories=[category.id])
+
+		response = client.post(url_for("products.bulk_products"), json={'upsert': [
+			dict(item, id=product.id, version=product.version + 1), dict(item, id=other.id, version=other.version)
+		]})
+		upsert = json.loads(response.data)['upsert']
+		assert [(r['status'], r.get('field')) for r in upsert] == [('error', 'version'), ('updated', None)]
+
+	def test_bulk_products_should_reject_duplicate_ids(self, db, product_request, client):
+		product, brand, category = self.create_product(db)
+		other, _, _ = self.create_product(db)
+		item = self.future_request(product_request, brand_id=brand.id, categories=[category.id])
+
+		response = client.post(url_for("products.bulk_products"), json={'upsert': [
+			item, dict(item, id=product.id), dict(item, id=product.id, name='Twice'), dict(item, id=other.id)
+		]})
+		upsert = json.loads(response.data)['upsert']
+		assert [(r['status'], r.get('field')) for r in upsert] == [
+			('created', None), ('error', 'id'), ('error', 'id'), ('updated', None)
+		]
+		assert Product.query.get(product.id).name != 'Twice'
+
+	def test_bulk_products_should_write_again_chunks_of_concurrent_updates(self, db, product_request, client, monkeypatch):
+		product, brand, category = self.create_product(db)
+		other, _, _ = self.create_product(db)
+		item = self.future_request(product_request, brand_id=brand.id, categories=[category.id], name='Bulk')
+
+		# Another request updates the product once its version was read by the upsert
+		read_versions = services.product._ProductService__versions
+		pending = [product.id]
+
+		def read_versions_then_update(ids):
+			versions = read_versions(ids)
+			if pending:
+				db.session.execute(update(Product).where(Product.id == pending.pop()).values(version=Product.version + 1))
+				db.session.commit()
+			return versions
+
+		monkeypatch.setattr(services.product, '_ProductService__versions', read_versions_then_update)
+		response = client.post(url_for("products.bulk_products"), json={'upsert': [
+			item, dict(item, id=product.id), dict(item, id=other.id)
+		]})
+		upsert = json.loads(response.data)['upsert']
+		assert [(r['status'], r.get('field')) for r in upsert] == [('created', None), ('error', 'version'), ('updated', None)]
+		db.session.expire_all()
+		assert Product.query.get(other.id).name == 'Bulk'
+		assert Product.query.get(product.id).name != 'Bulk'
+
+	def test_get_products_by_ids_should_keep_order(self, db, client):
+		first, _, _ = self.create_product(db)
+		second, _, _ = self.create_product(db)
+
+		response = client.get(url_for("products.get_products", ids='%d,%d,%d' % (second.id, first.id, second.id + 1000)))
+		results = json.loads(response.data)['results']
+		assert response.status_code == 200
+		assert results == [
+			json.loads(client.get(url_for("products.get_product", id=id)).data) for id in (second.id, first.id)
+		]
+
+	def test_get_products_should_project_fields_in_sql(self, db, client):
+		product, brand, category = self.create_product(db)
+
+		statements = []
+
+		def count(conn, cursor, statement, parameters, context, executemany):
+			statements.append(statement)
+
+		event.listen(db.engine, 'before_cursor_execute', count)
+		try:
+			response = client.get(url_for("products.get_products", ids=product.id, fields='name,id'))
+		finally:
+			event.remove(db.engine, 'before_cursor_execute', count)
+		assert json.loads(response.data)['results'] == [{'id': product.id, 'name': product.name}]
+		assert len(statements) == 1
+		assert 'products.rating' not in statements[0] and 'products_categories' not in statements[0]
+
+		response = client.get(url_for("products.get_products", ids=product.id, fields='brand,categories'))
+		assert json.loads(response.data)['results'] == [{
+			'brand': brand.serialized, 'categories': [category.serialized]
+		}]
+
+	def test_get_products_should_project_fields_of_pages(self, db, client):
+		for _ in range(3):
+			self.create_product(db)
+		response = client.get(url_for("products.get_products", fields='id', sort='-rating', limit=2))
+		response_dict = json.loads(response.data)
+		assert [list(product) for product in response_dict['results']] == [['id'], ['id']]
+		assert response_dict['next'] is not None
+
+	def test_get_products_unknown_field_should_raise_400(self, client):
+		response = client.get(url_for("products.get_products", fields='id,secret'))
+		assert response.status_code == 400
+		assert json.loads(response.data)['field'] == 'fields'
+
+	def test_get_products_should_compress_large_responses(self, db, client, monkeypatch):
+		product, brand, category = self.create_product(db)
+		ProductFactory.create_batch(5, brand=brand, categories=[category])
+		db.session.commit()
+		plain = client.get(url_for("products.get_products", limit=20))
+		response = client.get(url_for("products.get_products", limit=20), headers={'Accept-Encoding': 'gzip'})
+		assert response.headers['Content-Encoding'] == 'gzip'
+		assert 'Accept-Encoding' in response.headers['Vary']
+		assert gzip.decompress(response.data) == plain.data
+
+		monkeypatch.setattr(response_encoder, 'min_size', len(plain.data) + 1)
+		response = client.get(url_for("products.get_products", limit=20), headers={'Accept-Encoding': 'gzip'})
+		assert 'Content-Encoding' not in response.headers
+
+		monkeypatch.setattr(response_encoder, 'min_size', 0)
+		product_url = url_for("products.get_product", id=product.id)
+		response = client.get(product_url, headers={'Accept-Encoding': 'gzip'})
+		assert response.headers['ETag'].startswith('W/')
+		response = client.get(product_url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']})
+		assert response.status_code == 304
+
+	def test_get_products_should_encode_msgpack(self, db, client):
+		msgpack = pytest.importorskip('msgpack')
+		self.create_product(db)
+		plain = client.get(url_for("products.get_products", limit=5))
+		response = client.get(url_for("products.get_products", limit=5), headers={'Accept': 'application/msgpack'})
+		assert response.mimetype == 'application/msgpack'
+		assert msgpack.unpackb(response.data) == json.loads(plain.data)
+
+	def test_get_products_should_normalize_brands_and_categories(self, db, client):
+		product, brand, category = self.create_product(db)
+		other = ProductFactory(brand=brand, categories=[category])
+		db.session.commit()
+
+		response = client.get(url_for("products.get_products", ids='%d,%d' % (product.id, other.id), shape='normalized'))
+		response_dict = json.loads(response.data)
+		assert response_dict['brands'] == [brand.serialized]
+		assert response_dict['categories'] == [category.serialized]
+		assert [(p['brand'], p['categories']) for p in response_dict['results']] == [(brand.id, [category.id])] * 2
+		assert response_dict['results'][0]['name'] == product.name
+
+		response = client.get(url_for("products.get_products", shape='normalized', limit=1))
+		assert set(json.loads(response.data)) == {'results', 'next', 'brands', 'categories'}
+
+	def test_reserve_product_should_decrement_stock(self, db, client):
+		product, _, _ = self.create_product(db)
+		product.items_in_stock = 5
+		db.session.commit()
+		version = product.version
+		since = self.last_change_seq(db)
+
+		response = client.post(url_for("products.reserve_product", id=product.id), json={'quantity': 3})
+		assert response.status_code == 200
+		assert json.loads(response.data) == {'id': product.id, 'quantity': 3, 'status': 'reserved'}
+
+		response = client.post(url_for("products.reserve_product", id=product.id), json={'quantity': 3})
+		assert response.status_code == 409
+		assert json.loads(response.data)['field'] == 'quantity'
+
+		response = client.post(url_for("products.reserve_product", id=product.id + 1000), json={})
+		assert response.status_code == 404
+
+		db.session.refresh(product)
+		assert (product.items_in_stock, product.version) == (2, version + 1)
+		assert json.loads(client.get(url_for("products.get_product", id=product.id)).data)['items_in_stock'] == 2
+		assert [change.product_id for change in ProductChange.query.filter(ProductChange.seq > since)] == [product.id]
+
+	def test_reserve_cart_should_report_per_line_results(self, db, client):
+		product, brand, category = self.create_product(db)
+		other = ProductFactory(brand=brand, categories=[category], items_in_stock=1)
+		product.items_in_stock = 5
+		db.session.commit()
+		lines = [
+			{'product_id': other.id, 'quantity': 2},
+			{'product_id': product.id, 'quantity': 2},
+			{'product_id': product.id + other.id},
+		]
+
+		response = client.post(url_for("products.reserve_cart"), json={'lines': lines, 'all_or_nothing': True})
+		assert response.status_code == 409
+		assert [result['status'] for result in json.loads(response.data)['results']] == ['error', 'rolled_back', 'error']
+		db.session.refresh(product)
+		assert product.items_in_stock == 5
+
+		response = client.post(url_for("products.reserve_cart"), json={'lines': lines})
+		assert response.status_code == 200
+		results = json.loads(response.data)['results']
+		assert [(result['status'], result.get('field')) for result in results] == [
+			('error', 'quantity'), ('reserved', None), ('error', 'product_id')
+		]
+		db.session.refresh(product)
+		db.session.refresh(other)
+		assert (product.items_in_stock, other.items_in_stock) == (3, 1)
+
+		response = client.post(url_for("products.reserve_cart"), json={'lines': [{'product_id': product.id, 'quantity': 0}]})
+		assert response.status_code == 400
+
+	def future_request(self, product_request, **fields):
+		"""Returns product_request with fields and an expiration date a year from now, which is always accepted."""
+		expiration_date = (datetime.utcnow() + timedelta(days=365)).strftime(TIME_FORMAT)
+		return dict(product_request, expiration_date=expiration_date, **fields)
+
+	def last_change_seq(self, db):
+		return db.session.query(func.max(ProductChange.seq)).scalar() or 0
+
 	def create_product(self, db):
 		brand = BrandFactory()
 		category = CategoryFactory()
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app.asgi import create_asgi_app
+from app.cache import product_responses, reference_cache
+from app.models.products import Brand, Category, Product, ProductReadModel, products_categories
+from app.read_model import product_documents
+
+pytest.importorskip('aiosqlite')
+
+
+@pytest.fixture
+def asgi_app(db, tmp_path):
+	asgi_app = create_asgi_app(dict(TESTING=True, SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'asgi.sqlite')))
+	engine = db.get_engine(asgi_app.app)
+	db.Model.metadata.create_all(engine)
+	with engine.begin() as connection:
+		connection.execute(Brand.__table__.insert(), [{'id': 1, 'name': 'Brand', 'country_code': 'US'}])
+		connection.execute(Category.__table__.insert(), [{'id': 1, 'name': 'One'}, {'id': 2, 'name': 'Two'}])
+		connection.execute(Product.__table__.insert(), [
+			{'id': id, 'name': 'Product %d' % id, 'rating': id, 'featured': id % 2 == 0, 'items_in_stock': id,
+				'brand_id': 1}
+			for id in range(1, 6)
+		])
+		connection.execute(products_categories.insert(), [
+			{'product_id': id, 'category_id': category_id} for id in range(1, 6) for category_id in (1, 2)
+		])
+	reference_cache.clear()
+	with asgi_app.app.app_context():
+		session = db.create_scoped_session()
+		product_documents.rebuild(session)
+		session.remove()
+	yield asgi_app
+	engine.dispose()
+	reference_cache.clear()
+	product_responses.clear()
+
+
+def send_request(asgi_app, method, path, query_string=b'', headers=()):
+	"""Returns the ASGI messages of the response."""
+	messages = []
+
+	async def receive():
+		return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+	async def send(message):
+		messages.append(message)
+
+	async def call():
+		await asgi_app({
+			'type': 'http', 'method': method, 'path': path, 'query_string': query_string, 'headers': list(headers),
+			'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80)
+		}, receive, send)
+		await asgi_app.close()
+
+	asyncio.run(call())
+	return messages
+
+
+def request(asgi_app, method, path, query_string=b'', headers=()):
+	messages = send_request(asgi_app, method, path, query_string, headers)
+	return messages[0]['status'], dict(messages[0]['headers']), b''.join(message['body'] for message in messages[1:])
+
+
+class TestAsgi:
+	def test_should_list_products_like_wsgi_app(self, asgi_app):
+		status, _, body = request(asgi_app, 'GET', '/products/', b'limit=2&sort=-rating')
+		assert status == 200
+		assert b'"name":"Product 5"' in body and b'"name":"Brand"' in body
+		assert body == asgi_app.app.test_client().get('/products/?limit=2&sort=-rating').data
+
+	def test_should_return_400_on_invalid_limit(self, asgi_app):
+		status, _, body = request(asgi_app, 'GET', '/products/', b'limit=x')
+		assert status == 400
+		assert b'"field":"limit"' in body
+
+	def test_should_get_product_like_wsgi_app(self, asgi_app):
+		status, headers, body = request(asgi_app, 'GET', '/products/3')
+		assert status == 200
+		product_responses.clear()
+		assert body == asgi_app.app.test_client().get('/products/3').data
+
+		status, _, body = request(asgi_app, 'GET', '/products/3', headers=[(b'if-none-match', headers[b'etag'])])
+		assert status == 304
+		assert body == b''
+
+	def test_should_return_404_on_missing_product(self, asgi_app):
+		status, _, _ = request(asgi_app, 'GET', '/products/100')
+		assert status == 404
+
+	def test_should_not_serve_cached_product_deleted_by_another_process(self, db, asgi_app):
+		assert request(asgi_app, 'GET', '/products/2')[0] == 200
+		with db.get_engine(asgi_app.app).begin() as connection:
+			connection.execute(ProductReadModel.__table__.delete().where(ProductReadModel.product_id == 2))
+		status, _, _ = request(asgi_app, 'GET', '/products/2')
+		assert status == 404
+
+	def test_should_serve_other_routes_with_wsgi_app(self, asgi_app):
+		status, _, _ = request(asgi_app, 'DELETE', '/products/4')
+		assert status == 200
+		status, _, _ = request(asgi_app, 'GET', '/products/4')
+		assert status == 404
+
+	def test_should_stream_wsgi_responses(self, asgi_app, monkeypatch):
+		monkeypatch.setattr('app.endpoints.products.EXPORT_CHUNK_SIZE', 2)
+		messages = send_request(asgi_app, 'GET', '/products/export.ndjson')
+		assert [message['more_body'] for message in messages[1:-1]] == [True] * 3
+		assert not messages[-1].get('more_body')
+		assert b''.join(message['body'] for message in messages[1:]).count(b'\n') == 5
+
+	def test_should_limit_long_polls(self, asgi_app, monkeypatch):
+		status, _, body = request(asgi_app, 'GET', '/products/changes', b'wait=0')
+		assert status == 200
+		monkeypatch.setattr(asgi_app, 'long_poll_threads', 0)
+		status, _, _ = request(asgi_app, 'GET', '/products/changes', b'wait=0')
+		assert status == 503
+
+	def test_should_reject_in_memory_database(self):
+		with pytest.raises(ValueError):
+			create_asgi_app(dict(SQLALCHEMY_DATABASE_URI='sqlite:///:memory:'))
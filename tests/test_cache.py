@@ -0,0 +1,45 @@
+from app.cache import MemoryBackend, reference_cache
+from app.models.products import Brand
+
+from tests.factories import BrandFactory
+
+
+class TestMemoryBackend:
+	def test_should_evict_least_recently_used(self):
+		backend = MemoryBackend(max_size=2)
+		backend.set('a', 1)
+		backend.set('b', 2)
+		backend.get('a')
+		backend.set('c', 3)
+		assert backend.get('a') == 1
+		assert backend.get('b') is None
+		assert backend.get('c') == 3
+
+	def test_should_expire_entries(self):
+		backend = MemoryBackend(ttl=-1)
+		backend.set('a', 1)
+		assert backend.get('a') is None
+
+
+class TestReferenceCache:
+	def test_should_serve_brand_from_cache(self, db):
+		brand = BrandFactory()
+		db.session.commit()
+
+		assert reference_cache.get(Brand, brand.id) == brand.serialized
+		hits = reference_cache.hits
+		assert reference_cache.get(Brand, brand.id) == brand.serialized
+		assert reference_cache.hits == hits + 1
+
+	def test_should_invalidate_changed_brand(self, db):
+		brand = BrandFactory(name='Old')
+		db.session.commit()
+		assert reference_cache.get(Brand, brand.id)['name'] == 'Old'
+
+		brand.name = 'New'
+		db.session.commit()
+		assert reference_cache.get(Brand, brand.id)['name'] == 'New'
+
+		db.session.delete(brand)
+		db.session.commit()
+		assert reference_cache.get(Brand, brand.id) is None
@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import create_app
+from app.cache import reference_cache
+from app.commands.sync_replicas import sync_replicas
+from app.database import read_primary
+from app.models.products import Brand, ProductChange
+
+
+@pytest.fixture
+def file_app(db, tmp_path):
+	app = create_app(dict(TESTING=True, SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'app.sqlite')))
+	with app.app_context():
+		db.create_all()
+		yield app
+		db.session.remove()
+		for engine in [db.get_engine(app)] + db.get_read_engines(app):
+			engine.dispose()
+
+
+@pytest.fixture
+def replicated_app(db, tmp_path):
+	app = create_app(dict(
+		TESTING=True,
+		SQLALCHEMY_DATABASE_URI='sqlite:///%s' % (tmp_path / 'primary.sqlite'),
+		DATABASE_REPLICA_URIS=['sqlite:///%s' % (tmp_path / 'replica.sqlite')]
+	))
+	with app.app_context():
+		db.create_all()
+		sync_replicas()
+		yield app
+		db.session.remove()
+		for engine in [db.get_engine(app)] + db.get_read_engines(app):
+			engine.dispose()
+
+
+def insert_brand(db, app):
+	with db.get_engine(app).begin() as connection:
+		connection.exec_driver_sql("INSERT INTO brands (name, country_code) VALUES ('Brand', 'US')")
+
+
+class TestDatabase:
+	def test_should_tune_sqlite_connections(self, db, file_app):
+		engine = db.get_engine(file_app)
+		with engine.connect() as connection:
+			assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+			assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+			assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == file_app.config['SQLITE_BUSY_TIMEOUT_MS']
+		assert engine.pool.size() == file_app.config['DATABASE_POOL_SIZE']
+
+	def test_should_read_committed_rows_through_read_only_engine(self, db, file_app):
+		insert_brand(db, file_app)
+
+		with db.get_read_engines(file_app)[0].connect() as connection:
+			assert connection.exec_driver_sql('SELECT count(*) FROM brands').scalar() == 1
+			with pytest.raises(OperationalError):
+				connection.exec_driver_sql("DELETE FROM brands")
+
+	def test_should_route_reads_of_read_only_sessions(self, db, file_app):
+		session = db.create_scoped_session()
+		assert session.get_bind() is db.get_engine(file_app)
+		session.info['read_only'] = True
+		assert session.get_bind() is db.get_read_engines(file_app)[0]
+		session.remove()
+
+	def test_should_not_create_read_only_engine_for_in_memory_database(self, app, db):
+		assert db.get_read_engines(app) == []
+
+	def test_should_read_from_replica_until_session_writes(self, db, replicated_app):
+		insert_brand(db, replicated_app)
+		session = db.create_scoped_session()
+		session.info['read_only'] = True
+		assert session.query(Brand).count() == 0
+
+		sync_replicas()
+		assert session.query(Brand).count() == 1
+
+		insert_brand(db, replicated_app)
+		session.add(Brand(name='New', country_code='FR'))
+		session.flush()
+		# Reads after a write see the primary
+		assert session.query(Brand).count() == 3
+		session.rollback()
+		session.remove()
+
+	def test_should_read_primary_within_read_primary(self, db, replicated_app):
+		insert_brand(db, replicated_app)
+		session = db.create_scoped_session()
+		session.info['read_only'] = True
+		with read_primary(session):
+			assert session.query(Brand).count() == 1
+		assert session.query(Brand).count() == 0
+		session.remove()
+
+	def test_should_fill_reference_cache_from_primary(self, db, replicated_app):
+		insert_brand(db, replicated_app)
+		db.session.info['read_only'] = True
+		try:
+			assert reference_cache.get_many(Brand, [1])[1]['name'] == 'Brand'
+		finally:
+			reference_cache.clear()
+
+	def test_should_read_product_changes_from_primary(self, db, replicated_app):
+		with db.get_engine(replicated_app).begin() as connection:
+			connection.execute(ProductChange.__table__.insert(), [{'product_id': 1, 'operation': 'created'}])
+
+		response = replicated_app.test_client().get('/products/changes?wait=0')
+		assert [change['product_id'] for change in response.get_json()['results']] == [1]
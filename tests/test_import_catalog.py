@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+from app.commands.import_catalog import CheckpointMismatch, import_catalog
+from app.models.imports import CatalogImport
+from app.models.products import Product, ProductReadModel
+
+from tests.factories import BrandFactory, CategoryFactory
+
+CSV_CATALOG = """name,rating,featured,expiration_date,items_in_stock,receipt_date,brand,categories
+Imported one,9,,2030-01-01T00:00:00Z,5,2020-01-01T00:00:00Z,Import brand,Import food|Import drinks
+Imported two,3,false,2030-01-01T00:00:00Z,5,2020-01-01T00:00:00Z,Unknown brand,Import food
+Imported three,4,true,2030-01-01T00:00:00Z,5,2020-01-01T00:00:00Z,Import brand,Import drinks
+"""
+
+
+def ndjson_row(name):
+	return json.dumps({
+		'name': name, 'rating': 5, 'featured': False, 'expiration_date': '2030-01-01T00:00:00Z',
+		'items_in_stock': 1, 'receipt_date': '2020-01-01T00:00:00Z', 'brand': 'Import brand',
+		'categories': ['Import food']
+	})
+
+
+class TestImportCatalog:
+	def test_should_import_csv_rows_and_reject_invalid_ones(self, db, tmp_path):
+		BrandFactory(name='Import brand')
+		CategoryFactory(name='Import food')
+		CategoryFactory(name='Import drinks')
+		db.session.commit()
+		path = tmp_path / 'catalog.csv'
+		path.write_text(CSV_CATALOG)
+
+		stats = import_catalog(str(path), batch_size=2)
+		assert (stats['imported'], stats['rejected']) == (2, 1)
+
+		one = Product.query.filter_by(name='Imported one').one()
+		assert one.featured
+		assert sorted(category.name for category in one.categories) == ['Import drinks', 'Import food']
+		assert json.loads(ProductReadModel.query.get(one.id).document)['name'] == 'Imported one'
+		assert Product.query.filter_by(name='Imported two').count() == 0
+
+	def test_should_resume_from_checkpoint(self, db, tmp_path):
+		BrandFactory(name='Import brand')
+		CategoryFactory(name='Import food')
+		db.session.commit()
+		path = tmp_path / 'catalog.ndjson'
+		path.write_text('\n'.join(ndjson_row('Resumed %d' % i) for i in range(3)) + '\n')
+		stat = os.stat(path)
+		db.session.add(CatalogImport(
+			checkpoint=str(path), path=str(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns, consumed=2
+		))
+		db.session.commit()
+
+		stats = import_catalog(str(path), batch_size=2)
+		assert stats['imported'] == 1
+		assert [p.name for p in Product.query.filter(Product.name.like('Resumed%'))] == ['Resumed 2']
+		assert CatalogImport.query.get(str(path)).consumed == 3
+
+		# A finished import is not imported again
+		assert import_catalog(str(path))['imported'] == 0
+
+	def test_should_not_resume_a_checkpoint_of_another_file(self, db, tmp_path):
+		BrandFactory(name='Import brand')
+		CategoryFactory(name='Import food')
+		db.session.commit()
+		path = tmp_path / 'catalog.ndjson'
+		path.write_text(ndjson_row('Changed 0') + '\n')
+		import_catalog(str(path), checkpoint='daily')
+
+		path.write_text('\n'.join(ndjson_row('Changed %d' % i) for i in range(2)) + '\n')
+		with pytest.raises(CheckpointMismatch):
+			import_catalog(str(path), checkpoint='daily')
+		assert Product.query.filter(Product.name.like('Changed%')).count() == 1
+
+		assert import_catalog(str(path), checkpoint='daily', restart=True)['imported'] == 2
+		assert CatalogImport.query.get('daily').consumed == 2
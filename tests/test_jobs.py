@@ -0,0 +1,70 @@
+from datetime import datetime
+
+import pytest
+
+from app.jobs import jobs
+from app.models.jobs import Job
+from app.models.products import Product
+
+from tests.factories import BrandFactory, ProductFactory
+
+
+@pytest.fixture
+def one_product_chunks(monkeypatch):
+	monkeypatch.setattr(jobs, 'chunk_size', 1)
+	monkeypatch.setattr(jobs, 'max_chunks_per_second', None)
+
+
+class TestJobs:
+	def test_should_feature_products_rated_above_minimum(self, db, one_product_chunks):
+		brand = BrandFactory()
+		low, high, demoted = [
+			ProductFactory(brand=brand, rating=rating, featured=featured)
+			for rating, featured in ((5, False), (9.5, False), (1, True))
+		]
+		db.session.commit()
+
+		job = jobs.enqueue('recompute_featured', {'min_rating': 9, 'reset': True})
+		assert jobs.run_next() is job
+		assert job.status == 'done'
+		assert job.processed >= 2
+		assert [low.featured, high.featured, demoted.featured] == [False, True, False]
+
+	def test_should_delete_expired_products_in_chunks(self, db, one_product_chunks):
+		brand = BrandFactory()
+		expired = [ProductFactory(brand=brand, expiration_date=datetime(1990, 1, day)) for day in (1, 2)]
+		kept = ProductFactory(brand=brand, expiration_date=datetime(2030, 1, 1))
+		db.session.commit()
+		expired_ids = [product.id for product in expired]
+
+		job = jobs.enqueue('expire_products', {'before': '2000-01-01T00:00:00'})
+		jobs.run_next()
+		assert (job.status, job.processed, job.after_id) == ('done', 2, expired_ids[-1])
+		assert Product.query.filter(Product.id.in_(expired_ids)).count() == 0
+		assert Product.query.get(kept.id) is not None
+
+	def test_should_retry_failed_jobs_until_max_attempts(self, db, monkeypatch):
+		def fail(session, params, after_id, limit):
+			raise RuntimeError('boom')
+
+		monkeypatch.setitem(jobs.handlers, 'fail', fail)
+		monkeypatch.setattr(jobs, 'retry_delay', 0)
+		job = jobs.enqueue('fail', max_attempts=2)
+
+		jobs.run_next()
+		assert (job.status, job.attempts, job.error) == ('pending', 1, 'RuntimeError: boom')
+		jobs.run_next()
+		assert (job.status, job.attempts) == ('failed', 2)
+		assert jobs.run_next() is None
+
+	def test_should_not_claim_jobs_before_they_are_due(self, db):
+		job = jobs.enqueue('recompute_featured')
+		job.run_after = datetime(2999, 1, 1)
+		db.session.commit()
+		assert jobs.run_next() is None
+		db.session.delete(job)
+		db.session.commit()
+
+	def test_should_reject_unknown_job_kind(self):
+		with pytest.raises(ValueError):
+			jobs.enqueue('unknown')
@@ -0,0 +1,38 @@
+import json
+import subprocess
+import sys
+
+from app.commands.startup_profile import ROOT
+
+# Upgrades a new database, whose first revision seeds products, to the latest revision and
+# prints the products and their documents. Alembic configures logging from alembic.ini, so
+# migrations run in their own interpreter.
+UPGRADE_SCRIPT = '''
+import json, sys
+from flask_migrate import upgrade
+from app import create_app, db
+from app.commands.lazy import setup_migrate
+from app.models.products import Product, ProductReadModel
+
+app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + sys.argv[1]}, profile='cli')
+setup_migrate(app)
+with app.app_context():
+    upgrade()
+    print(json.dumps({
+        'products': {product.id: product.name for product in Product.query},
+        'documents': {read_model.product_id: json.loads(read_model.document) for read_model in ProductReadModel.query}
+    }))
+'''
+
+
+class TestMigrations:
+	def test_upgrade_should_render_documents_of_existing_products(self, tmp_path):
+		process = subprocess.run(
+			[sys.executable, '-c', UPGRADE_SCRIPT, str(tmp_path / 'app.sqlite')],
+			cwd=ROOT, capture_output=True, text=True
+		)
+		assert process.returncode == 0, process.stderr
+		upgraded = json.loads(process.stdout.splitlines()[-1])
+		assert upgraded['products']
+		assert {id: document['name'] for id, document in upgraded['documents'].items()} == upgraded['products']
+		assert all(document['brand'] and document['categories'] for document in upgraded['documents'].values())
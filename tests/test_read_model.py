@@ -0,0 +1,54 @@
+from flask import json
+
+from app.models.products import ProductReadModel
+from app.read_model import product_documents
+
+from tests.factories import BrandFactory, CategoryFactory, ProductFactory
+
+
+def document(product_id):
+	read_model = ProductReadModel.query.get(product_id)
+	return None if read_model is None else json.loads(read_model.document)
+
+
+class TestReadModel:
+	def test_should_render_document_of_created_product(self, db):
+		product = ProductFactory(brand=BrandFactory())
+		db.session.commit()
+		assert document(product.id) == json.loads(json.dumps(product.serialized))
+
+	def test_should_refresh_documents_of_renamed_brand(self, db):
+		brand = BrandFactory(name='Old')
+		product = ProductFactory(brand=brand)
+		db.session.commit()
+
+		brand.name = 'New'
+		db.session.commit()
+		assert document(product.id)['brand']['name'] == 'New'
+
+	def test_should_refresh_documents_of_deleted_category(self, db):
+		removed, kept = CategoryFactory(), CategoryFactory()
+		product = ProductFactory(brand=BrandFactory(), categories=[removed, kept])
+		db.session.commit()
+
+		db.session.delete(removed)
+		db.session.commit()
+		assert [category['id'] for category in document(product.id)['categories']] == [kept.id]
+
+	def test_should_remove_document_of_deleted_product(self, db):
+		product = ProductFactory(brand=BrandFactory())
+		db.session.commit()
+		id = product.id
+
+		db.session.delete(product)
+		db.session.commit()
+		assert document(id) is None
+
+	def test_rebuild_should_render_every_document(self, db):
+		product = ProductFactory(brand=BrandFactory())
+		db.session.commit()
+		ProductReadModel.query.delete()
+		db.session.commit()
+
+		product_documents.rebuild()
+		assert document(product.id)['name'] == product.name
@@ -0,0 +1,56 @@
+import datetime
+
+from flask import jsonify
+
+from app import services
+from app.models.products import Product
+from app.serializers import product_serializer
+
+from tests.factories import ProductFactory, BrandFactory, CategoryFactory
+
+
+class TestProductSerializer:
+	def test_should_match_jsonify_of_serialized(self, db):
+		brand = BrandFactory(name='Mövenpick "Swiss"')
+		categories = [CategoryFactory(name='Food\n'), CategoryFactory(name='Ice cream')]
+		product = ProductFactory(
+			brand=brand, categories=categories, name='Crème brûlée', rating=8.5,
+			expiration_date=datetime.datetime(2021, 4, 23, 18, 25, 43), receipt_date=None
+		)
+		db.session.commit()
+		db.session.expire_all()
+		product = Product.query.get(product.id)
+		expected = jsonify(product.serialized).get_data(as_text=True)
+
+		rows, _ = services.product.get_products(product.id - 1, 1)
+		category_ids = services.product.get_category_ids([product.id])
+		assert product_serializer.render_many(rows, category_ids)[0] + '\n' == expected
+		assert product_serializer.render(product, [c.id for c in product.categories]) + '\n' == expected
+
+	def test_should_match_jsonify_of_serialized_without_sorted_keys(self, app, db, monkeypatch):
+		product = ProductFactory(brand=BrandFactory(), categories=[CategoryFactory()])
+		db.session.commit()
+		db.session.expire_all()
+		product = Product.query.get(product.id)
+
+		monkeypatch.setitem(app.config, 'JSON_SORT_KEYS', False)
+		product_serializer.init_app(app)
+		try:
+			expected = jsonify(product.serialized).get_data(as_text=True)
+			assert product_serializer.render(product, [c.id for c in product.categories]) + '\n' == expected
+		finally:
+			monkeypatch.undo()
+			product_serializer.init_app(app)
+
+	def test_list_response_should_match_jsonify(self, db):
+		product = ProductFactory(brand=BrandFactory(), categories=[CategoryFactory()])
+		db.session.commit()
+		db.session.expire_all()
+		product = Product.query.get(product.id)
+
+		rows, _ = services.product.get_products(product.id - 1, 1)
+		response = product_serializer.list_response(rows, services.product.get_category_ids([product.id]), next=None)
+		assert response.get_data(as_text=True) == jsonify({
+			'results': [product.serialized],
+			'next': None
+		}).get_data(as_text=True)
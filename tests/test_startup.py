@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+from app.commands.startup_profile import ROOT, startup_profile
+
+
+def imported_modules(profile):
+	script = 'import sys; from app import create_app; create_app(profile=%r); print(" ".join(sys.modules))' % profile
+	return set(subprocess.run(
+		[sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True
+	).stdout.split())
+
+
+def starts_worker(profile):
+	script = (
+		'from app.jobs import jobs; jobs.start = lambda app: print("started"); from app import create_app; '
+		'create_app(dict(JOBS_WORKER_IN_PROCESS=True), profile=%r)' % profile
+	)
+	return subprocess.run(
+		[sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, check=True
+	).stdout.split() == ['started']
+
+
+class TestStartup:
+	def test_cli_profile_should_not_import_web_modules(self):
+		modules = imported_modules('cli')
+		assert 'app.jobs' in modules
+		assert not {'flask_migrate', 'alembic', 'pydantic', 'app.endpoints', 'app.instrumentation'} & modules
+
+	def test_startup_profile_should_report_packages(self):
+		report = startup_profile('web')
+		packages = dict(report['packages'])
+		assert report['startup_ms'] > 0 and report['modules'] > 0
+		assert 'app' in packages and 'pydantic' in packages and 'alembic' not in packages
+		assert [milliseconds for _, milliseconds in report['packages']] == sorted(packages.values(), reverse=True)
+
+	def test_in_process_worker_should_only_start_in_web_profile(self):
+		assert starts_worker('web')
+		assert not starts_worker('cli')